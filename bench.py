@@ -0,0 +1,560 @@
+# waypack/bench.py
+"""
+End-to-end benchmark against a local stand-in for the Wayback Machine.
+
+    python -m waypack.bench --corpus small [--set days=365 --set page_kb=128] [--repeat 3]
+                            [--target DIR] [--save-baseline] [-- <extra waypack args, e.g. --workers 4>]
+
+A threaded HTTP server plays the CDX API (JSON rows, filter/collapse, limit + resumeKey paging)
+and id_ replay (synthetic HTML with embeds, OG tags and secrets; JPEGs with EXIF + GPS) for a
+synthetic corpus. cli.main runs in a child process with CDX_URL / WAYBACK_PREFIX pointed at it;
+each run reports pages/s, MB/s, peak RSS, wall time and output sizes. Standard library only: the
+JPEGs are assembled by hand, so Pillow is not needed.
+
+--target runs another waypack tree (say, a worktree of the baseline commit) against the same
+corpus. When its CLI has --metrics-json, pages/s, fetched MB/s and per-stage times come from
+that; otherwise pages are the HTML replays the server sent, timed by the wall clock of the whole
+child process, and there are no stage times. Runs timed differently are compared on wall-clock
+pages/s. Corpora with more than one domain need --domains-file in the target.
+
+Results are compared with the stored baseline for the corpus (<baseline-dir>/<name>.json, with
+any --set overrides and a hash of the waypack args in the name); the exit status is 1 when
+pages/s or peak RSS is worse than the baseline by more than --tolerance, and 2 when the stored
+baseline was recorded with a different corpus or arguments.
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, fields, replace
+from datetime import date, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass(frozen=True)
+class Corpus:
+    """Synthetic archive: `domains` sites, each with `captures_per_day` HTML captures a day for `days` days."""
+    name: str = "small"
+    domains: int = 1
+    days: int = 60
+    start: str = "2020-01-01"
+    captures_per_day: int = 2  # CDX rows per day; collapse=timestamp:8 folds adjacent ones
+    urls: int = 50  # distinct page URLs per domain
+    page_kb: int = 32  # filler text per page
+    minified: bool = False  # one long line, like minified bundles
+    non_ascii: bool = True  # UTF-8 filler words (bytes vs str scan paths)
+    secrets: int = 4  # secret-shaped tokens per page
+    embeds: int = 12  # iframes / links / inline URLs per page
+    images: int = 3  # OG / twitter / image_src candidates per page
+    image_kb: int = 48  # JPEG size (waypack keeps images >= 30 KB by default)
+    distinct: float = 0.7  # share of captures with their own content; the rest reuse 8 variants
+    seed: int = 1
+
+
+CORPUS_VERSION = 3  # bump when generated bodies change; baselines from other versions aren't compared
+
+CORPORA = {
+    "small": Corpus(),
+    "medium": Corpus(name="medium", domains=4, days=180, page_kb=64),
+    "large-pages": Corpus(name="large-pages", days=30, page_kb=2048, minified=True, images=1),
+    "image-heavy": Corpus(name="image-heavy", days=60, images=8, image_kb=256),
+}
+
+_WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+          "et dolore magna aliqua function return var const window document").split()
+_WORDS_UTF8 = ("naïve café Größe déjà façade smörgåsbord ünïcödé 東京 Привет").split()
+_ALNUM = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+
+def _token(rng: random.Random, n: int, alphabet: str = _ALNUM) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(n))
+
+
+def _secret(rng: random.Random) -> str:
+    # shapes the built-in rules look for (scanner._FALLBACK_RULES)
+    kind = rng.randrange(8)
+    if kind == 0:
+        return "sk_live_" + _token(rng, 24)
+    if kind == 1:
+        return "ghp_" + _token(rng, 36)
+    if kind == 2:
+        return "AKIA" + _token(rng, 16, "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567")
+    if kind == 3:
+        return "G-" + _token(rng, 10, "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+    if kind == 4:
+        return "GTM-" + _token(rng, 7, "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789")
+    if kind == 5:
+        return "eyJ" + _token(rng, 20) + "." + _token(rng, 30) + "." + _token(rng, 24)
+    if kind == 6:
+        return "AIza" + _token(rng, 35)
+    return "https://hooks.slack.com/services/T" + _token(rng, 10).upper() + "/B" + _token(rng, 10).upper() + "/" + _token(rng, 24)
+
+
+def _tiff_ifd(entries: List[Tuple[int, int, int, bytes]], at: int) -> bytes:
+    """Little-endian IFD starting at offset `at`; values over 4 bytes go right after it."""
+    data_at = at + 2 + 12 * len(entries) + 4
+    head, data = bytearray(struct.pack("<H", len(entries))), bytearray()
+    for tag, typ, count, payload in entries:
+        head += struct.pack("<HHI", tag, typ, count)
+        if len(payload) <= 4:
+            head += payload.ljust(4, b"\0")
+        else:
+            head += struct.pack("<I", data_at + len(data))
+            data += payload + (b"\0" if len(payload) % 2 else b"")
+    return bytes(head + struct.pack("<I", 0) + data)
+
+
+def _scan(rng: random.Random, blocks: int) -> bytes:
+    """Entropy-coded data for `blocks` flat 8x8 blocks: a random DC level each, then EOB."""
+    out, acc, nbits, prev = bytearray(), 0, 0, 0
+    for _ in range(blocks):
+        level = rng.randrange(-30, 31)
+        diff, prev = level - prev, level
+        cat = abs(diff).bit_length()  # DC table: category c -> 3-bit code c
+        extra = diff if diff >= 0 else diff + (1 << cat) - 1
+        acc, nbits = (((acc << 3) | cat) << cat | extra) << 1, nbits + 3 + cat + 1  # ... then AC EOB, code 0
+        while nbits >= 8:
+            nbits -= 8
+            byte = (acc >> nbits) & 0xFF
+            out += b"\xff\0" if byte == 0xFF else bytes((byte,))
+        acc &= (1 << nbits) - 1
+    if nbits:
+        byte = ((acc << (8 - nbits)) | ((1 << (8 - nbits)) - 1)) & 0xFF  # pad with 1 bits
+        out += b"\xff\0" if byte == 0xFF else bytes((byte,))
+    return bytes(out)
+
+
+def _jpeg(key: str, size: int) -> bytes:
+    """
+    Baseline greyscale 128x96 JPEG (a random grey level per 8x8 block) with an Exif APP1
+    (Make/Model/Software + GPS), padded to `size` with COM segments ahead of the image data.
+    Built by hand so the harness needs no imaging library; Pillow and libjpeg decode it.
+    """
+    rng = random.Random(key)
+    ascii_ = lambda s: (2, len(s) + 1, s.encode() + b"\0")
+    rational = lambda *v: (5, len(v), b"".join(struct.pack("<II", n, d) for n, d in v))
+    ifd0 = [(0x010F, *ascii_(rng.choice(["Canon", "NIKON CORPORATION", "Apple", "SONY"]))),
+            (0x0110, *ascii_(f"Model {rng.randrange(100)}")),
+            (0x0131, *ascii_(rng.choice(["GIMP 2.10", "Adobe Photoshop", _secret(rng)]))),
+            (0x8825, 4, 1, b"\0\0\0\0")]
+    gps = [(1, *ascii_(rng.choice("NS"))), (2, *rational((rng.randrange(90), 1), (rng.randrange(60), 1), (rng.randrange(6000), 100))),
+           (3, *ascii_(rng.choice("EW"))), (4, *rational((rng.randrange(180), 1), (rng.randrange(60), 1), (rng.randrange(6000), 100)))]
+    gps_at = 8 + len(_tiff_ifd(ifd0, 8))
+    ifd0[-1] = (0x8825, 4, 1, struct.pack("<I", gps_at))
+    tiff = b"II*\0" + struct.pack("<I", 8) + _tiff_ifd(ifd0, 8) + _tiff_ifd(gps, gps_at)
+    seg = lambda marker, payload: struct.pack(">BBH", 0xFF, marker, len(payload) + 2) + payload
+    w, h = 128, 96
+    head = b"\xff\xd8" + seg(0xE1, b"Exif\0\0" + tiff)
+    image = (seg(0xDB, b"\0" + bytes([16] * 64))  # DQT
+             + seg(0xC0, struct.pack(">BHHB", 8, h, w, 1) + b"\x01\x11\x00")  # SOF0, one component
+             + seg(0xC4, b"\x00" + bytes([0, 0, 7] + [0] * 13) + bytes(range(7)))  # DC: categories 0-6, 3 bits
+             + seg(0xC4, b"\x10" + bytes([1] + [0] * 15) + b"\x00")  # AC: EOB only, 1 bit
+             + seg(0xDA, b"\x01\x01\x00\x00\x3f\x00")  # SOS
+             + _scan(rng, (w // 8) * (h // 8)) + b"\xff\xd9")
+    pad = bytearray()
+    missing = size - len(head) - len(image)
+    while missing > 4:
+        n = min(missing - 4, 65533)
+        pad += b"\xff\xfe" + struct.pack(">H", n + 2) + rng.randbytes(n)
+        missing -= n + 4
+    return head + bytes(pad) + image
+
+
+class Archive:
+    """The synthetic corpus as CDX rows and replayable bodies; everything is derived from (seed, name)."""
+    def __init__(self, corpus: Corpus):
+        self.corpus = corpus
+        self.domains = [f"bench{i}.com" for i in range(corpus.domains)]
+        first = date.fromisoformat(corpus.start)
+        self.date_from = first.isoformat()
+        self.date_to = (first + timedelta(days=max(1, corpus.days) - 1)).isoformat()
+        self._rows: Dict[str, List[List[str]]] = {d: self._listing(d, first) for d in self.domains}
+        self._content: Dict[str, str] = {}  # "<timestamp> <original>" -> content id
+        self.served = {"pages": 0, "bytes": 0}  # replays sent: HTML responses, body bytes of all of them
+        self._lock = threading.Lock()
+
+    def _listing(self, dom: str, first: date) -> List[List[str]]:
+        c = self.corpus
+        rng = random.Random(f"{c.seed}:{dom}:cdx")
+        host_key = ",".join(reversed(dom.split(".")))
+        rows = []
+        for d in range(max(1, c.days)):
+            day = (first + timedelta(days=d)).strftime("%Y%m%d")
+            for j in range(max(1, c.captures_per_day)):
+                path = f"/p{rng.randrange(max(1, c.urls))}"
+                ts = f"{day}{8 + j % 12:02d}{rng.randrange(60):02d}00"
+                rows.append([f"{host_key}){path}", ts, f"http://{dom}{path}"])
+        rows.sort()
+        return rows
+
+    def content_id(self, dom: str, ts: str) -> str:
+        rng = random.Random(f"{self.corpus.seed}:{dom}:{ts}")
+        return f"{dom}-{ts}" if rng.random() < self.corpus.distinct else f"{dom}-v{rng.randrange(8)}"
+
+    def cdx(self, q: Dict[str, List[str]]) -> bytes:
+        target = q.get("url", [""])[0].lower()
+        dom = next((d for d in self.domains if target == d or target.endswith("." + d)), None)
+        fr, to = q.get("from", [""])[0], q.get("to", [""])[0]
+        fl = (q.get("fl", ["timestamp,original,statuscode,mimetype,digest,length"])[0]).split(",")
+        filters = [f.split(":", 1) for f in q.get("filter", []) if ":" in f]
+        collapse = q.get("collapse", [""])[0]
+        out: List[Dict[str, str]] = []
+        prev = None
+        for urlkey, ts, original in self._rows.get(dom, []) if dom else []:
+            if (fr and ts[:len(fr)] < fr) or (to and ts[:len(to)] > to):
+                continue
+            body = self.page(self.content_id(dom, ts))
+            row = {"urlkey": urlkey, "timestamp": ts, "original": original, "statuscode": "200",
+                   "mimetype": "text/html", "digest": hashlib.sha1(body).hexdigest().upper()[:32],
+                   "length": str(len(body))}
+            if any(row.get(field) != value for field, value in filters):
+                continue
+            if collapse.startswith("timestamp:"):
+                n = int(collapse.split(":")[1])
+                if prev is not None and prev[:n] == ts[:n]:
+                    continue
+                prev = ts
+            out.append(row)
+        start = int(q.get("resumeKey", ["0"])[0] or 0)
+        limit = int(q.get("limit", ["0"])[0] or 0) or len(out)
+        page: List[Any] = [fl] + [[r.get(f, "") for f in fl] for r in out[start:start + limit]]
+        if start + limit < len(out):
+            page.append(f"resumeKey:{start + limit}")  # the form cdx_client looks for
+        return json.dumps(page).encode()
+
+    @lru_cache(maxsize=4096)
+    def page(self, cid: str) -> bytes:
+        c = self.corpus
+        rng = random.Random(f"{c.seed}:{cid}")
+        dom = cid.split("-", 1)[0]
+        nl = "" if c.minified else "\n"
+        head = [f"<html><head><title>{cid}</title>"]
+        for k in range(c.images):
+            img = f"http://{dom}/img/{cid}-{k}.jpg"
+            if k % 3 == 0:
+                head.append(f'<meta property="og:image" content="{img}">')
+            elif k % 3 == 1:
+                head.append(f'<meta name="twitter:image" content="{img}">')
+            else:
+                head.append(f'<link rel="image_src" href="{img}">')
+        head.append("</head><body>")
+        specials = []
+        for k in range(c.embeds):
+            kind = k % 4
+            if kind == 0:
+                specials.append(f"<iframe src='https://player.vimeo.com/video/{rng.randrange(1000)}'></iframe>")
+            elif kind == 1:
+                specials.append(f"<a href='https://cdn.partner{rng.randrange(20)}.net/x/{rng.randrange(100)}.js'>x</a>")
+            elif kind == 2:
+                specials.append(f"<script>load('https://widgets.vendor{rng.randrange(10)}.io/embed.js')</script>")
+            else:
+                specials.append(f"<a href='/local/{rng.randrange(100)}'>in</a>")
+        specials += [f"<p>key {_secret(rng)} </p>" for _ in range(c.secrets)]
+        words = _WORDS + (_WORDS_UTF8 if c.non_ascii else [])
+        body, size, target = [], 0, c.page_kb * 1024
+        while size < target:
+            para = "<p>" + " ".join(rng.choice(words) for _ in range(40)) + "</p>"
+            body.append(para)
+            size += len(para)
+        for s in specials:
+            body.insert(rng.randrange(len(body) + 1), s)
+        return (nl.join(head) + nl + nl.join(body) + nl + "</body></html>").encode("utf-8")
+
+    @lru_cache(maxsize=1024)
+    def image(self, name: str) -> bytes:
+        return _jpeg(f"{self.corpus.seed}:{name}", self.corpus.image_kb * 1024)
+
+    def replay(self, ts: str, original: str) -> Optional[Tuple[bytes, str]]:
+        u = urlparse(original)
+        dom = u.hostname or ""
+        if dom not in self.domains:
+            return None
+        if u.path.startswith("/img/"):
+            return self.image(u.path[5:]), "image/jpeg"
+        return self.page(self.content_id(dom, ts)), "text/html; charset=utf-8"
+
+    def tally(self, ctype: str, nbytes: int):
+        with self._lock:
+            self.served["pages"] += ctype.startswith("text/html")
+            self.served["bytes"] += nbytes
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real archive
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+    archive: Archive
+
+    def log_message(self, *a):
+        pass
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        if u.path == "/cdx":
+            body, ctype = self.archive.cdx(parse_qs(u.query)), "application/json"
+        elif u.path.startswith("/web/"):
+            ts, _, original = u.path[5:].partition("/")
+            hit = self.archive.replay(ts.replace("id_", ""), original)
+            if hit is None:
+                return self._send(404, b"", "text/plain")
+            body, ctype = hit
+        else:
+            return self._send(404, b"", "text/plain")
+        rng = self.headers.get("Range", "")
+        if rng.startswith("bytes=") and body:
+            a, _, z = rng[6:].partition("-")
+            a, z = int(a or 0), min(int(z or len(body) - 1), len(body) - 1)
+            self.archive.tally(ctype, z + 1 - a)
+            return self._send(206, body[a:z + 1], ctype, {"Content-Range": f"bytes {a}-{z}/{len(body)}"})
+        if u.path.startswith("/web/"):
+            self.archive.tally(ctype, len(body))
+        self._send(200, body, ctype)
+
+    def _send(self, status: int, body: bytes, ctype: str, headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(archive: Archive, port: int = 0) -> ThreadingHTTPServer:
+    """Start the stand-in on 127.0.0.1 (daemon thread); its base URL is http://127.0.0.1:<server_port>."""
+    handler = type("Handler", (_Handler,), {"archive": archive})
+    srv = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="waypack-bench", daemon=True).start()
+    return srv
+
+
+# runs in the benchmarked process: point the client modules at the stand-in, then the normal CLI.
+# Only names every waypack version has, so a checkout of an older commit can be measured too.
+_CHILD = """
+import importlib, sys
+base, pkg = sys.argv[1:3]
+cdx_client, fetcher, cli = (importlib.import_module(pkg + "." + m) for m in ("cdx_client", "fetcher", "cli"))
+cdx_client.CDX_URL = base + "/cdx"
+fetcher.WAYBACK_PREFIX = base + "/web"
+sys.exit(cli.main(sys.argv[3:]))
+"""
+
+
+def _child_cmd(target: str, base: str, argv: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """Command line and environment that run `target` (a waypack package directory) with `argv`."""
+    target = os.path.abspath(target)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(target), os.environ.get("PYTHONPATH")])))
+    return [sys.executable, "-c", _CHILD, base, os.path.basename(target), *argv], env
+
+
+def cli_flags(target: str) -> set:
+    """Options the target's CLI accepts, read from its --help."""
+    cmd, env = _child_cmd(target, "", ["--help"])
+    out = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(f"can't run {target}: {out.stderr.strip()[-500:]}")
+    return set(re.findall(r"--[a-z][a-z0-9-]*", out.stdout))
+
+
+def run_once(archive: Archive, base: str, workdir: str, extra: List[str], target: str,
+             flags: set) -> Dict[str, Any]:
+    """
+    One waypack run in a fresh child process. Peak RSS comes from wait4, wall time and output sizes
+    from here; pages/s, MB/s and stage times from --metrics-json when the target has it, otherwise
+    from the wall time and what the server replayed (stages are then empty).
+    """
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    if len(archive.domains) > 1:
+        with open(os.path.join(workdir, "domains.txt"), "w", encoding="utf-8") as fh:
+            fh.write("\n".join(archive.domains) + "\n")
+        scope = ["--domains-file", "domains.txt"]
+    else:
+        scope = ["--domain", archive.domains[0]]
+    metrics = "--metrics-json" in flags
+    argv = scope + ["--from", archive.date_from, "--to", archive.date_to, "--rps", "100000", "--no-progress"] + \
+        (["--metrics-json", "metrics.json"] if metrics else []) + extra
+    cmd, env = _child_cmd(target, base, argv)
+    before = dict(archive.served)
+    t0 = time.perf_counter()
+    with open(os.path.join(workdir, "child.out"), "wb") as out:
+        p = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=out, stderr=subprocess.STDOUT)
+        _pid, status, usage = os.wait4(p.pid, 0)
+    wall = time.perf_counter() - t0
+    p.returncode = os.waitstatus_to_exitcode(status)
+    if p.returncode != 0:
+        with open(os.path.join(workdir, "child.out"), "rb") as fh:
+            tail = fh.read()[-2000:].decode("utf-8", "replace")
+        raise RuntimeError(f"waypack exited with {p.returncode}:\n{tail}")
+    pages = archive.served["pages"] - before["pages"]
+    served_mb = (archive.served["bytes"] - before["bytes"]) / 1e6
+    result = {
+        "timing": "metrics" if metrics else "wall",
+        "pages": pages, "elapsed_s": round(wall, 3), "pages_per_s": round(pages / wall, 3),
+        "mb_per_s": round(served_mb / wall, 3),
+        "wall_s": round(wall, 3), "wall_pages_per_s": round(pages / wall, 3),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # Linux reports KiB
+        "stages": {},
+        "outputs": {fn: os.path.getsize(os.path.join(workdir, fn)) for fn in sorted(os.listdir(workdir))
+                    if fn not in ("child.out", "metrics.json", "domains.txt") and not fn.endswith(".log")
+                    and os.path.isfile(os.path.join(workdir, fn))},
+    }
+    if metrics:
+        with open(os.path.join(workdir, "metrics.json"), encoding="utf-8") as fh:
+            m = json.load(fh)
+        result.update(pages=m["pages"], elapsed_s=m["elapsed_s"], pages_per_s=m["pages_per_s"], mb_per_s=m["mb_per_s"],
+                      stages={k: {"count": v["count"], "sum_s": v["sum_s"], "p50_s": v["p50_s"], "p99_s": v["p99_s"]}
+                              for k, v in m["stages"].items()})
+    return result
+
+
+def _speed(result: Dict[str, Any], baseline: Dict[str, Any]) -> str:
+    """pages/s field to compare on: the metrics figure when both runs have it, else wall-clock pages/s."""
+    return "pages_per_s" if result.get("timing") == baseline.get("timing") else "wall_pages_per_s"
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions beyond `tolerance` (fraction) in pages/s and peak RSS."""
+    bad = []
+    k = _speed(result, baseline)
+    if result[k] < baseline[k] * (1 - tolerance):
+        bad.append(f"pages/s {result[k]:.1f} vs baseline {baseline[k]:.1f}")
+    if result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        bad.append(f"peak RSS {result['peak_rss_mb']:.1f} MB vs baseline {baseline['peak_rss_mb']:.1f} MB")
+    return bad
+
+
+def _pct(new: float, old: float) -> str:
+    return f"{(new - old) / old * 100:+.0f}%" if old else ""
+
+
+def report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> str:
+    b = baseline or {}
+    bst = b.get("stages", {})
+    k = _speed(result, b) if b else "pages_per_s"
+    lines = [
+        f"corpus {result['corpus']['name']}: {result['pages']} pages, {result[k]:.1f} pages/s "
+        f"{_pct(result[k], b.get(k, 0))}{' (wall clock)' if k == 'wall_pages_per_s' or result['timing'] == 'wall' else ''}, "
+        f"{result['mb_per_s']:.2f} MB/s, "
+        f"peak RSS {result['peak_rss_mb']:.1f} MB {_pct(result['peak_rss_mb'], b.get('peak_rss_mb', 0))}",
+        "outputs: " + ", ".join(f"{fn} {n / 1024:.1f} KB {_pct(n, b.get('outputs', {}).get(fn, 0))}".rstrip()
+                                for fn, n in result["outputs"].items()),
+    ]
+    if result["stages"]:
+        lines.append(f"{'stage':<12}{'count':>8}{'total s':>10}{'p50 ms':>9}{'p99 ms':>9}  vs baseline")
+    else:
+        lines.append("no stage times: the target has no --metrics-json")
+    for name, st in sorted(result["stages"].items(), key=lambda kv: -kv[1]["sum_s"]):
+        old = bst.get(name, {}).get("sum_s", 0)
+        lines.append(f"{name:<12}{st['count']:>8}{st['sum_s']:>10.3f}{st['p50_s'] * 1000:>9.2f}"
+                     f"{st['p99_s'] * 1000:>9.2f}  {_pct(st['sum_s'], old)}")
+    return "\n".join(lines)
+
+
+def _override(corpus: Corpus, items: List[str]) -> Corpus:
+    kinds = {f.name: type(getattr(corpus, f.name)) for f in fields(corpus)}
+    changes: Dict[str, Any] = {}
+    for item in items:
+        k, _, v = item.partition("=")
+        if k not in kinds:
+            raise SystemExit(f"--set: unknown corpus field {k!r} (one of {', '.join(kinds)})")
+        changes[k] = v.lower() in ("1", "true", "yes") if kinds[k] is bool else kinds[k](v)
+    return replace(corpus, **changes)
+
+
+def _baseline_name(preset: Corpus, corpus: Corpus, extra: List[str]) -> str:
+    """<name>, plus the fields --set changed and a hash of the waypack args: baselines never mix setups."""
+    changed = [f"{f.name}={getattr(corpus, f.name)}" for f in fields(corpus)
+               if f.name != "name" and getattr(corpus, f.name) != getattr(preset, f.name)]
+    name = corpus.name + ("@" + ",".join(changed) if changed else "")
+    if extra:
+        name += "~" + hashlib.sha1("\0".join(extra).encode()).hexdigest()[:8]
+    return name
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    extra: List[str] = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    p = argparse.ArgumentParser("waypack.bench")
+    p.add_argument("--corpus", default="small", choices=sorted(CORPORA))
+    p.add_argument("--set", action="append", default=[], metavar="FIELD=VALUE", help="Override a corpus field")
+    p.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the median by pages/s is reported")
+    p.add_argument("--baseline-dir", default="bench_baselines")
+    p.add_argument("--save-baseline", action="store_true", help="Store this result as the corpus baseline")
+    p.add_argument("--tolerance", type=float, default=0.10, help="Allowed fractional slowdown / RSS growth")
+    p.add_argument("--workdir", default="", help="Where runs write their outputs (default: a temp dir)")
+    p.add_argument("--json", default="", help="Also write the result here")
+    p.add_argument("--target", default=os.path.dirname(os.path.abspath(__file__)),
+                   help="waypack package directory to run, e.g. a worktree of an older commit (default: this one)")
+    args = p.parse_args(argv)
+
+    corpus = _override(CORPORA[args.corpus], args.set)
+    flags = cli_flags(args.target)
+    if corpus.domains > 1 and "--domains-file" not in flags:
+        raise SystemExit(f"{args.target} has no --domains-file; use a one-domain corpus (--set domains=1)")
+    archive = Archive(corpus)
+    srv = serve(archive)
+    base = f"http://127.0.0.1:{srv.server_port}"
+    workdir = args.workdir or tempfile.mkdtemp(prefix="waypack-bench-")
+    try:
+        runs = [run_once(archive, base, os.path.join(workdir, f"run{i}"), extra, args.target, flags)
+                for i in range(max(1, args.repeat))]
+    finally:
+        srv.shutdown()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    runs.sort(key=lambda r: r["pages_per_s"])
+    result = dict(runs[len(runs) // 2])
+    result["peak_rss_mb"] = max(r["peak_rss_mb"] for r in runs)
+    result.update(corpus=asdict(corpus), corpus_version=CORPUS_VERSION, waypack_args=extra, runs=len(runs),
+                  target=os.path.abspath(args.target),
+                  pages_per_s_all=[r["pages_per_s"] for r in runs],
+                  host={"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()})
+
+    path = os.path.join(args.baseline_dir, _baseline_name(CORPORA[args.corpus], corpus, extra) + ".json")
+    baseline = None
+    mismatch = False
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+        if (baseline.get("corpus") != result["corpus"] or baseline.get("corpus_version") != CORPUS_VERSION
+                or baseline.get("waypack_args") != extra):
+            print(f"not comparing: {path} was recorded with a different corpus or arguments", file=sys.stderr)
+            baseline, mismatch = None, True
+    print(report(result, baseline))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+    if args.save_baseline:
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+        print(f"baseline saved: {path}")
+        return 0
+    if mismatch:
+        return 2
+    regressions = compare(result, baseline, args.tolerance) if baseline else []
+    for r in regressions:
+        print("REGRESSION: " + r, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,45 @@
 # waypack/cdx_client.py
 from __future__ import annotations
+import heapq
+import itertools
+import json
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable, Dict, Any
 
+from .cdx_index import CDXIndex, day_bounds, split_days
+from .httpcache import ResponseCache
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .workers import ordered_map
+
 CDX_URL = "https://web.archive.org/cdx/search/cdx"
 
 class CDXClient:
-    def __init__(self, rps: float = 2.0, session: requests.Session | None = None, user_agent: str | None = None):
-        self.rps = max(0.1, rps)
-        self._min_interval = 1.0 / self.rps
-        self._last = 0.0
+    def __init__(self, rps: float = 2.0, session: requests.Session | None = None, user_agent: str | None = None,
+                 limiter: RateLimiter | None = None, cache: ResponseCache | None = None, cache_ttl: float = 86400.0,
+                 index: CDXIndex | None = None, shard: str = "", shard_parallel: int = 4,
+                 metrics: Metrics | None = None):
+        self.limiter = limiter or RateLimiter(rps)
+        self.rps = self.limiter.rps
+        # CDX listings can still grow (late ingests), so cached pages expire after cache_ttl seconds
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        # local row store: repeat/overlapping queries only hit the API for uncovered days
+        self.index = index
+        # shard="month"/"year": list date sub-ranges concurrently (same limiter) and merge by timestamp
+        self.shard = shard
+        self.shard_parallel = max(1, shard_parallel)
+        self.metrics = metrics
         self.sess = session or requests.Session()
         if user_agent:
             self.sess.headers.update({"User-Agent": user_agent})
 
     def _throttle(self):
-        now = time.time()
-        delta = now - self._last
-        if delta < self._min_interval:
-            time.sleep(self._min_interval - delta)
-        self._last = time.time()
+        slept = self.limiter.wait()
+        if self.metrics is not None:
+            self.metrics.observe("throttle", slept)
 
     def query_daily_sample(
         self,
@@ -32,39 +51,138 @@ class CDXClient:
         limit: int | None = None,
         retries: int = 3,
         timeout: int = 15,
+        page_size: int | None = None,
+        resume_key: str | None = None,
+        skip: int = 0,
     ) -> Iterable[Dict[str, Any]]:
         """
         Yield 1 record per day (earliest in day) for domain (includes subdomains).
-        Fields: timestamp, original, statuscode, mimetype, digest, length
+        Fields: timestamp, original, statuscode, mimetype, digest, length,
+        plus page_key/page_index (resumeKey the row's page was requested with, position in that page).
+        To continue a listing pass resume_key=<page_key> and skip=<page_index + 1>.
+        With a local index, covered days come from it and uncovered ones from the API as they are
+        listed, and page_key is the row's own position ("index:..."). With sharding, rows come back
+        in (timestamp, original) order, from the index too; without an index page_key then names the
+        shard ("shard:<from>-<to>").
+        """
+        if self.index is not None and (not resume_key or resume_key.startswith("index:")):
+            yield from self._query_indexed(domain, dt_from, dt_to, statuscode, mimetype, limit, retries, timeout,
+                                           page_size, resume_key, skip)
+            return
+        if self.shard and (not resume_key or resume_key.startswith("shard:")):
+            yield from self._query_sharded(domain, dt_from, dt_to, statuscode, mimetype, limit, retries, timeout,
+                                           page_size, resume_key, skip)
+            return
+        yield from self._query_api(domain, dt_from, dt_to, statuscode, mimetype, limit, retries, timeout,
+                                   page_size, resume_key, skip)
+
+    def _query_indexed(self, domain, dt_from, dt_to, statuscode, mimetype, limit, retries, timeout, page_size,
+                       resume_key, skip):
+        """
+        Serve covered days from the index and list the gaps from the API, merged into one stream in
+        CDX server order (urlkey, timestamp, original), or (timestamp, original) when sharding.
+        Gap rows are yielded as their pages arrive and stored on the way; a gap is marked covered
+        only once it has been listed to the end. Each row's page_key is its own sort position
+        ("index:<json>", page_index 0), so resuming skips by position, not by row count.
+        """
+        qkey = CDXIndex.query_key(domain, statuscode, mimetype, "timestamp:8")
+        lo, hi = day_bounds(dt_from, dt_to)
+        by_time = bool(self.shard)
+        sort_key = ((lambda r: (r["timestamp"], r["original"])) if by_time else
+                    (lambda r: (r.get("urlkey") or "", r["timestamp"], r["original"])))
+        after = None
+        if resume_key:
+            urlkey, ts, original = json.loads(resume_key[len("index:"):])
+            after = sort_key({"urlkey": urlkey, "timestamp": ts, "original": original})
+
+        def gap(a, b):
+            if self.shard:
+                listing = self._query_sharded(domain, a, b, statuscode, mimetype, None, retries, timeout,
+                                              page_size, None, 0, with_urlkey=True)
+            else:
+                listing = self._query_api(domain, a, b, statuscode, mimetype, None, retries, timeout,
+                                          page_size, None, 0, with_urlkey=True)
+            yield from self.index.store_rows(qkey, listing)
+            self.index.mark_covered(qkey, a, b)
+
+        spans = [(a, b, self.index.rows(qkey, a, b, by_time=by_time)) for a, b in self.index.covered(qkey, lo, hi)]
+        spans += [(a, b, gap(a, b)) for a, b in self.index.gaps(qkey, lo, hi)]
+        spans.sort(key=lambda span: span[0])
+        if by_time:
+            # spans are disjoint day ranges, so date order is timestamp order; gaps are listed one at a time
+            merged = itertools.chain.from_iterable(recs for _, _, recs in spans)
+        else:
+            merged = heapq.merge(*(recs for _, _, recs in spans), key=sort_key)
+        rows = 0
+        for rec in merged:
+            k = sort_key(rec)
+            if after is not None and (k < after or (k == after and skip)):
+                continue
+            rec["page_key"] = "index:" + json.dumps([rec.pop("urlkey", None) or "", rec["timestamp"], rec["original"]])
+            rec["page_index"] = 0
+            yield rec
+            rows += 1
+            if limit and rows >= limit:
+                return
+
+    def _query_sharded(self, domain, dt_from, dt_to, statuscode, mimetype, limit, retries, timeout, page_size,
+                       resume_key, skip, with_urlkey: bool = False) -> Iterable[Dict[str, Any]]:
         """
+        List month/year shards on a small pool and yield them in date order, each sorted by
+        (timestamp, original). Shards end on day boundaries, so timestamp:8 collapse groups never
+        straddle two shards; `limit` counts across shards.
+        """
+        lo, hi = day_bounds(dt_from, dt_to)
+        shards = split_days(lo, hi, self.shard)
+        if resume_key:
+            start = resume_key[len("shard:"):].split("-")[0]
+            shards = [(a, b) for a, b in shards if b >= start]
+
+        def list_shard(span):
+            a, b = span
+            recs = list(self._query_api(domain, a, b, statuscode, mimetype, None, retries, timeout,
+                                        page_size, None, 0, with_urlkey=with_urlkey))
+            recs.sort(key=lambda r: (r["timestamp"], r["original"]))
+            for i, r in enumerate(recs):
+                r["page_key"] = f"shard:{a}-{b}"
+                r["page_index"] = i
+            return recs
+
+        rows = 0
+        pool = ThreadPoolExecutor(max_workers=self.shard_parallel, thread_name_prefix="waypack-cdx")
+        try:
+            for n, recs in enumerate(ordered_map(pool, list_shard, shards, max_inflight=self.shard_parallel)):
+                for r in recs[skip if n == 0 else 0:]:
+                    yield r
+                    rows += 1
+                    if limit and rows >= limit:
+                        return
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _query_api(self, domain, dt_from, dt_to, statuscode, mimetype, limit, retries, timeout, page_size,
+                   resume_key, skip, with_urlkey: bool = False) -> Iterable[Dict[str, Any]]:
         params = {
             "url": domain,
             "matchType": "domain",
             "from": dt_from.replace("-", ""),
             "to": dt_to.replace("-", ""),
             "output": "json",
-            "fl": "timestamp,original,statuscode,mimetype,digest,length",
+            "fl": "timestamp,original,statuscode,mimetype,digest,length" + (",urlkey" if with_urlkey else ""),
             "filter": [f"statuscode:{statuscode}", f"mimetype:{mimetype}"],
             "collapse": "timestamp:8",  # YYYYMMDD
             "showResumeKey": "true",
         }
-        resume = None
+        if page_size:
+            params["limit"] = page_size  # server-side page size; resumeKey continues after it
+        resume = resume_key or None
         rows = 0
         while True:
             if resume:
                 params["resumeKey"] = resume
-            # Throttle + request with basic retry
-            for attempt in range(retries):
-                try:
-                    self._throttle()
-                    resp = self.sess.get(CDX_URL, params=params, timeout=timeout)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    break
-                except Exception:
-                    if attempt + 1 == retries:
-                        raise
-                    time.sleep(1.5 * (attempt + 1))
+            page_key = resume or ""
+            page_index = 0
+            data = self._get_page(params, retries, timeout)
             if not data:
                 return
             # First row is header
@@ -78,7 +196,14 @@ class CDXClient:
                         "mimetype": rec[3],
                         "digest": rec[4],
                         "length": rec[5],
+                        "page_key": page_key,
+                        "page_index": page_index,
                     }
+                    if with_urlkey and len(rec) >= 7:
+                        out["urlkey"] = rec[6]
+                    page_index += 1
+                    if page_index <= skip:
+                        continue
                     yield out
                     rows += 1
                     if limit and rows >= limit:
@@ -88,6 +213,34 @@ class CDXClient:
                 else:
                     # ignore unexpected rows
                     pass
+            skip = 0  # only applies to the page we resumed on
             # If we didn’t get a resume key, we’re done
             if not any(isinstance(r, str) and r.startswith("resumeKey:") for r in data[1:]):
                 return
+
+    def _get_page(self, params: Dict[str, Any], retries: int, timeout: int):
+        """One CDX JSON page; served from the response cache (no throttle) when fresh."""
+        key = None
+        if self.cache is not None:
+            key = requests.Request("GET", CDX_URL, params=params).prepare().url
+            hit = self.cache.get(key, max_age=self.cache_ttl)
+            if hit is not None and hit.body is not None:
+                return json.loads(hit.body)
+        # Throttle + request with basic retry
+        for attempt in range(retries):
+            try:
+                self._throttle()
+                t0 = time.perf_counter()
+                resp = self.sess.get(CDX_URL, params=params, timeout=timeout)
+                resp.raise_for_status()
+                data = resp.json()
+                if self.metrics is not None:
+                    self.metrics.observe("cdx_page", time.perf_counter() - t0, len(resp.content))
+                break
+            except Exception:
+                if attempt + 1 == retries:
+                    raise
+                time.sleep(1.5 * (attempt + 1))
+        if key is not None:
+            self.cache.put(key, resp.status_code, resp.headers.get("Content-Type"), resp.content)
+        return data
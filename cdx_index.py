@@ -0,0 +1,161 @@
+# waypack/cdx_index.py
+from __future__ import annotations
+import calendar
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Dict, Any, List, Tuple
+
+_FIELDS = ("urlkey", "timestamp", "original", "statuscode", "mimetype", "digest", "length")
+
+
+def day_bounds(dt_from: str, dt_to: str) -> Tuple[str, str]:
+    """--from/--to ('2020', '2020-03', '2020-03-05', 14-digit ...) -> inclusive YYYYMMDD days."""
+    lo = dt_from.replace("-", "")[:8]
+    hi = dt_to.replace("-", "")[:8]
+    if len(lo) == 4:
+        lo += "0101"
+    elif len(lo) == 6:
+        lo += "01"
+    if len(hi) == 4:
+        hi += "1231"
+    elif len(hi) == 6:
+        hi += f"{calendar.monthrange(int(hi[:4]), int(hi[4:6]))[1]:02d}"
+    return lo, hi
+
+
+def _shift(day: str, n: int) -> str:
+    return (datetime.strptime(day, "%Y%m%d") + timedelta(days=n)).strftime("%Y%m%d")
+
+
+def split_days(lo: str, hi: str, unit: str = "month") -> List[Tuple[str, str]]:
+    """Cut inclusive [lo, hi] (YYYYMMDD) into calendar month or year shards."""
+    out = []
+    cur = lo
+    while cur <= hi:
+        y, m = int(cur[:4]), int(cur[4:6])
+        end = f"{y}1231" if unit == "year" else f"{y}{m:02d}{calendar.monthrange(y, m)[1]:02d}"
+        end = min(end, hi)
+        out.append((cur, end))
+        cur = _shift(end, 1)
+    return out
+
+
+class CDXIndex:
+    """
+    Local SQLite store of CDX rows per query (domain, status, mime, collapse), plus the day
+    ranges already fetched for it. Days from today (UTC) on are never marked covered, since
+    captures for them can still appear.
+    """
+    def __init__(self, path: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            " qkey TEXT, day TEXT, urlkey TEXT, timestamp TEXT, original TEXT, statuscode TEXT,"
+            " mimetype TEXT, digest TEXT, length TEXT, PRIMARY KEY (qkey, timestamp, original));"
+            "CREATE INDEX IF NOT EXISTS rows_order ON rows(qkey, urlkey, timestamp);"
+            "CREATE TABLE IF NOT EXISTS coverage (qkey TEXT, day_from TEXT, day_to TEXT);"
+            "CREATE INDEX IF NOT EXISTS coverage_q ON coverage(qkey, day_from);"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def query_key(domain: str, statuscode: str, mimetype: str, collapse: str) -> str:
+        return f"{domain.lower()}|{statuscode}|{mimetype}|{collapse}"
+
+    def _covered(self, qkey: str) -> List[Tuple[str, str]]:
+        cur = self._db.execute(
+            "SELECT day_from, day_to FROM coverage WHERE qkey = ? ORDER BY day_from", (qkey,))
+        return [(a, b) for a, b in cur]
+
+    def covered(self, qkey: str, lo: str, hi: str) -> List[Tuple[str, str]]:
+        """Inclusive day ranges inside [lo, hi] that have been fetched (the complement of gaps())."""
+        with self._lock:
+            covered = self._covered(qkey)
+        return [(max(a, lo), min(b, hi)) for a, b in covered if b >= lo and a <= hi]
+
+    def gaps(self, qkey: str, lo: str, hi: str) -> List[Tuple[str, str]]:
+        """Inclusive day ranges inside [lo, hi] that have not been fetched yet."""
+        with self._lock:
+            covered = self._covered(qkey)
+        out = []
+        cur = lo
+        for a, b in covered:
+            if b < cur:
+                continue
+            if a > hi:
+                break
+            if a > cur:
+                out.append((cur, min(_shift(a, -1), hi)))
+            cur = max(cur, _shift(b, 1))
+            if cur > hi:
+                break
+        if cur <= hi:
+            out.append((cur, hi))
+        return out
+
+    def store_rows(self, qkey: str, rows: Iterable[Dict[str, Any]], batch: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Pass `rows` through, inserting them in batches as they go (the last batch once `rows` ends)."""
+        buf = []
+
+        def flush():
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO rows(qkey, day, urlkey, timestamp, original, statuscode, mimetype, digest, length)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", buf)
+                self._db.commit()
+            buf.clear()
+
+        for r in rows:
+            ts = r.get("timestamp") or ""
+            buf.append((qkey, ts[:8], *(r.get(f) or "" for f in _FIELDS)))
+            if len(buf) >= batch:
+                flush()
+            yield r
+        if buf:
+            flush()
+
+    def mark_covered(self, qkey: str, lo: str, hi: str):
+        """Record [lo, hi] as fetched (clipped to before today) and merge overlapping ranges."""
+        today = datetime.now(timezone.utc).strftime("%Y%m%d")
+        hi = min(hi, _shift(today, -1))
+        if hi < lo:
+            return
+        with self._lock:
+            spans = self._covered(qkey) + [(lo, hi)]
+            spans.sort()
+            merged: List[Tuple[str, str]] = []
+            for a, b in spans:
+                if merged and a <= _shift(merged[-1][1], 1):
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], b))
+                else:
+                    merged.append((a, b))
+            self._db.execute("DELETE FROM coverage WHERE qkey = ?", (qkey,))
+            self._db.executemany("INSERT INTO coverage(qkey, day_from, day_to) VALUES (?, ?, ?)",
+                                 [(qkey, a, b) for a, b in merged])
+            self._db.commit()
+
+    def rows(self, qkey: str, lo: str, hi: str, by_time: bool = False) -> Iterator[Dict[str, Any]]:
+        """Stored rows for [lo, hi] in CDX server order (urlkey, then timestamp), or by (timestamp, original)."""
+        order = "timestamp, original" if by_time else "urlkey, timestamp, original"
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT " + ", ".join(_FIELDS) + " FROM rows WHERE qkey = ? AND day BETWEEN ? AND ?"
+                " ORDER BY " + order, (qkey, lo, hi))
+            fetched = cur.fetchmany(1000)
+        while fetched:
+            for row in fetched:
+                yield dict(zip(_FIELDS, row))
+            with self._lock:
+                fetched = cur.fetchmany(1000)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
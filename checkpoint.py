@@ -0,0 +1,82 @@
+# waypack/checkpoint.py
+from __future__ import annotations
+import json
+import os
+from typing import Dict, Any, Optional
+
+STATE_VERSION = 4
+
+# args that change what a run produces; a resumed run must match them exactly
+RESUME_ARGS = (
+    "domain",
+    "domains_file",
+    "domain_outputs",
+    "date_from",
+    "date_to",
+    "status",
+    "mime",
+    "max_bytes",
+    "include",
+    "exclude",
+    "rules_dir",
+    "images",
+    "image_types",
+    "image_per_day",
+    "image_min_bytes",
+    "image_max_bytes",
+    "exif_only",
+    "image_fetch",
+    "embedded",
+    "embedded_sameparty",
+    "embedded_keep_keywords",
+    "embedded_denylist",
+    "dedupe_window",
+    "dedupe_mode",
+    "dedupe_store",
+    "csv",
+    "json",
+    "exif_json",
+    "embedded_csv",
+    "embedded_json",
+    "compress",
+    "columnar",
+    "columnar_format",
+    "sqlite",
+    "rule_budget_ms",
+    "rule_quarantine",
+    "cdx_index",
+    "cdx_shard",
+)
+
+
+def run_fingerprint(args) -> Dict[str, Any]:
+    return {k: getattr(args, k, None) for k in RESUME_ARGS}
+
+
+def save_state(path: str, state: Dict[str, Any]):
+    """Write the checkpoint atomically (tmp file + rename), so a crash never leaves half a state file."""
+    state = {"version": STATE_VERSION, **state}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh, ensure_ascii=False)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def load_state(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            state = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def fingerprint_mismatch(state: Dict[str, Any], args) -> list[str]:
+    """Names of output-affecting args that differ from the checkpointed run."""
+    saved = state.get("args", {})
+    cur = run_fingerprint(args)
+    return [k for k in RESUME_ARGS if saved.get(k) != cur.get(k)]
@@ -2,25 +2,40 @@
 from __future__ import annotations
 
 import argparse
+import dataclasses
+import json
 import os
 import sys
-from typing import List, Dict, Any
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Hashable
 
 from .cdx_client import CDXClient
-from .embedded import extract_embeds
-from .exif_reader import read_jpeg_exif_to_text
+from .cdx_index import CDXIndex
+from .checkpoint import fingerprint_mismatch, load_state, run_fingerprint, save_state
+from .cpustage import AnalysisConfig, CpuStage
+from .dedupe import SeenStore, SeenWindow
+from .exif_reader import exif_extent
 from .exporters import (
-    write_findings_csv, write_findings_jsonl, dedupe_findings,
-    write_exif_jsonl, dedupe_exif,
-    write_embedded_csv, write_embedded_jsonl, dedupe_embedded,
+    CsvSink, JsonlSink, ColumnarSink, SqliteOutput, DedupedOutput,
+    FINDINGS_CSV_COLS, EMBEDDED_CSV_COLS,
+    FINDINGS_SCHEMA, EXIF_SCHEMA, EMBEDDED_SCHEMA, DOMAIN_COLUMN, columnar_format,
+    finding_key, exif_key, embedded_key,
     sha256_hex,
 )
 from .fetcher import Fetcher, FetchResult
+from .httpcache import ResponseCache
 from .logger import RunLogger
-from .og_parser import extract_og_images
+from .memo import AnalysisMemo, PageAnalysis
+from .metrics import Metrics
 from .progress import Progress
-from .scanner import load_rules, scan_text
+from .ratelimit import RateLimiter
+from .rulepack import load_rule_pack
+from .scanner import RuleSet, RuleStats
 from .urltools import host, etld1, absolutize
+from .workers import ordered_map, prefetch, round_robin
 
 DENYLIST_DEFAULT = {
     "google.com", "googletagmanager.com", "google-analytics.com", "gstatic.com", "googleapis.com", "doubleclick.net",
@@ -39,9 +54,261 @@ def _fmt_date(yyyymmdd: str) -> str:
     return f"{yyyymmdd[:4]}-{yyyymmdd[4:6]}-{yyyymmdd[6:8]}"
 
 
+def _read_domains(path: str) -> List[str]:
+    """One domain per line; blank lines and #comments ignored, duplicates dropped (first wins)."""
+    out: List[str] = []
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        for line in fh:
+            d = line.split("#", 1)[0].strip().lower()
+            if d and d not in out:
+                out.append(d)
+    return out
+
+
+def _domain_path(path: str, domain: str) -> str:
+    """findings.csv -> findings.example.com.csv (findings.jsonl.gz -> findings.example.com.jsonl.gz)"""
+    root, z = os.path.splitext(path)
+    if z not in (".gz", ".zst"):
+        root, z = path, ""
+    root, ext = os.path.splitext(root)
+    return f"{root}.{domain}{ext}{z}"
+
+
+def _compressed(path: str, codec: str) -> str:
+    """--compress: add the codec suffix to a JSONL output path (an explicit .gz/.zst path wins)."""
+    suffix = {"gzip": ".gz", "zstd": ".zst"}.get(codec, "")
+    if not suffix or path.endswith((".gz", ".zst")):
+        return path
+    return path + suffix
+
+
+def _by_domain(key_fn: Callable[[Dict[str, Any]], Hashable]) -> Callable[[Dict[str, Any]], Hashable]:
+    # batch mode: the same embed/image on two domains is two rows, not a duplicate
+    return lambda r: (r.get("domain"),) + tuple(key_fn(r))
+
+
+@dataclass
+class RunContext:
+    """Everything the per-record work needs; shared read-only across worker threads."""
+    args: argparse.Namespace
+    fetch: Fetcher
+    cpu: CpuStage
+    runlog: RunLogger
+    progress: Progress
+    tgt_etld1: str
+    domain: str = ""
+    assets_dir: str = ""
+    save_html_dir: str = ""
+    save_img_dir: str = ""
+    memo: AnalysisMemo | None = None
+
+
+@dataclass
+class RecordResult:
+    """
+    Rows + counter deltas produced by one CDX record, merged by the main thread in record order
+    (so counters and checkpoints only ever reflect fully finished records).
+    """
+    rec: Dict[str, Any] = field(default_factory=dict)
+    domain: str = ""
+    findings: List[Dict[str, Any]] = field(default_factory=list)
+    exif_rows: List[Dict[str, Any]] = field(default_factory=list)
+    embedded_rows: List[Dict[str, Any]] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    def count(self, key: str, inc: int = 1):
+        self.counts[key] = self.counts.get(key, 0) + inc
+
+
+def _analyse_html(html_bytes: bytes, original: str, fr: FetchResult, html_digest: str, ctx: RunContext) -> PageAnalysis:
+    """Decode + scan + embeds + OG candidates for one body; depends only on content and original URL."""
+    pa = PageAnalysis(fr.status, fr.mime, fr.bytes_read, html_digest)
+    pa.hits, pa.embeds, pa.og_candidates = ctx.cpu.html(html_bytes, original, ctx.tgt_etld1)
+    return pa
+
+
+def _process_record(rec: Dict[str, Any], ctx: RunContext) -> RecordResult:
+    """Per-day flow for one CDX record: HTML -> scan -> embeds -> OG images -> EXIF scan."""
+    args, fetch, runlog, progress = ctx.args, ctx.fetch, ctx.runlog, ctx.progress
+    out = RecordResult(rec=rec, domain=ctx.domain)
+    findings, exif_rows, embedded_rows = out.findings, out.exif_rows, out.embedded_rows
+
+    progress.next_day()
+    ts = rec["timestamp"]
+    day = _fmt_date(ts[:8])
+    original = rec["original"]
+    page_url = fetch.to_archive_url(ts, original, id_mode=True)
+
+    # Fetch HTML (unless an identical capture of this URL was already analysed)
+    out.count("HTML_ORIG", 1)
+    cdx_digest = rec.get("digest") or ""
+    pa = None
+    if ctx.memo is not None and not ctx.assets_dir:
+        # saving assets needs the body, so only skip the fetch when we are not writing it out
+        pa = ctx.memo.by_cdx_digest(cdx_digest, original)
+    if pa is not None:
+        out.count("HTML_KEPT", 1)
+        runlog.log("INFO", "MEMO_HTML", url=page_url, digest=cdx_digest, bytes=pa.bytes_read)
+        progress.inc_html_ok();
+        progress.render()
+    else:
+        fr: FetchResult = fetch.get(page_url)
+        if not (fr.ok and fr.mime and fr.mime.startswith("text/html")):
+            out.count("HTML_SKIPPED", 1)
+            runlog.log("WARN", "SKIP_HTML", url=page_url, status=fr.status, mime=fr.mime or "", reason=fr.error or "")
+            progress.inc_html_skip();
+            progress.render()
+            return out
+
+        html_bytes = fr.data or b""
+
+        out.count("HTML_KEPT", 1)
+        runlog.log("INFO", "FETCH_HTML", url=page_url, status=fr.status, mime=fr.mime, bytes=fr.bytes_read)
+        # compute digest & optionally save HTML
+        html_digest = sha256_hex(html_bytes)
+        if ctx.assets_dir:
+            html_path = os.path.join(ctx.save_html_dir, f"{day}_{html_digest}.html")
+            try:
+                with open(html_path, "wb") as fh:
+                    fh.write(html_bytes)
+                runlog.log("INFO", "SAVE_HTML", url=page_url, path=html_path)
+            except Exception as e:
+                runlog.log("WARN", "SAVE_HTML_FAIL", url=page_url, error=str(e))
+
+        progress.inc_html_ok();
+        progress.render()
+
+        if ctx.memo is not None:
+            pa = ctx.memo.by_content(html_digest, original)
+        if pa is None:
+            pa = _analyse_html(html_bytes, original, fr, html_digest, ctx)
+        if ctx.memo is not None:
+            ctx.memo.put(pa, original, cdx_digest)
+
+    # Regex findings (HTML)
+    for hit in pa.hits:
+        findings.append({
+            "date": day,
+            "url": page_url,
+            "status": pa.status,
+            "mime": pa.mime,
+            "bytes": pa.bytes_read,
+            "file_digest": pa.html_digest,
+            **hit
+        })
+
+        out.count("FIND_ORIG", 1)
+        progress.inc_finds_kept();
+        progress.render()
+
+    # Embedded links
+    for emb in pa.embeds:
+        embedded_rows.append({
+            "date": day, "source_url": page_url, **emb
+        })
+        out.count("EMB_ORIG", 1)
+        progress.inc_embeds_kept();
+        progress.render()
+
+    # OG JPEGs (first-party only)
+    if args.images == "og" and "jpeg" in args.image_types.lower():
+        candidates = pa.og_candidates
+        # only EXIF is needed unless the JPEG itself is being saved
+        prefix_only = args.image_fetch == "prefix" and not ctx.assets_dir
+        kept = 0
+        exif_hits = []  # EXIF-text hits per kept image, emitted after the loop
+        for rel in candidates:
+            if kept >= args.image_per_day:
+                break
+            abs_u = absolutize(original, rel)
+            h = host(abs_u) or ""
+            t = etld1(h) or ""
+            if not h or not t:
+                continue
+            if t != ctx.tgt_etld1:
+                continue
+
+            img_url = fetch.to_archive_url(ts, abs_u, id_mode=True)
+            if prefix_only:
+                r = fetch.get_prefix(img_url, exif_extent, range_bytes=args.image_prefix_kb * 1024)
+            else:
+                r = fetch.get(img_url)
+            out.count("IMG_ORIG", 1)
+            if not (r.ok and r.mime and r.mime.lower().startswith("image/jpeg")):
+                out.count("IMG_SKIPPED", 1)
+                runlog.log("WARN", "SKIP_IMAGE", url=img_url, status=r.status, mime=r.mime or "",
+                           reason=r.error or "")
+                progress.inc_imgs_skip();
+                progress.render()
+                continue
+            if r.size < args.image_min_bytes or r.size > args.image_max_bytes:
+                out.count("IMG_SKIPPED", 1)
+                runlog.log("WARN", "SKIP_IMAGE", url=img_url, reason="size_bounds", bytes=r.size)
+                progress.inc_imgs_skip();
+                progress.render()
+                continue
+
+            ex, ex_hits = ctx.cpu.image(r.data or b"")
+            if not ex:
+                if args.exif_only:
+                    out.count("IMG_SKIPPED", 1)
+                    runlog.log("WARN", "EXIF_EMPTY", url=img_url)
+                    progress.inc_imgs_skip();
+                    progress.render()
+                    continue
+
+            exif_rows.append({
+                "date": day,
+                "src_type": "og",
+                "image_url": img_url,
+                "image_bytes": r.size,
+                "exif": (ex or {}).get("tags", {}),
+                "gps": (ex or {}).get("gps"),
+                "exif_text": (ex or {}).get("exif_text", ""),
+                "image_digest": sha256_hex(r.data or b""),
+            })
+            exif_hits.append(ex_hits)
+            out.count("EXIF_ORIG", 1)
+            runlog.log("INFO", "EXIF_OK", url=img_url, bytes=r.size, tags=len((ex or {}).get("tags", {})))
+            # save JPEG to disk if requested
+            if ctx.assets_dir:
+                img_digest = exif_rows[-1]["image_digest"]
+                img_path = os.path.join(ctx.save_img_dir, f"{day}_{img_digest}.jpg")
+                try:
+                    with open(img_path, "wb") as fh:
+                        fh.write(r.data or b"")
+                    runlog.log("INFO", "SAVE_IMAGE", url=img_url, path=img_path)
+                except Exception as e:
+                    runlog.log("WARN", "SAVE_IMAGE_FAIL", url=img_url, error=str(e))
+
+            progress.inc_imgs_kept();
+            progress.render()
+            kept += 1
+
+        # EXIF text hits (scanned with OSINT rules alongside the EXIF parse)
+        for er, hits in zip(exif_rows, exif_hits):
+            for hit in hits:
+                findings.append({
+                    "date": day, "url": er["image_url"], "status": 200, "mime": "image/jpeg",
+                    "bytes": er["image_bytes"],
+                    "image_digest": er.get("image_digest", ""),
+                    **hit
+                })
+                out.count("FIND_ORIG", 1)
+                progress.inc_finds_kept();
+                progress.render()
+
+    return out
+
+
 def main(argv=None):
     p = argparse.ArgumentParser("waypack")
-    p.add_argument("--domain", required=True)
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument("--domain")
+    target.add_argument("--domains-file", default="",
+                        help="Batch mode: one domain per line, all sharing one session and --rps budget")
+    p.add_argument("--domain-outputs", default="combined", choices=["combined", "split"],
+                   help="Batch mode: one set of files with a domain column, or one set per domain")
     p.add_argument("--from", dest="date_from", required=True)
     p.add_argument("--to", dest="date_to", required=True)
     p.add_argument("--status", default="200")
@@ -50,36 +317,119 @@ def main(argv=None):
     p.add_argument("--timeout", type=int, default=15)
     p.add_argument("--retries", type=int, default=3)
     p.add_argument("--rps", type=float, default=2.0)
+    p.add_argument("--read-kb", type=int, default=64, help="Socket read size while streaming bodies")
+    p.add_argument("--cache-dir", default="", help="On-disk cache for id_ replays and CDX pages (optional)")
+    p.add_argument("--cache-max-mb", type=int, default=2048)
+    p.add_argument("--cdx-cache-ttl", type=float, default=86400.0, help="Seconds a cached CDX page stays fresh")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Concurrent page workers (each also fetches its OG images); all share one --rps budget")
+    p.add_argument("--cpu-workers", type=int, default=0,
+                   help="Processes for decode/scan/embeds/EXIF (0 = in the fetch threads); use with --workers >= this")
+    p.add_argument("--stream", action="store_true",
+                   help="Consume CDX pages lazily alongside fetching instead of listing every day up front")
 
     p.add_argument("--include", default="aws,github,stripe,webhooks,ga,keys,jwt")
     p.add_argument("--exclude", default="pii")
+    p.add_argument("--rules-dir", default="rules")
+    p.add_argument("--rules-cache", default=None,
+                   help="Compiled rule-pack cache dir (default <rules-dir>/.cache; empty string disables)")
 
-    p.add_argument("--images", default="og", choices=["og", "off"])
+    p.add_argument("--images", default="og", choices=["og", "off"],
+                   help="og: EXIF from first-party OG/Twitter JPEGs. With --images off and --embedded off, "
+                        "pages are only scanned by the rules, straight from the raw bytes without decoding")
     p.add_argument("--image-types", default="jpeg")
     p.add_argument("--image-per-day", type=int, default=8)
     p.add_argument("--image-min-bytes", type=int, default=30_000)
     p.add_argument("--image-max-bytes", type=int, default=3_000_000)
     p.add_argument("--exif-only", action="store_true", default=True)
-
-    p.add_argument("--embedded", default="on", choices=["on", "off"])
+    p.add_argument("--image-fetch", default="full", choices=["prefix", "full"],
+                   help="prefix: fetch only the JPEG head up to EXIF/SOS; image_digest then hashes that head, "
+                        "so it differs from full-mode digests (don't mix the two in one dedupe store). "
+                        "--save-assets always fetches full bodies")
+    p.add_argument("--image-prefix-kb", type=int, default=64, help="Range size for --image-fetch prefix")
+
+    p.add_argument("--embedded", default="on", choices=["on", "off"],
+                   help="Extract third-party embeds (see --images for the raw-bytes scan when both are off)")
     p.add_argument("--embedded-sameparty", action="store_true", default=False)
     p.add_argument("--embedded-keep-keywords", default=",".join(sorted(KEEP_KEYWORDS_DEFAULT)))
     p.add_argument("--embedded-denylist", default="builtin")
 
+    p.add_argument("--memo-size", type=int, default=4096,
+                   help="Pages of analysis results to reuse for identical captures (0 disables)")
+
     p.add_argument("--dedupe", default="scope=window")
     p.add_argument("--dedupe-window", type=int, default=60)
+    p.add_argument("--dedupe-mode", default="exact", choices=["exact", "bloom"],
+                   help="bloom: per-day Bloom filters within --dedupe-mem-mb (rare false 'seen'), for very long/wide runs")
+    p.add_argument("--dedupe-mem-mb", type=int, default=256, help="Memory budget for all dedupe windows in bloom mode")
+    p.add_argument("--dedupe-store", default="",
+                   help="SQLite file remembering kept keys across runs, so repeated/overlapping runs emit only new rows")
 
     p.add_argument("--csv", default="findings.csv")
     p.add_argument("--json", default="findings.jsonl")
     p.add_argument("--exif-json", default="images_exif.jsonl")
     p.add_argument("--embedded-csv", default="embedded_links.csv")
     p.add_argument("--embedded-json", default="embedded_links.jsonl")
+    p.add_argument("--compress", default="none", choices=["none", "gzip", "zstd"],
+                   help="Compress the JSONL outputs (adds .gz/.zst; zstd needs the zstandard package)")
+    p.add_argument("--columnar", default="", help="Directory for columnar copies of findings/EXIF/embedded rows")
+    p.add_argument("--columnar-format", default="auto", choices=["auto", "parquet", "stdlib"],
+                   help="parquet needs pyarrow; stdlib = gzip'd JSON column chunks (auto: parquet if available)")
+    p.add_argument("--sqlite", default="", help="Also write findings/EXIF/embeds into this SQLite database (appends across runs)")
     p.add_argument("--log-file", default="run.log")
     p.add_argument("--no-progress", action="store_true")
     p.add_argument("--save-assets", default="", help="Directory to save raw HTML/JPEG assets (optional)")
     p.add_argument("--mirror-log", action="store_true")
+    p.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARN", "ERROR"],
+                   help="Drop log events below this level")
+    p.add_argument("--log-format", default="text", choices=["text", "json"], help="json = one JSON object per line")
+    p.add_argument("--log-async", action="store_true",
+                   help="Format and write the log from a background thread (buffered; drained on exit)")
+    p.add_argument("--cdx-page-size", type=int, default=0, help="CDX rows per API page (0 = server default)")
+    p.add_argument("--cdx-index", default="", help="SQLite file caching CDX rows; only uncovered days are queried")
+    p.add_argument("--cdx-shard", default="off", choices=["off", "month", "year"],
+                   help="List the date range in shards concurrently (rows then arrive in timestamp order)")
+    p.add_argument("--cdx-parallel", type=int, default=4, help="Concurrent CDX shard listings")
+    p.add_argument("--metrics-file", default="",
+                   help="Prometheus text file with per-stage latency histograms and throughput, rewritten periodically")
+    p.add_argument("--metrics-every", type=float, default=15.0, help="Seconds between --metrics-file rewrites")
+    p.add_argument("--metrics-json", default="", help="Write the final per-stage metrics summary here as JSON")
+    p.add_argument("--rule-profile", default="",
+                   help="Time every rule on every text and write per-rule totals here as JSON (top rules also go to the log)")
+    p.add_argument("--rule-budget-ms", type=float, default=0.0,
+                   help="Warn when one rule takes longer than this on one page/EXIF text (0 = off)")
+    p.add_argument("--rule-quarantine", type=int, default=0,
+                   help="Skip a rule for the rest of the run after it exceeded --rule-budget-ms on this many texts (0 = warn only)")
+    p.add_argument("--state", default="", help="Checkpoint file, rewritten as the run progresses (optional)")
+    p.add_argument("--resume", action="store_true", help="Continue the run recorded in --state")
+    p.add_argument("--state-every", type=float, default=10.0, help="Seconds between checkpoints")
 
     args = p.parse_args(argv)
+    state = None
+    if args.resume:
+        if not args.state:
+            p.error("--resume requires --state")
+        state = load_state(args.state)
+        if state is None:
+            p.error(f"no usable checkpoint at {args.state}")
+        changed = fingerprint_mismatch(state, args)
+        if changed:
+            p.error("checkpoint was written with different " + ", ".join("--" + k.replace("_", "-") for k in changed))
+        if state.get("complete"):
+            print(f"{args.state}: run already complete", file=sys.stderr)
+            return 0
+
+    batch = bool(args.domains_file)
+    if batch:
+        try:
+            domains = _read_domains(args.domains_file)
+        except OSError as e:
+            p.error(f"cannot read --domains-file: {e}")
+        if not domains:
+            p.error(f"no domains in {args.domains_file}")
+    else:
+        domains = [args.domain]
+
     assets_dir = args.save_assets.strip()
     save_html_dir = save_img_dir = ""
     if assets_dir:
@@ -108,191 +458,263 @@ def main(argv=None):
             denylist = set(DENYLIST_DEFAULT)
 
     progress = Progress(enabled=not args.no_progress)
-    runlog = RunLogger(args.log_file, mirror_stdout=args.mirror_log)
-
-    cdx = CDXClient(rps=args.rps)
-    fetch = Fetcher(rps=args.rps, timeout=args.timeout, max_bytes=args.max_bytes, retries=args.retries)
-    rules = load_rules("rules")
-
-    records = list(
-        cdx.query_daily_sample(args.domain, args.date_from, args.date_to, statuscode=args.status, mimetype=args.mime))
-    progress.set_days_total(len(records))
-
-    findings: List[Dict[str, Any]] = []
-    exif_rows: List[Dict[str, Any]] = []
-    embedded_rows: List[Dict[str, Any]] = []
-
-    tgt_etld1 = etld1(args.domain)
-    for rec in records:
-        progress.next_day()
-        ts = rec["timestamp"]
-        day = _fmt_date(ts[:8])
-        original = rec["original"]
-        page_url = fetch.to_archive_url(ts, original, id_mode=True)
-
-        # Fetch HTML
-        runlog.count("HTML_ORIG", 1)
-        fr: FetchResult = fetch.get(page_url)
-        if not (fr.ok and fr.mime and fr.mime.startswith("text/html")):
-            runlog.count("HTML_SKIPPED", 1)
-            runlog.log("WARN", "SKIP_HTML", url=page_url, status=fr.status, mime=fr.mime or "", reason=fr.error or "")
-            progress.inc_html_skip();
-            progress.render()
-            continue
-
-        html_bytes = fr.data or b""
-        try:
-            text = html_bytes.decode("utf-8", errors="replace")
-        except Exception:
-            text = html_bytes.decode(errors="replace")
-
-        runlog.count("HTML_KEPT", 1)
-        runlog.log("INFO", "FETCH_HTML", url=page_url, status=fr.status, mime=fr.mime, bytes=fr.bytes_read)
-        # compute digest & optionally save HTML
-        html_digest = sha256_hex(html_bytes)
-        if assets_dir:
-            html_path = os.path.join(save_html_dir, f"{day}_{html_digest}.html")
-            try:
-                with open(html_path, "wb") as fh:
-                    fh.write(html_bytes)
-                runlog.log("INFO", "SAVE_HTML", url=page_url, path=html_path)
-            except Exception as e:
-                runlog.log("WARN", "SAVE_HTML_FAIL", url=page_url, error=str(e))
-
-        progress.inc_html_ok();
-        progress.render()
-
-        # Regex findings (HTML)
-        for hit in scan_text(text, rules, families_include, families_exclude):
-            findings.append({
-                "date": day,
-                "url": page_url,
-                "status": fr.status,
-                "mime": fr.mime,
-                "bytes": fr.bytes_read,
-                "file_digest": html_digest,
-                **hit
-            })
-
-            runlog.count("FIND_ORIG", 1)
-            progress.inc_finds_kept();
-            progress.render()
-
-        # Embedded links
-        if args.embedded != "off":
-            for emb in extract_embeds(text, original, tgt_etld1 or "", denylist, keep_keywords,
-                                      sameparty=args.embedded_sameparty):
-                embedded_rows.append({
-                    "date": day, "source_url": page_url, **emb
-                })
-                runlog.count("EMB_ORIG", 1)
-                progress.inc_embeds_kept();
-                progress.render()
-
-        # OG JPEGs (first-party only)
-        if args.images == "og" and "jpeg" in args.image_types.lower():
-            candidates = extract_og_images(text)
-            kept = 0
-            for rel in candidates:
-                if kept >= args.image_per_day:
-                    break
-                abs_u = absolutize(original, rel)
-                h = host(abs_u) or ""
-                t = etld1(h) or ""
-                if not h or not t:
-                    continue
-                if t != (tgt_etld1 or ""):
-                    continue
-
-                img_url = fetch.to_archive_url(ts, abs_u, id_mode=True)
-                r = fetch.get(img_url)
-                runlog.count("IMG_ORIG", 1)
-                if not (r.ok and r.mime and r.mime.lower().startswith("image/jpeg")):
-                    runlog.count("IMG_SKIPPED", 1)
-                    runlog.log("WARN", "SKIP_IMAGE", url=img_url, status=r.status, mime=r.mime or "",
-                               reason=r.error or "")
-                    progress.inc_imgs_skip();
-                    progress.render()
-                    continue
-                if r.bytes_read < args.image_min_bytes or r.bytes_read > args.image_max_bytes:
-                    runlog.count("IMG_SKIPPED", 1)
-                    runlog.log("WARN", "SKIP_IMAGE", url=img_url, reason="size_bounds", bytes=r.bytes_read)
-                    progress.inc_imgs_skip();
-                    progress.render()
-                    continue
-
-                ex = read_jpeg_exif_to_text(r.data or b"")
-                if not ex:
-                    if args.exif_only:
-                        runlog.count("IMG_SKIPPED", 1)
-                        runlog.log("WARN", "EXIF_EMPTY", url=img_url)
-                        progress.inc_imgs_skip();
-                        progress.render()
-                        continue
-
-                exif_rows.append({
-                    "date": day,
-                    "src_type": "og",
-                    "image_url": img_url,
-                    "image_bytes": r.bytes_read,
-                    "exif": (ex or {}).get("tags", {}),
-                    "gps": (ex or {}).get("gps"),
-                    "exif_text": (ex or {}).get("exif_text", ""),
-                    "image_digest": sha256_hex(r.data or b""),
-                })
-                runlog.count("EXIF_ORIG", 1)
-                runlog.log("INFO", "EXIF_OK", url=img_url, bytes=r.bytes_read, tags=len((ex or {}).get("tags", {})))
-                # save JPEG to disk if requested
-                if assets_dir:
-                    img_digest = exif_rows[-1]["image_digest"]
-                    img_path = os.path.join(save_img_dir, f"{day}_{img_digest}.jpg")
-                    try:
-                        with open(img_path, "wb") as fh:
-                            fh.write(r.data or b"")
-                        runlog.log("INFO", "SAVE_IMAGE", url=img_url, path=img_path)
-                    except Exception as e:
-                        runlog.log("WARN", "SAVE_IMAGE_FAIL", url=img_url, error=str(e))
-
-                progress.inc_imgs_kept();
-                progress.render()
-                kept += 1
-
-            # Scan EXIF text with OSINT rules
-            for er in exif_rows[-kept:] if kept else []:
-                txt = er.get("exif_text", "")
-                if not txt:
-                    continue
-                for hit in scan_text(txt, rules, families_include, families_exclude):
-                    findings.append({
-                        "date": day, "url": er["image_url"], "status": 200, "mime": "image/jpeg",
-                        "bytes": er["image_bytes"],
-                        "image_digest": er.get("image_digest", ""),
-                        **hit
-                    })
-                    runlog.count("FIND_ORIG", 1)
-                    progress.inc_finds_kept();
-                    progress.render()
+    runlog = RunLogger(args.log_file, mirror_stdout=args.mirror_log, append=state is not None,
+                       level=args.log_level, fmt=args.log_format, background=args.log_async)
+    records_done = 0
+    cdx_pos: Dict[str, Dict[str, Any]] = {}  # per domain: CDX position of the last fully processed record
+    cdx_next = ""  # round-robin cursor: the domain whose turn comes after the last processed record
+    if state is not None:
+        runlog.restore_counters(state.get("counters", {}))
+        progress.restore_counters(state.get("progress", {}))
+        records_done = state.get("records_done", 0)
+        cdx_pos = state.get("cdx") or {}
+        cdx_next = state.get("cdx_next") or ""
+        runlog.log("INFO", "RESUME", state=args.state, records_done=records_done,
+                   last=max((pos.get("timestamp") or "" for pos in cdx_pos.values()), default=""))
+
+    workers = max(1, args.workers)
+    metrics = Metrics() if (args.metrics_file.strip() or args.metrics_json.strip()) else None
+    if metrics is not None and args.metrics_file.strip():
+        metrics.start_export(args.metrics_file, max(1.0, args.metrics_every))
+    cache = None
+    if args.cache_dir.strip():
+        cache = ResponseCache(os.path.join(args.cache_dir.strip(), "responses.sqlite"),
+                              max_bytes=args.cache_max_mb * 1024 * 1024)
+    cdx_index = CDXIndex(args.cdx_index) if args.cdx_index.strip() else None
+    # one limiter and one session for CDX paging and every page/image worker (all domains), so
+    # the process as a whole never exceeds --rps against the archive
+    limiter = RateLimiter(args.rps)
+    fetch = Fetcher(timeout=args.timeout, max_bytes=args.max_bytes, retries=args.retries,
+                    limiter=limiter, pool_size=max(10, workers + args.cdx_parallel), cache=cache,
+                    read_size=args.read_kb * 1024, metrics=metrics)
+    cdx = CDXClient(session=fetch.sess, limiter=limiter, cache=cache, cache_ttl=args.cdx_cache_ttl, index=cdx_index,
+                    shard="" if args.cdx_shard == "off" else args.cdx_shard, shard_parallel=args.cdx_parallel,
+                    metrics=metrics)
+    # validated + pre-analysed pack (cached by content hash); family selection happens once here
+    pack = load_rule_pack(args.rules_dir, cache_dir=args.rules_cache)
+    for err in pack.errors:
+        runlog.log("WARN", "RULE_INVALID", error=err)
+    rules = RuleSet(pack.rules, families_include, families_exclude)
+    if args.rule_profile.strip() or args.rule_budget_ms > 0:
+        rules.stats = RuleStats(budget=args.rule_budget_ms / 1000.0, quarantine_after=args.rule_quarantine)
+        # a resumed run keeps skipping what the interrupted one had quarantined
+        rules.stats.quarantined.update((state or {}).get("quarantined_rules", []))
+    runlog.log("INFO", "RULES_LOADED", source=pack.source, rules=len(pack.rules), selected=len(rules.rules),
+               invalid=len(pack.errors), cached=pack.from_cache)
+
+    cpu = CpuStage(rules, AnalysisConfig(
+        embedded=args.embedded != "off", sameparty=args.embedded_sameparty,
+        og_images=args.images == "og" and "jpeg" in args.image_types.lower(),
+        denylist=frozenset(denylist), keep_keywords=frozenset(keep_keywords),
+    ), processes=args.cpu_workers, metrics=metrics)
+
+    base_ctx = RunContext(
+        args=args, fetch=fetch, cpu=cpu, runlog=runlog, progress=progress, tgt_etld1="",
+        assets_dir=assets_dir, save_html_dir=save_html_dir, save_img_dir=save_img_dir,
+        memo=AnalysisMemo(args.memo_size) if args.memo_size > 0 else None,
+    )
+    ctxs = {d: dataclasses.replace(base_ctx, domain=d, tgt_etld1=etld1(d) or "") for d in domains}
+    if batch:
+        runlog.log("INFO", "DOMAINS", count=len(domains), outputs=args.domain_outputs)
+
+    def domain_records(d: str):
+        pos = cdx_pos.get(d)
+        recs = cdx.query_daily_sample(
+            d, args.date_from, args.date_to, statuscode=args.status, mimetype=args.mime,
+            page_size=args.cdx_page_size or None,
+            resume_key=(pos["page_key"] or None) if pos else None,
+            skip=pos["page_index"] + 1 if pos else 0,
+        )
+        return recs if args.stream else list(recs)
+
+    def tagged(ctx: RunContext, recs):
+        for rec in recs:
+            yield ctx, rec
+
+    # round-robin across domains so one huge domain cannot starve the rest of the shared budget
+    # (resuming: start at the saved cursor, so the interleaving carries on where it stopped)
+    turn_after = {d: domains[(i + 1) % len(domains)] for i, d in enumerate(domains)}
+    first = domains.index(cdx_next) if cdx_next in domains else 0
+    per_domain = [tagged(ctxs[d], domain_records(d)) for d in domains[first:] + domains[:first]]
+    if args.stream:
+        # CDX pagination runs ahead on its own thread; day total stays unknown
+        items = prefetch(round_robin(per_domain), maxsize=max(64, workers * 4))
+    else:
+        items = list(round_robin(per_domain))
+        progress.set_days_total(len(items) + records_done)
 
-    # DEDUPE + WRITE
+    # rows are deduped online and written as each record completes, so memory stays flat and
+    # a crash keeps everything up to the last finished day
+    # (resuming: files are cut back to the checkpointed offsets and appended to)
+    # (batch mode adds a leading domain column; --domain-outputs split writes findings.<domain>.csv etc.)
     window = args.dedupe_window
-    findings_d = list(dedupe_findings(findings, scope_days=window))
-    exif_d = list(dedupe_exif(exif_rows, scope_days=window))
-    embedded_d = list(dedupe_embedded(embedded_rows, scope_days=window))
-
-    runlog.count("FIND_DEDUPED", max(0, len(findings) - len(findings_d)))
-    runlog.count("FIND_KEPT", len(findings_d))
-    runlog.count("EXIF_DEDUPED", max(0, len(exif_rows) - len(exif_d)))
-    runlog.count("EXIF_KEPT", len(exif_d))
-    runlog.count("EMB_DEDUPED", max(0, len(embedded_rows) - len(embedded_d)))
-    runlog.count("EMB_KEPT", len(embedded_d))
-
-    write_findings_csv(args.csv, findings_d)
-    write_findings_jsonl(args.json, findings_d)
-    write_exif_jsonl(args.exif_json, exif_d)
-    if args.embedded != "off":
-        write_embedded_csv(args.embedded_csv, embedded_d)
-        write_embedded_jsonl(args.embedded_json, embedded_d)
-
+    saved_outputs = (state or {}).get("outputs", {})
+    at = {path: off for snap in saved_outputs.values() for path, off in snap.get("offsets", {}).items()}
+    find_cols = ["domain"] + FINDINGS_CSV_COLS if batch else FINDINGS_CSV_COLS
+    emb_cols = ["domain"] + EMBEDDED_CSV_COLS if batch else EMBEDDED_CSV_COLS
+    key = _by_domain if batch else (lambda fn: fn)
+    split = batch and args.domain_outputs == "split"
+    window_bytes = (args.dedupe_mem_mb << 20) // (3 * (len(domains) if split else 1))  # bloom mode only
+    # the run id marks this run's own store rows, so a resumed run doesn't mistake them for old ones
+    run_id = (state or {}).get("run_id") or uuid.uuid4().hex
+    store = SeenStore(args.dedupe_store, run_id) if args.dedupe_store.strip() else None
+
+    zpath = lambda x: _compressed(x, args.compress)
+    col_fmt = columnar_format(args.columnar_format) if args.columnar.strip() else ""
+    if col_fmt:
+        os.makedirs(args.columnar, exist_ok=True)
+    schema = (lambda sc: [DOMAIN_COLUMN] + sc) if batch else (lambda sc: sc)
+    sqlite_db = SqliteOutput(args.sqlite, run_id) if args.sqlite.strip() else None
+
+    def make_outputs(domain: str) -> Dict[str, DedupedOutput]:
+        path = (lambda x: _domain_path(x, domain)) if domain else (lambda x: x)
+        csv_p, json_p, exif_p = path(args.csv), path(zpath(args.json)), path(zpath(args.exif_json))
+        emb_csv_p, emb_json_p = path(args.embedded_csv), path(zpath(args.embedded_json))
+
+        def columnar(name: str, sc) -> List[ColumnarSink]:
+            if not col_fmt:
+                return []
+            p = path(os.path.join(args.columnar, f"{name}.parquet" if col_fmt == "parquet" else f"{name}.columns.gz"))
+            return [ColumnarSink(p, schema(sc), col_fmt, at.get(p))]
+
+        def sqlite(kind: str) -> List[Any]:
+            return [sqlite_db.sink(kind, domain or args.domain or "")] if sqlite_db is not None else []
+        # store namespace: kind + domain (combined batch keys already carry the domain)
+        scope = domain or ("*" if batch else domains[0])
+        seen = lambda kind: SeenWindow(window, mode=args.dedupe_mode, max_bytes=window_bytes,
+                                       store=store, ns=f"{kind}:{scope}")
+        return {
+            "findings": DedupedOutput(key(finding_key), window, [CsvSink(csv_p, find_cols, at.get(csv_p)),
+                                                                 JsonlSink(json_p, "finding", at.get(json_p))]
+                                      + columnar("findings", FINDINGS_SCHEMA) + sqlite("findings"),
+                                      seen=seen("findings"), metrics=metrics),
+            "exif": DedupedOutput(key(exif_key), window, [JsonlSink(exif_p, "exif", at.get(exif_p))]
+                                  + columnar("exif", EXIF_SCHEMA) + sqlite("exif"), seen=seen("exif"), metrics=metrics),
+            "embedded": DedupedOutput(key(embedded_key), window,
+                                      [CsvSink(emb_csv_p, emb_cols, at.get(emb_csv_p)),
+                                       JsonlSink(emb_json_p, "embedded_link", at.get(emb_json_p))]
+                                      + columnar("embedded", EMBEDDED_SCHEMA) + sqlite("embedded")
+                                      if args.embedded != "off" else [], seen=seen("embedded"), metrics=metrics),
+        }
+
+    if split:
+        groups = {d: make_outputs(d) for d in domains}
+    else:
+        groups = {"": make_outputs("")}
+    outputs = {(f"{kind}:{g}" if g else kind): o for g, outs in groups.items() for kind, o in outs.items()}
+    for name, snap in saved_outputs.items():
+        if name in outputs:
+            outputs[name].restore(snap)
+
+    def checkpoint(complete: bool = False):
+        t0 = time.perf_counter()
+        if store is not None:
+            store.flush()
+        save_state(args.state, {
+            "args": run_fingerprint(args),
+            "run_id": run_id,
+            "complete": complete,
+            "records_done": records_done,
+            "cdx": cdx_pos,
+            "cdx_next": cdx_next,
+            "outputs": {name: o.snapshot() for name, o in outputs.items()},
+            "counters": runlog.counters(),
+            "progress": progress.counters(),
+            "quarantined_rules": sorted(rules.stats.quarantined) if rules.stats is not None else [],
+        })
+        if metrics is not None:
+            metrics.observe("checkpoint", time.perf_counter() - t0)
+
+    def run(item):
+        ctx, rec = item
+        return _process_record(rec, ctx)
+
+    if workers == 1:
+        results = map(run, items)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="waypack-fetch")
+        results = ordered_map(pool, run, items, max_inflight=workers * 2)
+    last_cp = time.monotonic()
+    at_boundary = True  # False while a record's rows are half merged
+    try:
+        # merge strictly in record order so dedupe/export see the same sequence as a serial run
+        for res in results:
+            at_boundary = False
+            outs = groups.get(res.domain) or groups[""]
+            for kind, rows in (("findings", res.findings), ("exif", res.exif_rows),
+                               ("embedded", res.embedded_rows)):
+                if rows:
+                    outs[kind].add_many([{"domain": res.domain, **r} for r in rows] if batch else rows)
+            for o in outs.values():
+                o.flush()
+            for k, v in res.counts.items():
+                runlog.count(k, v)
+            if rules.stats is not None:
+                for rule_id, sec, size, quarantined in rules.stats.drain_events():
+                    runlog.log("WARN", "RULE_SLOW", rule=rule_id, ms=round(sec * 1000, 1), bytes=size)
+                    if quarantined:
+                        runlog.log("WARN", "RULE_QUARANTINED", rule=rule_id, after=args.rule_quarantine)
+            records_done += 1
+            if metrics is not None:
+                metrics.add_pages()
+            cdx_pos[res.domain] = {k: res.rec.get(k) for k in ("page_key", "page_index", "timestamp", "original")}
+            cdx_next = turn_after[res.domain]
+            at_boundary = True
+            if args.state and time.monotonic() - last_cp >= args.state_every:
+                checkpoint()
+                last_cp = time.monotonic()
+        if args.state:
+            checkpoint(complete=True)
+    finally:
+        # crash / Ctrl-C: record how far we got so --resume continues from the last finished record
+        if args.state and at_boundary and sys.exc_info()[0] is not None:
+            checkpoint()
+        if workers > 1:
+            pool.shutdown(wait=True, cancel_futures=True)
+        cpu.close()
+        for o in outputs.values():
+            o.close()
+        if sqlite_db is not None:
+            sqlite_db.close()
+        if store is not None:
+            store.close()
+
+    # DEDUPE counters
+    for kind, prefix in (("findings", "FIND"), ("exif", "EXIF"), ("embedded", "EMB")):
+        seen = sum(outs[kind].seen_rows for outs in groups.values())
+        kept = sum(outs[kind].kept_rows for outs in groups.values())
+        runlog.count(f"{prefix}_DEDUPED", seen - kept)
+        runlog.count(f"{prefix}_KEPT", kept)
+
+    if rules.stats is not None:
+        for i, r in enumerate(rules.stats.top(10), 1):
+            runlog.log("INFO", "RULE_PROFILE", rank=i, rule=r["rule_id"], seconds=r["seconds"], runs=r["runs"],
+                       matches=r["matches"], worst_ms=round(r["worst_s"] * 1000, 1), over_budget=r["over_budget"])
+        if args.rule_profile.strip():
+            with open(args.rule_profile, "w", encoding="utf-8") as fh:
+                json.dump({"budget_ms": args.rule_budget_ms, "quarantined": sorted(rules.stats.quarantined),
+                           "rules": rules.stats.top(len(rules.stats.rules))}, fh, indent=2)
+    if metrics is not None:
+        metrics.stop_export()
+        snap = metrics.snapshot()
+        runlog.log("INFO", "METRICS", pages=snap["pages"], pages_per_s=snap["pages_per_s"], mb_per_s=snap["mb_per_s"],
+                   top=",".join(f"{k}:{v['sum_s']:.2f}s" for k, v in sorted(snap["stages"].items(),
+                                                                        key=lambda kv: -kv[1]["sum_s"])[:4]))
+        if args.metrics_file.strip():
+            metrics.write_prometheus(args.metrics_file)
+        if args.metrics_json.strip():
+            metrics.write_json(args.metrics_json)
+    if sqlite_db is not None:
+        runlog.log("INFO", "SQLITE", path=args.sqlite, rows=sqlite_db.rows)
+    if store is not None:
+        runlog.log("INFO", "DEDUPE_STORE", path=args.dedupe_store, lookups=store.lookups, hits=store.hits)
+    if base_ctx.memo is not None:
+        runlog.log("INFO", "MEMO", hits=base_ctx.memo.hits, misses=base_ctx.memo.misses)
+    if cache is not None:
+        runlog.log("INFO", "CACHE", hits=cache.hits, misses=cache.misses)
+        cache.close()
+    if cdx_index is not None:
+        cdx_index.close()
     progress.done()
     runlog.close()
     return 0
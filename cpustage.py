@@ -0,0 +1,165 @@
+# waypack/cpustage.py
+from __future__ import annotations
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, FrozenSet
+
+from .embedded import extract_embeds
+from .exif_reader import read_jpeg_exif_to_text
+from .htmlpass import scan_html
+from .metrics import Metrics
+from .og_parser import extract_og_images
+from .scanner import RuleSet
+
+HtmlResult = Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[str]]  # hits, embeds, og candidates
+ImageResult = Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]  # exif dict, hits in exif_text
+Timings = Dict[str, float]  # stage -> seconds (metrics.py stage names)
+
+
+@dataclass(frozen=True)
+class AnalysisConfig:
+    """Run-wide knobs for the CPU work; per-page inputs (original URL, target eTLD+1) travel per call."""
+    embedded: bool = True
+    sameparty: bool = False
+    og_images: bool = True
+    denylist: FrozenSet[str] = frozenset()
+    keep_keywords: FrozenSet[str] = frozenset()
+
+
+def analyse_html(html_bytes: bytes, original: str, tgt_etld1: str, rules: RuleSet, cfg: AnalysisConfig,
+                 timings: Optional[Timings] = None) -> HtmlResult:
+    """
+    Decode + scan + embeds + OG candidates for one body; embeds and OG share one scan_html pass.
+    Per-stage seconds go into `timings` when one is passed.
+    """
+    t0 = time.perf_counter()
+    if not (cfg.embedded or cfg.og_images):
+        # rules alone don't need the page as str: scan the buffer, decoding only around hits
+        hits = list(rules.scan_bytes(html_bytes))
+        if timings is not None:
+            timings["scan"] = time.perf_counter() - t0
+        return hits, [], []
+    text = html_bytes.decode("utf-8", errors="replace")
+    t1 = time.perf_counter()
+    hits = list(rules.scan(text))
+    t2 = time.perf_counter()
+    page = scan_html(text)
+    embeds = []
+    if cfg.embedded:
+        embeds = list(extract_embeds(text, original, tgt_etld1, cfg.denylist, cfg.keep_keywords,
+                                     sameparty=cfg.sameparty, page=page))
+    t3 = time.perf_counter()
+    og = extract_og_images(text, page=page) if cfg.og_images else []
+    if timings is not None:
+        timings.update(decode=t1 - t0, scan=t2 - t1, embeds=t3 - t2, og=time.perf_counter() - t3)
+    return hits, embeds, og
+
+
+def analyse_image(jpeg_bytes: bytes, rules: RuleSet, timings: Optional[Timings] = None) -> ImageResult:
+    """EXIF extraction + rule scan of the flattened EXIF text."""
+    t0 = time.perf_counter()
+    ex = read_jpeg_exif_to_text(jpeg_bytes)
+    t1 = time.perf_counter()
+    txt = (ex or {}).get("exif_text", "")
+    hits = list(rules.scan(txt)) if txt else []
+    if timings is not None:
+        timings.update(exif=t1 - t0, exif_scan=time.perf_counter() - t1)
+    return ex, hits
+
+
+# --- worker-process side: rules/config are shipped once per process by the pool initializer ---
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(rules: RuleSet, cfg: AnalysisConfig):
+    if rules.stats is not None:
+        rules.stats.take()  # a late-spawned worker gets the parent's totals: start from zero
+        rules.stats.quarantine_after = 0  # report only; the parent decides (see _use_quarantine)
+    _worker["rules"] = rules
+    _worker["cfg"] = cfg
+
+
+def _use_quarantine(quarantined: Optional[FrozenSet[str]]):
+    if quarantined is not None:
+        _worker["rules"].stats.quarantined = set(quarantined)
+
+
+def _rule_delta() -> Optional[Dict[str, Any]]:
+    stats = _worker["rules"].stats
+    return stats.take() if stats is not None else None
+
+
+def _html_task(html_bytes: bytes, original: str, tgt_etld1: str, timed: bool,
+               quarantined: Optional[FrozenSet[str]]):
+    _use_quarantine(quarantined)
+    timings: Timings = {}
+    res = analyse_html(html_bytes, original, tgt_etld1, _worker["rules"], _worker["cfg"], timings if timed else None)
+    return res, timings, _rule_delta()
+
+
+def _image_task(jpeg_bytes: bytes, timed: bool, quarantined: Optional[FrozenSet[str]]):
+    _use_quarantine(quarantined)
+    timings: Timings = {}
+    return analyse_image(jpeg_bytes, _worker["rules"], timings if timed else None), timings, _rule_delta()
+
+
+class CpuStage:
+    """
+    The CPU-bound half of a record (decode, scan, embeds, OG, EXIF). With processes=0 it runs
+    inline in the calling thread; otherwise calls are shipped to a process pool whose workers
+    hold their own copy of the compiled rules, so fetch threads block only on their own page
+    while other threads keep the network busy. Results come back as plain lists/dicts, with the
+    per-stage timings (measured wherever the work ran) fed to `metrics` if given. Per-rule
+    stats (rules.stats) gathered in workers are merged into the parent's copy after each call,
+    and every call carries the parent's quarantine set, so all workers skip the same rules.
+    """
+    def __init__(self, rules: RuleSet, cfg: AnalysisConfig, processes: int = 0, metrics: Metrics | None = None):
+        self.rules = rules
+        self.cfg = cfg
+        self.metrics = metrics
+        self.processes = max(0, processes)
+        self._pool: ProcessPoolExecutor | None = None
+        if self.processes:
+            # spawn, not fork: the parent already runs fetch/CDX threads by the time workers start
+            self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                             mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(rules, cfg))
+
+    def _quarantined(self) -> Optional[FrozenSet[str]]:
+        stats = self.rules.stats
+        return stats.quarantine_set() if stats is not None else None
+
+    def html(self, html_bytes: bytes, original: str, tgt_etld1: str) -> HtmlResult:
+        timed = self.metrics is not None
+        if self._pool is None:
+            timings: Timings = {}
+            res = analyse_html(html_bytes, original, tgt_etld1, self.rules, self.cfg, timings if timed else None)
+        else:
+            res, timings, delta = self._pool.submit(_html_task, html_bytes, original, tgt_etld1, timed,
+                                                    self._quarantined()).result()
+            if delta is not None:
+                self.rules.stats.merge(delta)
+        if timed:
+            self.metrics.observe_many(timings)
+        return res
+
+    def image(self, jpeg_bytes: bytes) -> ImageResult:
+        timed = self.metrics is not None
+        if self._pool is None:
+            timings: Timings = {}
+            res = analyse_image(jpeg_bytes, self.rules, timings if timed else None)
+        else:
+            res, timings, delta = self._pool.submit(_image_task, jpeg_bytes, timed, self._quarantined()).result()
+            if delta is not None:
+                self.rules.stats.merge(delta)
+        if timed:
+            self.metrics.observe_many(timings)
+        return res
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
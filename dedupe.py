@@ -1,39 +1,270 @@
 # waypack/dedupe.py
 from __future__ import annotations
+import base64
+import hashlib
+import os
+import sqlite3
+import zlib
 from collections import deque
-from datetime import datetime, timedelta
-from typing import Hashable
+from datetime import datetime
+from functools import lru_cache
+from typing import Hashable, Iterable, List, Any, Dict, Optional, Tuple
+
+def key_hash(key: Hashable) -> int:
+    """Stable 128-bit digest of a key (tuples of str/int/None), the same in every process and run."""
+    return int.from_bytes(hashlib.blake2b(repr(key).encode("utf-8", "surrogatepass"), digest_size=16).digest(), "big")
+
+@lru_cache(maxsize=65536)
+def day_ordinal(day_str: str) -> Optional[int]:
+    """'YYYY-MM-DD' -> proleptic ordinal; None if it doesn't parse."""
+    try:
+        return datetime.strptime(day_str, "%Y-%m-%d").toordinal()
+    except Exception:
+        return None
+
+_BLOOM_K = 5  # probes per key; ~1% false positives at ~10 bits per key
+
+class _Bloom:
+    __slots__ = ("bits", "m")
+
+    def __init__(self, nbytes: int, bits: Optional[bytearray] = None):
+        self.bits = bits if bits is not None else bytearray(nbytes)
+        self.m = len(self.bits) * 8
+
+    def _probes(self, h: int):
+        # double hashing over the two 64-bit halves of the key digest
+        a, b = h & 0xFFFFFFFFFFFFFFFF, (h >> 64) | 1
+        return [(a + i * b) % self.m for i in range(_BLOOM_K)]
+
+    def __contains__(self, h: int) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._probes(h))
+
+    def add(self, h: int):
+        bits = self.bits
+        for p in self._probes(h):
+            bits[p >> 3] |= 1 << (p & 7)
+
+class SeenStore:
+    """
+    Keys kept by earlier runs, for cron-style runs over overlapping date ranges: one SQLite table
+    of (namespace, 16-byte digest) -> (last day kept, run id). Lookups come in batches (prefetch)
+    and writes are buffered and upserted in one transaction per flush, so the export loop does
+    not wait on the database row by row. Rows written by the current run id are ignored on
+    lookup; within a run the in-memory SeenWindow (and its checkpoint) is the authority.
+    """
+    _CHUNK = 500  # digests per IN (...) query
+
+    def __init__(self, path: str, run_id: str):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.run_id = run_id
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS seen ("
+            " ns TEXT NOT NULL, h BLOB NOT NULL, day INTEGER, run TEXT NOT NULL,"
+            " PRIMARY KEY (ns, h)) WITHOUT ROWID")
+        self._db.commit()
+        self._pending: List[Tuple[str, bytes, Optional[int], str]] = []
+        self.lookups = 0
+        self.hits = 0
+
+    def lookup(self, ns: str, hashes: Iterable[int]) -> Dict[int, Optional[int]]:
+        """digest -> day it was last kept, for the given digests kept by earlier runs."""
+        keys = [h.to_bytes(16, "big") for h in hashes]
+        out: Dict[int, Optional[int]] = {}
+        for i in range(0, len(keys), self._CHUNK):
+            chunk = keys[i:i + self._CHUNK]
+            cur = self._db.execute(
+                f"SELECT h, day FROM seen WHERE ns = ? AND run != ? AND h IN ({','.join('?' * len(chunk))})",
+                (ns, self.run_id, *chunk))
+            for h, day in cur:
+                out[int.from_bytes(h, "big")] = day
+        self.lookups += len(keys)
+        self.hits += len(out)
+        return out
+
+    def add(self, ns: str, h: int, day: Optional[int]):
+        self._pending.append((ns, h.to_bytes(16, "big"), day, self.run_id))
+        if len(self._pending) >= 10000:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO seen (ns, h, day, run) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (ns, h) DO UPDATE SET day = excluded.day, run = excluded.run", self._pending)
+        self._pending.clear()
+
+    def close(self):
+        self.flush()
+        self._db.close()
 
 class SeenWindow:
-    """Sliding window deduper keyed by a hashable. Keeps last N days of keys."""
-    def __init__(self, days: int = 60):
+    """
+    Sliding window deduper keyed by a hashable. Keeps last N days of keys.
+
+    Keys are kept as 128-bit digests (key_hash) in day buckets; a whole bucket goes once its
+    day falls out of the window. mode="exact" gives the same answers as comparing the keys
+    themselves (buckets are runs of one day in arrival order, expired from the front only, so
+    out-of-order days behave as before). mode="bloom" keeps one Bloom filter per day sized from
+    max_bytes instead: memory is bounded no matter how many keys, at the cost of occasionally
+    treating a new key as seen. Every live day's filter is probed, so the false-"seen" rate is
+    roughly (live days) x (per-filter rate, ~1% at 10 bits per key): size the budget for it.
+    A key wrongly taken as seen is not recorded, so a later sighting of it inside the window may
+    be kept instead; a key that was kept is never kept again while its day is in the window.
+
+    With a SeenStore, keys that earlier runs kept within `days` of the current row's day count
+    as seen too (namespace `ns` keeps findings/EXIF/embeds and domains apart); call prefetch()
+    with a batch of digests before keeping them to look them up in one query.
+    """
+    def __init__(self, days: int = 60, mode: str = "exact", max_bytes: int = 64 << 20,
+                 store: Optional[SeenStore] = None, ns: str = ""):
         self.days = max(1, days)
-        self._q = deque()  # (date, key)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.store = store
+        self.ns = ns
+        self._prior: Dict[int, Optional[int]] = {}  # prefetched store answers for the current batch
+        self._asked: set = set()
+        self._q = deque()  # exact: [day_str, ordinal, [digests]] runs in arrival order
         self._set = set()
+        self._blooms: Dict[Optional[int], _Bloom] = {}  # bloom: ordinal -> filter
+        self._days: Dict[Optional[int], str] = {}  # bloom: ordinal -> day string (for snapshots)
+        self._cur: Optional[int] = None
+
+    def _bloom_bytes(self) -> int:
+        return max(64, self.max_bytes // (self.days + 2))
 
     def keep(self, day_str: str, key: Hashable) -> bool:
         """Return True if key not seen in window; record it. day_str = 'YYYY-MM-DD'."""
-        self._expire(day_str)
-        if key in self._set:
+        return self.keep_hash(day_str, key_hash(key))
+
+    def prefetch(self, hashes: Iterable[int]):
+        """Look up a batch of digests in the store at once; keep_hash() then answers from memory."""
+        if self.store is None:
+            return
+        todo = [h for h in hashes if h not in self._asked]
+        self._prior.update(self.store.lookup(self.ns, todo))
+        self._asked.update(todo)
+
+    def end_batch(self):
+        self._prior.clear()
+        self._asked.clear()
+
+    def _kept_before(self, cur: Optional[int], h: int) -> bool:
+        # kept by an earlier run close enough to this row's day (either side: that run may
+        # have covered later days); unparseable days count as seen, as in the window
+        if h in self._asked:
+            if h not in self._prior:
+                return False
+            prev = self._prior[h]
+        else:
+            found = self.store.lookup(self.ns, [h])
+            if h not in found:
+                return False
+            prev = found[h]
+        return prev is None or cur is None or prev >= cur - self.days
+
+    def keep_hash(self, day_str: str, h: int) -> bool:
+        """keep() for a key already digested with key_hash."""
+        cur = day_ordinal(day_str)
+        if cur is not None and cur != self._cur:
+            self._expire(cur)
+            self._cur = cur
+        if self.mode == "bloom":
+            if not self._keep_bloom(day_str, cur, h):
+                return False
+        elif h in self._set:
             return False
-        self._set.add(key)
-        self._q.append((day_str, key))
+        if self.store is not None:
+            if self._kept_before(cur, h):
+                return False
+            self.store.add(self.ns, h, cur)
+        if self.mode == "bloom":
+            return True
+        self._set.add(h)
+        q = self._q
+        if q and q[-1][0] == day_str:
+            q[-1][2].append(h)
+        else:
+            q.append([day_str, cur, [h]])
+        return True
+
+    def _keep_bloom(self, day_str: str, cur: Optional[int], h: int) -> bool:
+        for b in self._blooms.values():
+            if h in b:
+                return False
+        b = self._blooms.get(cur)
+        if b is None:
+            b = self._blooms[cur] = _Bloom(self._bloom_bytes())
+            self._days[cur] = day_str
+            if len(self._blooms) > self.days + 2:  # out-of-order days: drop the oldest to stay in budget
+                dated = [o for o in self._blooms if o is not None and o != cur]
+                if dated:
+                    del self._blooms[min(dated)], self._days[min(dated)]
+        b.add(h)
         return True
 
-    def _expire(self, day_str: str):
-        try:
-            cur = datetime.strptime(day_str, "%Y-%m-%d")
-        except Exception:
-            # If parse fails, don't expire to avoid accidental data loss
+    def _expire(self, cur: int):
+        cutoff = cur - self.days
+        if self.mode == "bloom":
+            for o in [o for o in self._blooms if o is not None and o < cutoff]:
+                del self._blooms[o], self._days[o]
             return
-        cutoff = cur - timedelta(days=self.days)
-        while self._q:
-            d, k = self._q[0]
-            try:
-                dd = datetime.strptime(d, "%Y-%m-%d")
-            except Exception:
-                dd = cur  # be conservative
-            if dd >= cutoff:
+        q = self._q
+        while q:
+            dd = q[0][1]
+            if dd is None or dd >= cutoff:  # unparseable days never expire (conservative)
                 break
-            self._q.popleft()
-            self._set.discard(k)
+            for h in q.popleft()[2]:
+                self._set.discard(h)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Window contents in JSON-friendly form (digests as hex / Bloom bits deflated + base64), for checkpoints."""
+        if self.mode == "bloom":
+            # filters are allocated at full size up front, so mostly-zero ones deflate to almost nothing
+            buckets = [[self._days[o], base64.b64encode(zlib.compress(b.bits, 1)).decode("ascii")]
+                       for o, b in self._blooms.items()]
+        else:
+            buckets = [[d, [format(h, "x") for h in keys]] for d, _o, keys in self._q]
+        return {"mode": self.mode, "cur": self._cur, "buckets": buckets}
+
+    def restore(self, snap: Dict[str, Any] | List[List[Any]]):
+        self._q.clear()
+        self._set.clear()
+        self._blooms.clear()
+        self._days.clear()
+        self._cur = None
+        if isinstance(snap, list):
+            # older checkpoints: [day, key] pairs with the keys themselves, oldest first
+            for d, k in snap:
+                h = key_hash(tuple(k) if isinstance(k, list) else k)
+                if self.mode == "bloom":
+                    self._keep_bloom(d, day_ordinal(d), h)
+                    continue
+                self._set.add(h)
+                if self._q and self._q[-1][0] == d:
+                    self._q[-1][2].append(h)
+                else:
+                    self._q.append([d, day_ordinal(d), [h]])
+            return
+        if snap.get("mode", "exact") != self.mode:
+            return  # resume checks refuse a mode change; never mix the two layouts
+        for d, payload in snap.get("buckets", []):
+            if self.mode == "bloom":
+                bits = bytearray(zlib.decompress(base64.b64decode(payload)))
+                o = day_ordinal(d)
+                self._blooms[o] = _Bloom(len(bits), bits)
+                self._days[o] = d
+            else:
+                keys = [int(x, 16) for x in payload]
+                self._q.append([d, day_ordinal(d), keys])
+                self._set.update(keys)
+        self._cur = snap.get("cur")
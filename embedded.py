@@ -1,39 +1,35 @@
 # waypack/embedded.py
 from __future__ import annotations
-import re
-from typing import Iterable, Dict, Any, Set
-from .urltools import absolutize, host, etld1
-
-# Tags to inspect for src/href
-_TAG_RE = re.compile(
-    r"<(?P<tag>iframe|embed|video|source|a)\b[^>]*?\s(?P<attr>src|href)\s*=\s*['\"](?P<url>[^'\"<>]+)['\"][^>]*>",
-    re.IGNORECASE
-)
-# Inline absolute URL finder (quick and loose)
-_URL_RE = re.compile(r"https?://[A-Za-z0-9._~:/?#\[\]@!$&'()*+,;=%-]+", re.IGNORECASE)
+from typing import AbstractSet, Iterable, Dict, Any, Optional
+from .htmlpass import HtmlScan, scan_html
+from .urltools import absolutize, classify_host
 
 def extract_embeds(
     html: str,
     base_original_url: str,
     target_etld1: str,
-    denylist: Set[str],
-    keep_keywords: Set[str],
+    denylist: AbstractSet[str],
+    keep_keywords: AbstractSet[str],
     sameparty: bool = False,
+    page: Optional[HtmlScan] = None,
 ) -> Iterable[Dict[str, Any]]:
+    # page: scan_html(html) result when the caller already made the pass (shared with OG parsing)
+    page = page or scan_html(html)
+    # denylist entries also cover subdomains; host classification is memoized across pages
+    deny = denylist if isinstance(denylist, frozenset) else frozenset(denylist)
     seen = set()
 
     # 1) Tag-based URLs
-    for m in _TAG_RE.finditer(html):
+    for m in page.tags:
         tag = m.group("tag").lower()
         urel = m.group("url")
         url = absolutize(base_original_url, urel)
-        h = host(url)
-        t = etld1(h) if h else None
-        if not h or not t:
+        h = page.url_host(url)
+        if not h:
             continue
-        if t in denylist or h in denylist:
+        t, denied, third_party = classify_host(h, target_etld1, deny)
+        if not t or denied:
             continue
-        third_party = (t != target_etld1)
         if not sameparty and not third_party:
             continue
         kept_reason = "third_party" if third_party else "sameparty"
@@ -52,15 +48,14 @@ def extract_embeds(
         }
 
     # 2) Inline absolute URLs
-    for m in _URL_RE.finditer(html):
+    for m in page.urls:
         url = m.group(0)
-        h = host(url)
-        t = etld1(h) if h else None
-        if not h or not t:
+        h = page.url_host(url)
+        if not h:
             continue
-        if t in denylist or h in denylist:
+        t, denied, third_party = classify_host(h, target_etld1, deny)
+        if not t or denied:
             continue
-        third_party = (t != target_etld1)
         if not sameparty and not third_party:
             continue
         kept_reason = "third_party"
@@ -1,8 +1,9 @@
 # waypack/exif_reader.py
 from __future__ import annotations
-from typing import Dict, Any, Optional
+import struct
+from typing import Dict, Any, Optional, Tuple
 
-# Pillow is optional; we fail soft if it's not installed
+# Pillow is optional; it is only the fallback for files the marker walker below can't make sense of
 try:
     from PIL import Image
     from PIL.ExifTags import TAGS, GPSTAGS
@@ -11,6 +12,154 @@ except Exception:  # pragma: no cover
     TAGS = {}
     GPSTAGS = {}
 
+KEEP_TAGS = {
+    "DateTimeOriginal", "Make", "Model", "Orientation", "Software", "Artist",
+    "Copyright", "ImageUniqueID", "XResolution", "YResolution",
+}
+
+# tag ids of the fields we keep, per IFD (names as in PIL.ExifTags)
+_IFD0_TAGS = {
+    0x010F: "Make", 0x0110: "Model", 0x0112: "Orientation", 0x011A: "XResolution", 0x011B: "YResolution",
+    0x0131: "Software", 0x013B: "Artist", 0x8298: "Copyright",
+}
+_EXIF_TAGS = {0x9003: "DateTimeOriginal", 0xA420: "ImageUniqueID"}
+_GPS_TAGS = {1: "GPSLatitudeRef", 2: "GPSLatitude", 3: "GPSLongitudeRef", 4: "GPSLongitude"}
+_EXIF_IFD_PTR = 0x8769
+_GPS_IFD_PTR = 0x8825
+
+# TIFF field type -> (struct code, size); 2 (ASCII) and 7 (UNDEFINED) are handled as byte strings
+_TYPES = {
+    1: ("B", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1), 7: ("s", 1),
+    8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8),
+}
+
+class _Odd(Exception):
+    """Structure we don't parse ourselves (broken markers, bad TIFF header/offsets, truncation)."""
+
+def _find_app1_exif(b: bytes) -> Tuple[Optional[bytes], int]:
+    """
+    Walk JPEG markers up to the first Exif APP1 or the start of scan data. Returns (TIFF payload
+    or None, offset where the walk stopped: end of that APP1, or the SOS/EOI marker).
+    """
+    if b[:2] != b"\xff\xd8":
+        return None, 0
+    i, n = 2, len(b)
+    while i + 4 <= n:
+        if b[i] != 0xFF:
+            raise _Odd("marker expected")
+        marker = b[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in (0xD9, 0xDA):  # EOI / SOS: no EXIF before the image data
+            return None, i
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:  # standalone markers
+            i += 2
+            continue
+        seglen = int.from_bytes(b[i + 2:i + 4], "big")
+        if seglen < 2:
+            raise _Odd("segment length")
+        if marker == 0xE1 and b[i + 4:i + 10] == b"Exif\0\0":
+            if i + 2 + seglen > n:
+                raise _Odd("truncated APP1")
+            return b[i + 10:i + 2 + seglen], i + 2 + seglen
+        i += 2 + seglen
+    raise _Odd("ran out before SOS")
+
+def exif_extent(b: bytes) -> Optional[int]:
+    """
+    How many leading bytes read_jpeg_exif_to_text needs, judged from a body prefix `b`: through
+    the end of the Exif APP1, or up to SOS/EOI when there is none (2 for a non-JPEG). None while
+    `b` is too short to tell, and always for broken structure (the Pillow fallback needs the
+    whole file).
+    """
+    if len(b) < 2:
+        return None
+    if b[:2] != b"\xff\xd8":
+        return 2
+    try:
+        return _find_app1_exif(b)[1]
+    except _Odd:
+        return None
+
+def _value(bo: str, typ: int, count: int, raw: bytes):
+    code, size = _TYPES[typ]
+    if typ in (2, 7):
+        data = raw[:count]
+        if data.endswith(b"\0"):
+            data = data[:-1]
+        return data.decode("latin-1", "replace")
+    if typ in (5, 10):
+        nums = struct.unpack(f"{bo}{2 * count}{code[0]}", raw[:size * count])
+        vals = tuple(float(nums[k]) / nums[k + 1] if nums[k + 1] else float("nan") for k in range(0, len(nums), 2))
+    else:
+        vals = struct.unpack(f"{bo}{count}{code}", raw[:size * count])
+    return vals[0] if count == 1 else vals
+
+def _read_ifd(t: bytes, bo: str, off: int, wanted: Dict[int, str], out: Dict[str, Any]) -> Tuple[Dict[int, int], int]:
+    """Decode the `wanted` entries of the IFD at `off` into out (by name); returns (sub-IFD pointers, entry count)."""
+    if off < 8 or off + 2 > len(t):
+        raise _Odd("IFD offset")
+    (count,) = struct.unpack(f"{bo}H", t[off:off + 2])
+    ptrs: Dict[int, int] = {}
+    for k in range(count):
+        e = off + 2 + 12 * k
+        if e + 12 > len(t):
+            raise _Odd("IFD entry")
+        tag, typ, cnt = struct.unpack(f"{bo}HHI", t[e:e + 8])
+        if tag in (_EXIF_IFD_PTR, _GPS_IFD_PTR):
+            ptrs[tag] = struct.unpack(f"{bo}I", t[e + 8:e + 12])[0]
+            continue
+        name = wanted.get(tag)
+        if name is None or typ not in _TYPES:
+            continue
+        size = _TYPES[typ][1] * cnt
+        if size <= 4:
+            raw = t[e + 8:e + 12]
+        else:
+            (voff,) = struct.unpack(f"{bo}I", t[e + 8:e + 12])
+            if voff + size > len(t):
+                raise _Odd("value offset")
+            raw = t[voff:voff + size]
+        out[name] = _value(bo, typ, cnt, raw)
+    return ptrs, count
+
+def _parse_exif(jpeg_bytes: bytes) -> Optional[Dict[str, Any]]:
+    """Kept IFD0/ExifIFD tags plus GPSInfo (by name), decoded straight from APP1; None if no EXIF entries."""
+    t = _find_app1_exif(jpeg_bytes)[0]
+    if t is None:
+        return None
+    if t[:4] == b"II*\0":
+        bo = "<"
+    elif t[:4] == b"MM\0*":
+        bo = ">"
+    else:
+        raise _Odd("TIFF header")
+    (ifd0,) = struct.unpack(f"{bo}I", t[4:8])
+    out: Dict[str, Any] = {}
+    ptrs, entries = _read_ifd(t, bo, ifd0, _IFD0_TAGS, out)
+    if _EXIF_IFD_PTR in ptrs:
+        entries += _read_ifd(t, bo, ptrs[_EXIF_IFD_PTR], _EXIF_TAGS, out)[1]
+    if _GPS_IFD_PTR in ptrs:
+        gps: Dict[str, Any] = {}
+        entries += _read_ifd(t, bo, ptrs[_GPS_IFD_PTR], _GPS_TAGS, gps)[1]
+        out["GPSInfo"] = gps
+    # like Pillow's _getexif: EXIF with no entries at all counts as none
+    return out if entries else None
+
+def _plain(v):
+    # Pillow values (IFDRational, bytes, nested tuples) -> JSON-safe equivalents
+    if isinstance(v, bytes):
+        return (v[:-1] if v.endswith(b"\0") else v).decode("latin-1", "replace")
+    if isinstance(v, (tuple, list)):
+        return tuple(_plain(x) for x in v)
+    if isinstance(v, (str, int, float)) or v is None:
+        return v
+    try:
+        return float(v)
+    except Exception:
+        return str(v)
+
 def _extract_exif_dict(img) -> Dict[str, Any]:
     exif = getattr(img, "_getexif", lambda: None)()
     if not exif:
@@ -28,40 +177,56 @@ def _extract_exif_dict(img) -> Dict[str, Any]:
         out["GPSInfo"] = gps
     return out
 
+def _pillow_exif(jpeg_bytes: bytes) -> Optional[Dict[str, Any]]:
+    if Image is None:
+        return None
+    from io import BytesIO
+    img = Image.open(BytesIO(jpeg_bytes))
+    if img.format != "JPEG":
+        return None
+    exif = _extract_exif_dict(img)
+    if not exif:
+        return None
+    if "GPSInfo" in exif and isinstance(exif["GPSInfo"], dict):
+        exif["GPSInfo"] = {k: _plain(v) for k, v in exif["GPSInfo"].items()}
+    return {k: (v if k == "GPSInfo" else _plain(v)) for k, v in exif.items()}
+
+def _num(x) -> float:
+    # (num, den) pairs (old Pillow) or anything float() understands
+    if isinstance(x, tuple) and len(x) == 2:
+        return float(x[0]) / x[1]
+    return float(x)
+
 def _to_decimal(coord, ref) -> Optional[float]:
     # Convert GPS coordinates (deg, min, sec) to decimal degrees
     try:
         d, m, s = coord
-        val = float(d[0]) / d[1] + float(m[0]) / m[1] / 60.0 + float(s[0]) / s[1] / 3600.0
+        val = _num(d) + _num(m) / 60.0 + _num(s) / 3600.0
         if ref in ("S", "W"):
             val = -val
         return val
     except Exception:
         return None
 
-KEEP_TAGS = {
-    "DateTimeOriginal", "Make", "Model", "Orientation", "Software", "Artist",
-    "Copyright", "ImageUniqueID", "XResolution", "YResolution",
-}
-
 def read_jpeg_exif_to_text(jpeg_bytes: bytes) -> Optional[Dict[str, Any]]:
     """
     Return a dict with 'exif_text' (flat key:value lines), 'tags' (kept fields),
-    and 'gps' (lat/lon) if EXIF present; None if no EXIF or Pillow missing.
+    and 'gps' (lat/lon) if EXIF present; None if no EXIF.
+
+    Only the APP1 segment is decoded (no image decode, no Pillow); files whose marker/TIFF
+    structure doesn't parse are handed to Pillow when it is installed. Tag values are plain
+    str/int/float (tuples for multi-valued fields), in file order.
     """
-    if Image is None:
-        return None
     try:
-        from io import BytesIO
-        img = Image.open(BytesIO(jpeg_bytes))
-        if img.format != "JPEG":
-            return None
-        exif = _extract_exif_dict(img)
-        if not exif:
+        try:
+            exif = _parse_exif(jpeg_bytes)
+        except (_Odd, struct.error):
+            exif = _pillow_exif(jpeg_bytes)
+        if exif is None:
             return None
 
         # pick kept tags
-        kept = {k: exif.get(k) for k in KEEP_TAGS if k in exif}
+        kept = {k: v for k, v in exif.items() if k in KEEP_TAGS}
         # GPS
         lat = lon = None
         gps = exif.get("GPSInfo")
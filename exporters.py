@@ -1,80 +1,618 @@
 # waypack/exporters.py
 from __future__ import annotations
-import csv, json, hashlib
-from typing import Dict, Any, Iterable, Tuple
-from .dedupe import SeenWindow
+import csv, gzip, io, json, hashlib, os, re, sqlite3, time
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Tuple, Callable, Hashable, List, Optional
+from .dedupe import SeenWindow, key_hash
+from .metrics import Metrics
 
 def sha256_hex(b: bytes) -> str:
     h = hashlib.sha256(); h.update(b); return h.hexdigest()
 
+FINDINGS_CSV_COLS = ["date","url","status","mime","bytes","rule_id","family","match","ctx_left","ctx_right"]
+EMBEDDED_CSV_COLS = ["date","source_url","record_type","embed_type","embedded_url","embedded_host","embedded_etld1","kept_reason"]
+
+# --- Incremental writers (used by the streaming pipeline and by write_* below) ---
+
+# optional codecs/formats; plain gzip and the stdlib columnar fallback always work
+try:
+    import zstandard
+except Exception:  # pragma: no cover
+    zstandard = None
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except Exception:  # pragma: no cover
+    pyarrow = None
+    pq = None
+
+_BATCH_ROWS = 512  # rows buffered per sink before they are serialized and written
+
+def _open_sink(path: str, append_at: Optional[int], **kw):
+    # resuming: cut off anything written after the checkpoint, then keep appending
+    if append_at is None:
+        return open(path, "w", encoding="utf-8", errors="replace", **kw)
+    with open(path, "r+b") as fh:
+        fh.truncate(append_at)
+    return open(path, "a", encoding="utf-8", errors="replace", **kw)
+
+def _codec(path: str) -> str:
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"{path}: writing .zst needs the zstandard package (or use .gz)")
+        return "zstd"
+    return ""
+
+class _SinkFile:
+    """
+    Text output file. Paths ending in .gz / .zst are compressed as a series of gzip members /
+    zstd frames, a new one started at every offset() call: concatenated members decode as one
+    stream, and a resume can cut the file back to a member boundary like a plain file.
+    """
+    def __init__(self, path: str, append_at: Optional[int], newline: Optional[str] = None):
+        self.path = path
+        self.codec = _codec(path)
+        self._newline = newline
+        if not self.codec:
+            self._fh = _open_sink(path, append_at, **({"newline": newline} if newline is not None else {}))
+            return
+        if append_at is not None:
+            with open(path, "r+b") as fh:
+                fh.truncate(append_at)
+        self._raw = open(path, "wb" if append_at is None else "ab")
+        self._member()
+
+    def _member(self):
+        if self.codec == "gzip":
+            z = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6, mtime=0)
+        else:
+            z = zstandard.ZstdCompressor(level=3).stream_writer(self._raw, closefd=False)
+        self._fh = io.TextIOWrapper(z, encoding="utf-8", errors="replace", newline=self._newline)
+
+    def write(self, s: str):
+        self._fh.write(s)
+
+    def flush(self):
+        # compressed output stays in the compressor until the next member boundary
+        if not self.codec:
+            self._fh.flush()
+
+    def offset(self) -> int:
+        if not self.codec:
+            self._fh.flush()
+            return self._fh.buffer.tell()
+        self._fh.close()  # ends the member/frame; the raw file stays open
+        self._raw.flush()
+        pos = self._raw.tell()
+        self._member()
+        return pos
+
+    def close(self):
+        self._fh.close()
+        if self.codec:
+            self._raw.close()
+
+class CsvSink:
+    """CSV writer that can be fed row by row; header is written on open (unless resuming at append_at)."""
+    def __init__(self, path: str, cols: List[str], append_at: Optional[int] = None):
+        self.path = path
+        self.cols = cols
+        self._fh = _SinkFile(path, append_at, newline="")
+        self._w = csv.writer(self._fh)
+        self._buf: List[List[Any]] = []
+        if append_at is None:
+            self._w.writerow(cols)
+
+    def write(self, r: Dict[str, Any]):
+        self._buf.append([r.get(k, "") for k in self.cols])
+        if len(self._buf) >= _BATCH_ROWS:
+            self._drain()
+
+    def _drain(self):
+        if self._buf:
+            self._w.writerows(self._buf)
+            self._buf.clear()
+
+    def flush(self):
+        self._drain()
+        self._fh.flush()
+
+    def offset(self) -> int:
+        """Byte offset of everything written so far (flushes first)."""
+        self._drain()
+        return self._fh.offset()
+
+    def close(self):
+        self._drain()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_encode = json.JSONEncoder(ensure_ascii=False).encode  # one encoder, not one per json.dumps call
+
+class JsonlSink:
+    """JSONL writer tagging every row with record_type (.gz / .zst paths are compressed)."""
+    def __init__(self, path: str, record_type: str, append_at: Optional[int] = None):
+        self.path = path
+        self.record_type = record_type
+        self._fh = _SinkFile(path, append_at)
+        self._head = "{" + _encode("record_type") + ": " + _encode(record_type)
+        self._buf: List[str] = []
+
+    def write(self, r: Dict[str, Any]):
+        if r and "record_type" not in r:
+            # same text as json.dumps({"record_type": ..., **r}) without building the merged dict
+            line = self._head + ", " + _encode(r)[1:]
+        else:
+            line = _encode({"record_type": self.record_type, **r})
+        self._buf.append(line)
+        if len(self._buf) >= _BATCH_ROWS:
+            self._drain()
+
+    def _drain(self):
+        if self._buf:
+            self._buf.append("")
+            self._fh.write("\n".join(self._buf))
+            self._buf.clear()
+
+    def flush(self):
+        self._drain()
+        self._fh.flush()
+
+    def offset(self) -> int:
+        self._drain()
+        return self._fh.offset()
+
+    def close(self):
+        self._drain()
+        self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Columnar export ---
+
+# Column layout per output, defined once: (column, type, row field). Types are "str", "int",
+# "float" and "json" (nested values as JSON text); "a.b" reads r["a"]["b"].
+FINDINGS_SCHEMA = [
+    ("date", "str", "date"), ("url", "str", "url"), ("status", "int", "status"), ("mime", "str", "mime"),
+    ("bytes", "int", "bytes"), ("file_digest", "str", "file_digest"), ("image_digest", "str", "image_digest"),
+    ("rule_id", "str", "rule_id"), ("family", "str", "family"), ("match", "str", "match"),
+    ("ctx_left", "str", "ctx_left"), ("ctx_right", "str", "ctx_right"), ("source", "str", "source"),
+]
+EXIF_SCHEMA = [
+    ("date", "str", "date"), ("src_type", "str", "src_type"), ("image_url", "str", "image_url"),
+    ("image_bytes", "int", "image_bytes"), ("exif", "json", "exif"), ("gps_lat", "float", "gps.lat"),
+    ("gps_lon", "float", "gps.lon"), ("exif_text", "str", "exif_text"), ("image_digest", "str", "image_digest"),
+]
+EMBEDDED_SCHEMA = [
+    ("date", "str", "date"), ("source_url", "str", "source_url"), ("embed_type", "str", "embed_type"),
+    ("embedded_url", "str", "embedded_url"), ("embedded_host", "str", "embedded_host"),
+    ("embedded_etld1", "str", "embedded_etld1"), ("kept_reason", "str", "kept_reason"),
+]
+DOMAIN_COLUMN = ("domain", "str", "domain")  # leading column in batch runs, like the CSV outputs
+
+def _getter(field: str) -> Callable[[Dict[str, Any]], Any]:
+    if "." not in field:
+        return lambda r: r.get(field)
+    outer, inner = field.split(".", 1)
+    return lambda r: (r.get(outer) or {}).get(inner)
+
+def _conv(typ: str) -> Callable[[Any], Any]:
+    if typ == "json":
+        return lambda v: None if v is None else _encode(v)
+    if typ == "int":
+        return lambda v: None if v is None or v == "" else int(v)
+    if typ == "float":
+        return lambda v: None if v is None or v == "" else float(v)
+    return lambda v: None if v is None else str(v)
+
+def columnar_format(fmt: str = "auto") -> str:
+    """Resolve --columnar-format: "parquet" needs pyarrow; "auto" falls back to the stdlib format."""
+    if fmt == "parquet" and pyarrow is None:
+        raise RuntimeError("--columnar-format parquet needs pyarrow (pip install pyarrow)")
+    if fmt == "auto":
+        return "parquet" if pyarrow is not None else "stdlib"
+    return fmt
+
+_PART_RE = re.compile(r"part-(\d{5,})\.parquet")  # the names _chunk writes; other files are not ours
+
+class ColumnarSink:
+    """
+    Column-oriented copy of one output. Rows are buffered into per-column lists and written as a
+    chunk every `chunk_rows` rows and at each offset() (checkpoint), so a resume can drop
+    whatever came after the last one.
+
+    parquet: `path` is a dataset directory of part-NNNNN.parquet files, one per chunk (load it
+    with pyarrow.dataset / pandas.read_parquet). stdlib: `path` is a gzip file of JSON lines,
+    one per chunk: {"rows": n, "columns": {name: [values...]}} (see read_columnar).
+    """
+    def __init__(self, path: str, schema: List[Tuple[str, str, str]], fmt: str = "stdlib",
+                 append_at: Optional[int] = None, chunk_rows: int = 65536):
+        self.path = path
+        self.fmt = fmt
+        self.schema = schema
+        self.chunk_rows = max(1, chunk_rows)
+        self._get = [_getter(f) for _n, _t, f in schema]
+        self._conv = [_conv(t) for _n, t, _f in schema]
+        self._cols: List[List[Any]] = [[] for _ in schema]
+        self._n = 0
+        if fmt == "parquet":
+            types = {"str": pyarrow.string(), "int": pyarrow.int64(), "float": pyarrow.float64(),
+                     "json": pyarrow.string()}
+            self._pa_schema = pyarrow.schema([(n, types[t]) for n, t, _f in schema])
+            os.makedirs(path, exist_ok=True)
+            self._parts = append_at or 0
+            # resuming: parts written after the checkpoint are dropped (other files are left alone)
+            for name in os.listdir(path):
+                m = _PART_RE.fullmatch(name)
+                if m and int(m.group(1)) >= self._parts:
+                    os.remove(os.path.join(path, name))
+        else:
+            self._fh = _SinkFile(path if path.endswith(".gz") else path + ".gz", append_at)
+            self.path = self._fh.path
+
+    def write(self, r: Dict[str, Any]):
+        for col, get in zip(self._cols, self._get):
+            col.append(get(r))
+        self._n += 1
+        if self._n >= self.chunk_rows:
+            self._chunk()
+
+    def _chunk(self):
+        if not self._n:
+            return
+        cols = [[conv(v) for v in col] for col, conv in zip(self._cols, self._conv)]
+        if self.fmt == "parquet":
+            table = pyarrow.Table.from_arrays([pyarrow.array(c, type=f.type) for c, f in zip(cols, self._pa_schema)],
+                                              schema=self._pa_schema)
+            pq.write_table(table, os.path.join(self.path, f"part-{self._parts:05d}.parquet"), compression="zstd")
+            self._parts += 1
+        else:
+            self._fh.write(_encode({"rows": self._n, "columns": {n: c for (n, _t, _f), c in zip(self.schema, cols)}}) + "\n")
+        for col in self._cols:
+            col.clear()
+        self._n = 0
+
+    def flush(self):
+        pass  # chunks are cut by size and at checkpoints, not per record
+
+    def offset(self) -> int:
+        """Resume position: parts written (parquet) or the byte offset of the last chunk (stdlib)."""
+        self._chunk()
+        return self._parts if self.fmt == "parquet" else self._fh.offset()
+
+    def close(self):
+        self._chunk()
+        if self.fmt != "parquet":
+            self._fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_columnar(path: str) -> Iterable[Dict[str, List[Any]]]:
+    """Chunks of a stdlib columnar file as {column: values} dicts."""
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)["columns"]
+
+# --- SQLite output ---
+
+# Normalized layout: one row per capture (page or image at a date), rule families in `rules`, and
+# the three outputs referencing them. Natural keys are UNIQUE so every write can be an upsert.
+_SQLITE_DDL = """
+CREATE TABLE IF NOT EXISTS runs (run_id TEXT PRIMARY KEY, started TEXT);
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY, url TEXT NOT NULL, date TEXT NOT NULL, domain TEXT,
+    status INTEGER, mime TEXT, bytes INTEGER, digest TEXT,
+    UNIQUE (url, date));
+CREATE TABLE IF NOT EXISTS rules (rule_id TEXT PRIMARY KEY, family TEXT);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY, capture_id INTEGER NOT NULL REFERENCES captures (id),
+    rule_id TEXT NOT NULL REFERENCES rules (rule_id), match TEXT NOT NULL, source TEXT NOT NULL,
+    ctx_left TEXT, ctx_right TEXT, first_run TEXT, last_run TEXT,
+    UNIQUE (capture_id, rule_id, match, source));
+CREATE TABLE IF NOT EXISTS exif (
+    id INTEGER PRIMARY KEY, capture_id INTEGER NOT NULL REFERENCES captures (id),
+    src_type TEXT, exif TEXT, gps_lat REAL, gps_lon REAL, exif_text TEXT, first_run TEXT, last_run TEXT,
+    UNIQUE (capture_id));
+CREATE TABLE IF NOT EXISTS embedded_links (
+    id INTEGER PRIMARY KEY, capture_id INTEGER NOT NULL REFERENCES captures (id),
+    embed_type TEXT NOT NULL, embedded_url TEXT NOT NULL, embedded_host TEXT, embedded_etld1 TEXT,
+    kept_reason TEXT, first_run TEXT, last_run TEXT,
+    UNIQUE (capture_id, embed_type, embedded_url));
+CREATE INDEX IF NOT EXISTS captures_date ON captures (date);
+CREATE INDEX IF NOT EXISTS captures_domain_date ON captures (domain, date);
+CREATE INDEX IF NOT EXISTS captures_digest ON captures (digest);
+CREATE INDEX IF NOT EXISTS rules_family ON rules (family);
+CREATE INDEX IF NOT EXISTS findings_rule ON findings (rule_id);
+CREATE INDEX IF NOT EXISTS embedded_etld1 ON embedded_links (embedded_etld1);
+CREATE VIEW IF NOT EXISTS findings_v AS
+    SELECT c.domain, c.date, c.url, c.status, c.mime, c.bytes, c.digest, f.rule_id, r.family,
+           f.match, f.ctx_left, f.ctx_right, f.source, f.first_run, f.last_run
+    FROM findings f JOIN captures c ON c.id = f.capture_id LEFT JOIN rules r ON r.rule_id = f.rule_id;
+CREATE VIEW IF NOT EXISTS exif_v AS
+    SELECT c.domain, c.date, x.src_type, c.url AS image_url, c.bytes AS image_bytes, c.digest AS image_digest,
+           x.exif, x.gps_lat, x.gps_lon, x.exif_text, x.first_run, x.last_run
+    FROM exif x JOIN captures c ON c.id = x.capture_id;
+CREATE VIEW IF NOT EXISTS embedded_v AS
+    SELECT c.domain, c.date, c.url AS source_url, e.embed_type, e.embedded_url, e.embedded_host,
+           e.embedded_etld1, e.kept_reason, e.first_run, e.last_run
+    FROM embedded_links e JOIN captures c ON c.id = e.capture_id;
+"""
+
+# a capture upsert only fills in what it knows: an embed row knows its page's URL and date, the
+# finding from the same page also knows status/mime/bytes/digest
+_CAPTURE_SQL = (
+    "INSERT INTO captures (url, date, domain, status, mime, bytes, digest) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (url, date) DO UPDATE SET domain = COALESCE(excluded.domain, domain),"
+    " status = COALESCE(excluded.status, status), mime = COALESCE(excluded.mime, mime),"
+    " bytes = COALESCE(excluded.bytes, bytes), digest = COALESCE(excluded.digest, digest)")
+_CAPTURE_ID = "(SELECT id FROM captures WHERE url = ? AND date = ?)"
+_RULE_SQL = ("INSERT INTO rules (rule_id, family) VALUES (?, ?)"
+             " ON CONFLICT (rule_id) DO UPDATE SET family = COALESCE(excluded.family, family)")
+_ROW_SQL = {
+    "findings": (
+        f"INSERT INTO findings (capture_id, rule_id, match, source, ctx_left, ctx_right, first_run, last_run)"
+        f" VALUES ({_CAPTURE_ID}, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT (capture_id, rule_id, match, source) DO UPDATE SET"
+        " ctx_left = excluded.ctx_left, ctx_right = excluded.ctx_right, last_run = excluded.last_run"),
+    "exif": (
+        f"INSERT INTO exif (capture_id, src_type, exif, gps_lat, gps_lon, exif_text, first_run, last_run)"
+        f" VALUES ({_CAPTURE_ID}, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT (capture_id) DO UPDATE SET src_type = excluded.src_type, exif = excluded.exif,"
+        " gps_lat = excluded.gps_lat, gps_lon = excluded.gps_lon, exif_text = excluded.exif_text,"
+        " last_run = excluded.last_run"),
+    "embedded": (
+        f"INSERT INTO embedded_links (capture_id, embed_type, embedded_url, embedded_host, embedded_etld1,"
+        f" kept_reason, first_run, last_run) VALUES ({_CAPTURE_ID}, ?, ?, ?, ?, ?, ?, ?)"
+        " ON CONFLICT (capture_id, embed_type, embedded_url) DO UPDATE SET embedded_host = excluded.embedded_host,"
+        " embedded_etld1 = excluded.embedded_etld1, kept_reason = excluded.kept_reason, last_run = excluded.last_run"),
+}
+
+def _sql_rows(kind: str, r: Dict[str, Any], domain: Optional[str], run: str) -> Tuple[Tuple, Tuple]:
+    """(captures row, output row) for one exported row."""
+    day = r.get("date") or ""
+    if kind == "findings":
+        url = r.get("url") or ""
+        return ((url, day, domain, r.get("status"), r.get("mime"), r.get("bytes"),
+                 r.get("file_digest") or r.get("image_digest")),
+                (url, day, r.get("rule_id") or "", r.get("match") or "", r.get("source") or "",
+                 r.get("ctx_left"), r.get("ctx_right"), run, run))
+    if kind == "exif":
+        url = r.get("image_url") or ""
+        gps = r.get("gps") or {}
+        return ((url, day, domain, None, None, r.get("image_bytes"), r.get("image_digest")),
+                (url, day, r.get("src_type"), _encode(r.get("exif") or {}), gps.get("lat"), gps.get("lon"),
+                 r.get("exif_text"), run, run))
+    url = r.get("source_url") or ""
+    return ((url, day, domain, None, None, None, None),
+            (url, day, r.get("embed_type") or "", r.get("embedded_url") or "", r.get("embedded_host"),
+             r.get("embedded_etld1"), r.get("kept_reason"), run, run))
+
+class SqliteOutput:
+    """
+    One SQLite database (WAL) holding a run's findings, EXIF rows and embedded links in
+    normalized tables; the findings_v / exif_v / embedded_v views give the flat rows back.
+    Writes are buffered per output and upserted with executemany, one transaction per batch, so
+    pointing daily runs at the same file appends to it: rows already there (same capture and
+    natural key) are updated and get the new run id in last_run instead of being duplicated.
+    """
+    def __init__(self, path: str, run_id: str = "", batch_rows: int = 2000):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.run_id = run_id
+        self.batch_rows = max(1, batch_rows)
+        self.rows = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SQLITE_DDL)
+        with self._db:
+            self._db.execute("INSERT OR IGNORE INTO runs (run_id, started) VALUES (?, ?)",
+                             (run_id, datetime.now(timezone.utc).isoformat(timespec="seconds")))
+
+    def sink(self, kind: str, domain: str = "") -> SqliteSink:
+        """Sink for one output ("findings", "exif" or "embedded"); rows without a domain field get `domain`."""
+        return SqliteSink(self, kind, domain)
+
+    def upsert(self, kind: str, rows: List[Dict[str, Any]], domain: str = ""):
+        captures, out = [], []
+        for r in rows:
+            c, o = _sql_rows(kind, r, r.get("domain") or domain or None, self.run_id)
+            captures.append(c)
+            out.append(o)
+        with self._db:
+            self._db.executemany(_CAPTURE_SQL, captures)
+            if kind == "findings":
+                self._db.executemany(_RULE_SQL, {(r.get("rule_id") or "", r.get("family")) for r in rows})
+            self._db.executemany(_ROW_SQL[kind], out)
+        self.rows += len(rows)
+
+    def close(self):
+        self._db.close()
+
+class SqliteSink:
+    """
+    Sink-protocol front for one output of a SqliteOutput. There is nothing to cut back on
+    resume: rows replayed after the last checkpoint upsert onto themselves.
+    """
+    def __init__(self, db: SqliteOutput, kind: str, domain: str = ""):
+        self.db = db
+        self.kind = kind
+        self.domain = domain
+        self.path = f"{db.path}#{kind}" + (f":{domain}" if domain else "")
+        self.rows = 0
+        self._buf: List[Dict[str, Any]] = []
+
+    def write(self, r: Dict[str, Any]):
+        self._buf.append(r)
+        if len(self._buf) >= self.db.batch_rows:
+            self._drain()
+
+    def _drain(self):
+        if self._buf:
+            self.db.upsert(self.kind, self._buf, self.domain)
+            self.rows += len(self._buf)
+            self._buf.clear()
+
+    def flush(self):
+        pass  # batches are cut by size and at checkpoints, not per record
+
+    def offset(self) -> int:
+        """Rows committed so far (informational; resume doesn't need a position)."""
+        self._drain()
+        return self.rows
+
+    def close(self):
+        self._drain()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class DedupedOutput:
+    """
+    Online window dedupe in front of one or more sinks. Rows must be fed in the
+    same order the batch dedupe_* functions would see them (CDX record order).
+    """
+    def __init__(self, key_fn: Callable[[Dict[str, Any]], Hashable], scope_days: int = 60, sinks: Iterable[Any] = (),
+                 seen: Optional[SeenWindow] = None, metrics: Optional[Metrics] = None):
+        self.key_fn = key_fn
+        self.seen = seen if seen is not None else SeenWindow(days=scope_days)
+        self.sinks = list(sinks)
+        self.metrics = metrics
+        self.seen_rows = 0
+        self.kept_rows = 0
+
+    def add(self, r: Dict[str, Any]) -> bool:
+        if not self._keep(r, key_hash(self.key_fn(r))):
+            return False
+        for s in self.sinks:
+            s.write(r)
+        return True
+
+    def add_many(self, rows: List[Dict[str, Any]]) -> int:
+        """add() for a batch (one record's rows); a persistent store is asked about all keys in one go."""
+        t0 = time.perf_counter()
+        keyed = [(r, key_hash(self.key_fn(r))) for r in rows]
+        self.seen.prefetch(h for _r, h in keyed)
+        kept = [r for r, h in keyed if self._keep(r, h)]
+        self.seen.end_batch()
+        t1 = time.perf_counter()
+        for r in kept:
+            for s in self.sinks:
+                s.write(r)
+        if self.metrics is not None:
+            self.metrics.observe("dedupe", t1 - t0)
+            self.metrics.observe("export", time.perf_counter() - t1)
+        return len(kept)
+
+    def _keep(self, r: Dict[str, Any], h: int) -> bool:
+        self.seen_rows += 1
+        if not self.seen.keep_hash(r.get("date") or "", h):
+            return False
+        self.kept_rows += 1
+        return True
+
+    def flush(self):
+        for s in self.sinks:
+            s.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Dedupe window + counters + sink offsets, enough to resume writing exactly here."""
+        return {
+            "window": self.seen.snapshot(),
+            "seen_rows": self.seen_rows,
+            "kept_rows": self.kept_rows,
+            "offsets": {s.path: s.offset() for s in self.sinks},
+        }
+
+    def restore(self, snap: Dict[str, Any]):
+        self.seen.restore(snap.get("window", []))
+        self.seen_rows = snap.get("seen_rows", 0)
+        self.kept_rows = snap.get("kept_rows", 0)
+
+    def close(self):
+        for s in self.sinks:
+            s.close()
+
 # --- Findings (regex hits) ---
 
+def finding_key(r: Dict[str, Any]) -> Tuple:
+    # prefer URL digest if present, else URL itself
+    return (r.get("rule_id"), r.get("match"), r.get("url"))
+
 def write_findings_csv(path: str, rows: Iterable[Dict[str, Any]]):
-    cols = ["date","url","status","mime","bytes","rule_id","family","match","ctx_left","ctx_right"]
-    with open(path, "w", newline="", encoding="utf-8", errors="replace") as fh:
-        w = csv.DictWriter(fh, fieldnames=cols)
-        w.writeheader()
+    with CsvSink(path, FINDINGS_CSV_COLS) as s:
         for r in rows:
-            w.writerow({k: r.get(k, "") for k in cols})
+            s.write(r)
 
 def write_findings_jsonl(path: str, rows: Iterable[Dict[str, Any]]):
-    with open(path, "w", encoding="utf-8", errors="replace") as fh:
+    with JsonlSink(path, "finding") as s:
         for r in rows:
-            fh.write(json.dumps({
-                "record_type":"finding",
-                **r
-            }, ensure_ascii=False) + "\n")
+            s.write(r)
 
 def dedupe_findings(rows: Iterable[Dict[str, Any]], scope_days: int = 60) -> Iterable[Dict[str, Any]]:
     seen = SeenWindow(days=scope_days)
     for r in rows:
-        # prefer URL digest if present, else URL itself
-        key = (r.get("rule_id"), r.get("match"), r.get("url"))
         day = r.get("date") or ""
-        if seen.keep(day, key):
+        if seen.keep(day, finding_key(r)):
             yield r
 
 # --- EXIF JSONL ---
 
+def exif_key(r: Dict[str, Any]) -> Tuple:
+    # use image_url or image_digest if available
+    return (r.get("image_url"), r.get("image_digest"))
+
 def write_exif_jsonl(path: str, rows: Iterable[Dict[str, Any]]):
-    with open(path, "w", encoding="utf-8", errors="replace") as fh:
+    with JsonlSink(path, "exif") as s:
         for r in rows:
-            fh.write(json.dumps({
-                "record_type":"exif",
-                **r
-            }, ensure_ascii=False) + "\n")
+            s.write(r)
 
 def dedupe_exif(rows: Iterable[Dict[str, Any]], scope_days: int = 60) -> Iterable[Dict[str, Any]]:
     seen = SeenWindow(days=scope_days)
     for r in rows:
-        # use image_url or image_digest if available
-        key = (r.get("image_url"), r.get("image_digest"))
         day = r.get("date") or ""
-        if seen.keep(day, key):
+        if seen.keep(day, exif_key(r)):
             yield r
 
 # --- Embedded links ---
 
+def embedded_key(r: Dict[str, Any]) -> Tuple:
+    return (r.get("embedded_etld1"), r.get("embedded_host"), (r.get("embedded_url") or "")[:128], r.get("embed_type"))
+
 def write_embedded_csv(path: str, rows: Iterable[Dict[str, Any]]):
-    cols = ["date","source_url","record_type","embed_type","embedded_url","embedded_host","embedded_etld1","kept_reason"]
-    with open(path, "w", newline="", encoding="utf-8", errors="replace") as fh:
-        w = csv.DictWriter(fh, fieldnames=cols)
-        w.writeheader()
+    with CsvSink(path, EMBEDDED_CSV_COLS) as s:
         for r in rows:
-            w.writerow({k: r.get(k, "") for k in cols})
+            s.write(r)
 
 def write_embedded_jsonl(path: str, rows: Iterable[Dict[str, Any]]):
-    with open(path, "w", encoding="utf-8", errors="replace") as fh:
+    with JsonlSink(path, "embedded_link") as s:
         for r in rows:
-            fh.write(json.dumps({
-                "record_type":"embedded_link",
-                **r
-            }, ensure_ascii=False) + "\n")
+            s.write(r)
 
 def dedupe_embedded(rows: Iterable[Dict[str, Any]], scope_days: int = 60) -> Iterable[Dict[str, Any]]:
     seen = SeenWindow(days=scope_days)
     for r in rows:
-        key = (r.get("embedded_etld1"), r.get("embedded_host"), (r.get("embedded_url") or "")[:128], r.get("embed_type"))
         day = r.get("date") or ""
-        if seen.keep(day, key):
+        if seen.keep(day, embedded_key(r)):
             yield r
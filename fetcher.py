@@ -1,39 +1,91 @@
 # waypack/fetcher.py
 from __future__ import annotations
+import re
 import time
 import requests
 from dataclasses import dataclass
+from typing import Callable
+from requests.adapters import HTTPAdapter
+
+from .httpcache import ResponseCache
+from .metrics import Metrics
+from .ratelimit import RateLimiter
 
 WAYBACK_PREFIX = "https://web.archive.org/web"
+_ID_REPLAY_RE = re.compile(r"\d{4,14}id_/")
 
 @dataclass
 class FetchResult:
     ok: bool
     status: int
     mime: str | None
-    data: bytes | None
+    data: bytes | bytearray | None  # the fetch buffer itself (bytearray) for network reads; not copied
     url: str
     error: str | None = None
     bytes_read: int = 0
+    total_bytes: int | None = None  # full body size when only a prefix was read (get_prefix)
+
+    @property
+    def size(self) -> int:
+        """Size of the whole resource, even when `data` is just its head."""
+        return self.total_bytes if self.total_bytes is not None else self.bytes_read
+
+def _total_size(r) -> int | None:
+    # 206: "Content-Range: bytes 0-65535/123456"; 200: Content-Length; None if the server doesn't say
+    if r.status_code == 206:
+        tail = (r.headers.get("Content-Range") or "").rpartition("/")[2].strip()
+        return int(tail) if tail.isdigit() else None
+    cl = (r.headers.get("Content-Length") or "").strip()
+    return int(cl) if cl.isdigit() else None
+
+_ZEROS = memoryview(bytes(1 << 20))  # buffers grow from this block, not from a fresh zero buffer each time
+
+def _grow(buf: bytearray, n: int):
+    while n > 0:
+        step = min(n, len(_ZEROS))
+        buf += _ZEROS[:step]
+        n -= step
+
+_HEAD_KEY = "#head"  # cache key suffix for get_prefix heads; body = 8-byte full size + head
+
+def _cut(r: FetchResult, extent: Callable[[bytes], int | None]) -> FetchResult:
+    """A full-body result as get_prefix returns it: data cut to extent(data), full size kept."""
+    if not r.ok or not r.data:
+        return r
+    need = extent(r.data)
+    data = bytes(r.data[:need]) if need is not None else bytes(r.data)
+    return FetchResult(True, r.status, r.mime, data, r.url, None, len(data), r.size)
 
 class Fetcher:
-    def __init__(self, rps: float = 2.0, timeout: int = 15, max_bytes: int = 5_000_000, retries: int = 3, user_agent: str | None = None):
-        self.rps = max(0.1, rps)
-        self._min_interval = 1.0 / self.rps
-        self._last = 0.0
+    def __init__(self, rps: float = 2.0, timeout: int = 15, max_bytes: int = 5_000_000, retries: int = 3, user_agent: str | None = None,
+                 limiter: RateLimiter | None = None, pool_size: int = 10, cache: ResponseCache | None = None,
+                 read_size: int = 65536, metrics: Metrics | None = None):
+        # limiter may be shared with other fetchers/threads so they all draw from one rps budget
+        self.limiter = limiter or RateLimiter(rps)
+        self.rps = self.limiter.rps
         self.timeout = timeout
         self.max_bytes = max_bytes
         self.retries = retries
+        self.cache = cache
+        self.read_size = max(1024, read_size)
+        self.metrics = metrics
         self.sess = requests.Session()
+        # size the connection pool for the number of concurrent workers
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.sess.mount("https://", adapter)
+        self.sess.mount("http://", adapter)
         if user_agent:
             self.sess.headers.update({"User-Agent": user_agent})
 
     def _throttle(self):
-        now = time.time()
-        delta = now - self._last
-        if delta < self._min_interval:
-            time.sleep(self._min_interval - delta)
-        self._last = time.time()
+        slept = self.limiter.wait()
+        if self.metrics is not None:
+            self.metrics.observe("throttle", slept)
+
+    def _timed(self, t0: float, t_headers: float, nbytes: int):
+        if self.metrics is not None:
+            self.metrics.observe("fetch_ttfb", t_headers - t0)
+            self.metrics.observe("fetch", time.perf_counter() - t0, nbytes)
 
     @staticmethod
     def to_archive_url(timestamp: str, original: str, id_mode: bool = True) -> str:
@@ -41,28 +93,164 @@ class Fetcher:
         suffix = "id_" if id_mode else ""
         return f"{WAYBACK_PREFIX}/{timestamp}{suffix}/{original}"
 
+    @staticmethod
+    def is_immutable(url: str) -> bool:
+        """id_ replays of a fixed timestamp never change, so they are safe to cache forever."""
+        return url.startswith(WAYBACK_PREFIX + "/") and _ID_REPLAY_RE.match(url, len(WAYBACK_PREFIX) + 1) is not None
+
+    def _cached(self, url: str) -> FetchResult | None:
+        if self.cache is None or not self.is_immutable(url):
+            return None
+        hit = self.cache.get(url)
+        if hit is None:
+            return None
+        data = hit.body if hit.status == 200 else None
+        size = len(data or b"")
+        if size > self.max_bytes:
+            return FetchResult(False, hit.status, hit.mime, None, url, error="too_large", bytes_read=size)
+        return FetchResult(hit.status == 200, hit.status, hit.mime, data, url, None, size)
+
     def get(self, url: str) -> FetchResult:
-        """Stream a URL with caps + retries."""
+        """Stream a URL with caps + retries. Cache hits return without touching the rate limiter."""
+        cacheable = self.cache is not None and self.is_immutable(url)
+        hit = self._cached(url)
+        if hit is not None:
+            return hit
+        r = self._get_network(url)
+        # keep successes and permanent misses; errors/too_large/5xx are retried next run
+        if cacheable and (r.ok or r.status in (404, 410)):
+            self.cache.put(url, r.status, r.mime, r.data if r.ok else None)
+        return r
+
+    def get_prefix(self, url: str, extent: Callable[[bytes], int | None], range_bytes: int = 65536) -> FetchResult:
+        """
+        Fetch just the head of a body: ask for bytes 0..range_bytes-1 and, if the server ignores
+        Range, stop streaming as soon as extent(head) says how many leading bytes are needed.
+        `data` is exactly body[:extent(body)] (the whole body if extent never answers), however
+        it was obtained: network head, full-body fallback for heads that don't fit the range, or
+        a cached full body. `total_bytes` is the full size from Content-Range/Content-Length
+        (counted by reading on if neither is sent), so size bounds still apply. Heads are cached
+        under their own key (url + "#head") next to any full bodies.
+        """
+        cacheable = self.cache is not None and self.is_immutable(url)
+        if cacheable:
+            hit = self.cache.get(url + _HEAD_KEY)
+            if hit is not None and hit.body is not None and len(hit.body) >= 8:
+                total = int.from_bytes(hit.body[:8], "big")
+                if total > self.max_bytes:
+                    return FetchResult(False, hit.status, hit.mime, None, url, error="too_large", bytes_read=total)
+                head = hit.body[8:]
+                return FetchResult(True, hit.status, hit.mime, head, url, None, len(head), total)
+        hit = self._cached(url)
+        if hit is not None:
+            return _cut(hit, extent)
+        r = self._get_head_network(url, extent, range_bytes)
+        if r is None:
+            return _cut(self.get(url), extent)
+        if cacheable:
+            if r.ok:
+                self.cache.put(url + _HEAD_KEY, r.status, r.mime, r.size.to_bytes(8, "big") + r.data)
+            elif r.status in (404, 410):
+                self.cache.put(url, r.status, r.mime, None)
+        return r
+
+    def _get_head_network(self, url: str, extent: Callable[[bytes], int | None],
+                          range_bytes: int) -> FetchResult | None:
+        """Network half of get_prefix; None when the head is bigger than the range (take the full body)."""
         error = None
         for attempt in range(self.retries):
             try:
                 self._throttle()
+                t0 = time.perf_counter()
+                with self.sess.get(url, stream=True, timeout=self.timeout,
+                                   headers={"Range": f"bytes=0-{range_bytes - 1}"}) as r:
+                    t_headers = time.perf_counter()
+                    mime = r.headers.get("Content-Type")
+                    status = r.status_code
+                    if status not in (200, 206):
+                        return FetchResult(False, status, mime, None, url, error=None, bytes_read=0)
+                    mime = mime.split(";")[0].strip() if mime else None
+                    total = _total_size(r)
+                    if total is not None and total > self.max_bytes:
+                        return FetchResult(False, status, mime, None, url, error="too_large", bytes_read=total)
+                    head = bytearray()
+                    need = None
+                    read = 0
+                    for chunk in r.iter_content(chunk_size=self.read_size):
+                        if not chunk:
+                            continue
+                        read += len(chunk)
+                        if read > self.max_bytes:
+                            return FetchResult(False, status, mime, None, url, error="too_large", bytes_read=read)
+                        if need is None:
+                            head += chunk
+                            need = extent(head)
+                        if need is not None and total is not None:
+                            break
+                    if status == 206 and need is None and (total is None or len(head) < total):
+                        return None  # head is bigger than the range (or odd file)
+                    if need is not None:
+                        del head[need:]
+                    self._timed(t0, t_headers, read)
+                    return FetchResult(True, status, mime, bytes(head), url, None, len(head),
+                                       total if total is not None else read)
+            except Exception as e:
+                error = str(e)
+                time.sleep(1.5 * (attempt + 1))
+        return FetchResult(False, 0, None, None, url, error=error or "fetch_failed", bytes_read=0)
+
+    def _get_network(self, url: str) -> FetchResult:
+        error = None
+        for attempt in range(self.retries):
+            try:
+                self._throttle()
+                t0 = time.perf_counter()
                 with self.sess.get(url, stream=True, timeout=self.timeout) as r:
+                    t_headers = time.perf_counter()
                     mime = r.headers.get("Content-Type")
                     status = r.status_code
                     if status != 200:
                         return FetchResult(False, status, mime, None, url, error=None, bytes_read=0)
-                    chunks = []
+                    declared = _total_size(r)
+                    if declared is not None and declared > self.max_bytes:
+                        return FetchResult(False, status, mime, None, url, error="too_large", bytes_read=declared)
+                    # one buffer per body: sized from Content-Length (compressed size is only a
+                    # starting point), doubled when it runs out, trimmed in place at the end
+                    buf = bytearray(declared or self.read_size)
                     total = 0
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if not chunk:
-                            continue
-                        total += len(chunk)
-                        if total > self.max_bytes:
-                            return FetchResult(False, status, mime, None, url, error="too_large", bytes_read=total)
-                        chunks.append(chunk)
-                    data = b"".join(chunks)
-                    return FetchResult(True, status, mime.split(";")[0].strip() if mime else None, data, url, None, total)
+                    if (r.headers.get("Content-Encoding") or "identity").strip().lower() == "identity":
+                        # plain body: read straight into the buffer, read_size at a time
+                        while True:
+                            if total < len(buf):
+                                with memoryview(buf) as mv:
+                                    n = r.raw.readinto(mv[total:total + self.read_size])
+                            else:
+                                # full (Content-Length reached, or no length): grow only if the body goes on
+                                more = r.raw.read(self.read_size)
+                                n = len(more)
+                                if n:
+                                    _grow(buf, max(len(buf), n))
+                                    buf[total:total + n] = more
+                            if not n:
+                                break
+                            total += n
+                            if total > self.max_bytes:
+                                return FetchResult(False, status, mime, None, url, error="too_large", bytes_read=total)
+                    else:
+                        # compressed: the decoder hands out fresh chunks anyway, copy each in once
+                        for chunk in r.iter_content(chunk_size=self.read_size):
+                            if not chunk:
+                                continue
+                            end = total + len(chunk)
+                            if end > self.max_bytes:
+                                return FetchResult(False, status, mime, None, url, error="too_large", bytes_read=end)
+                            if end > len(buf):
+                                _grow(buf, max(len(buf), end - len(buf)))
+                            buf[total:end] = chunk
+                            total = end
+                    del buf[total:]
+                    self._timed(t0, t_headers, total)
+                    return FetchResult(True, status, mime.split(";")[0].strip() if mime else None, buf, url, None, total)
             except Exception as e:
                 error = str(e)
                 time.sleep(1.5 * (attempt + 1))
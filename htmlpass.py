@@ -0,0 +1,72 @@
+# waypack/htmlpass.py
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .urltools import host
+
+# Tags to inspect for src/href (embedded.py)
+_TAG_RE = re.compile(
+    r"<(?P<tag>iframe|embed|video|source|a)\b[^>]*?\s(?P<attr>src|href)\s*=\s*['\"](?P<url>[^'\"<>]+)['\"][^>]*>",
+    re.IGNORECASE
+)
+# Inline absolute URL finder (quick and loose) (embedded.py)
+_URL_RE = re.compile(r"https?://[A-Za-z0-9._~:/?#\[\]@!$&'()*+,;=%-]+", re.IGNORECASE)
+# OG/Twitter image meta and <link rel=image_src> (og_parser.py)
+_META_RE = re.compile(
+    r'<meta\s+(?:property=["\']og:image["\']|name=["\']twitter:image["\'])\s+content=["\'](?P<u>[^"\'>]+)["\']',
+    re.IGNORECASE,
+)
+_LINK_IMG_RE = re.compile(
+    r'<link\s+rel=["\']image_src["\']\s+href=["\'](?P<u>[^"\'>]+)["\']',
+    re.IGNORECASE,
+)
+
+# Every tag-ish match starts with one of these '<' literals (same flags, so the same case
+# folding), and none can start inside another, so one finditer sees every start; the named group
+# says which pattern to try there. The leading '<' keeps the engine's fast literal-prefix search.
+_TAG_START_RE = re.compile(
+    r"<(?:(?P<tags>iframe|embed|video|source|a)|(?P<metas>meta)|(?P<links>link))",
+    re.IGNORECASE,
+)
+_TAG_PATTERNS = {"tags": _TAG_RE, "metas": _META_RE, "links": _LINK_IMG_RE}
+
+
+@dataclass
+class HtmlScan:
+    """Per-pattern matches for one page, each list exactly what pattern.finditer(html) yields."""
+    tags: List[re.Match] = field(default_factory=list)
+    urls: List[re.Match] = field(default_factory=list)
+    metas: List[re.Match] = field(default_factory=list)
+    links: List[re.Match] = field(default_factory=list)
+    _hosts: Dict[str, Optional[str]] = field(default_factory=dict)
+
+    def url_host(self, url: str) -> Optional[str]:
+        """Host per distinct URL; absolute hrefs are seen both as tags and inline URLs."""
+        try:
+            return self._hosts[url]
+        except KeyError:
+            h = self._hosts[url] = host(url)
+            return h
+
+
+def scan_html(html: str) -> HtmlScan:
+    """
+    Shared pass for embeds and OG candidates: one walk over '<' starts for the three tag
+    patterns (each matched only where its literal is, and not retried inside its own previous
+    match, which keeps finditer's semantics per pattern), plus the inline URL finditer.
+    """
+    out = HtmlScan()
+    ends = dict.fromkeys(_TAG_PATTERNS, 0)
+    for c in _TAG_START_RE.finditer(html):
+        name = c.lastgroup
+        p = c.start()
+        if p < ends[name]:
+            continue
+        m = _TAG_PATTERNS[name].match(html, p)
+        if m:
+            getattr(out, name).append(m)
+            ends[name] = m.end()
+    out.urls = list(_URL_RE.finditer(html))
+    return out
@@ -0,0 +1,84 @@
+# waypack/httpcache.py
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+@dataclass
+class CachedResponse:
+    status: int
+    mime: str | None
+    body: bytes | None
+    stored_at: float
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache (single SQLite file) with a byte cap and LRU eviction.
+    Safe to share between threads. Keys are full request URLs.
+    """
+    def __init__(self, path: str, max_bytes: int = 2_000_000_000):
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.path = path
+        self.max_bytes = max(0, max_bytes)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, status INTEGER, mime TEXT, body BLOB,"
+            " size INTEGER, stored_at REAL, last_access REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self.max_bytes and self._total > self.max_bytes:
+            self._evict()  # cap may have been lowered since the last run
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, max_age: float | None = None) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, mime, body, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (max_age is not None and time.time() - row[3] > max_age):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return CachedResponse(row[0], row[1], row[2], row[3])
+
+    def put(self, key: str, status: int, mime: str | None, body: bytes | None):
+        size = len(body or b"") + len(key)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses(key, status, mime, body, size, stored_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", (key, status, mime, body, size, now, now))
+            self._total += size - (old[0] if old else 0)
+            if self.max_bytes and self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # drop least recently used entries until we are back under ~90% of the cap
+        target = int(self.max_bytes * 0.9)
+        cur = self._db.execute("SELECT key, size FROM responses ORDER BY last_access")
+        doomed = []
+        for key, size in cur:
+            if self._total <= target:
+                break
+            doomed.append((key,))
+            self._total -= size
+        cur.close()
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
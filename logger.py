@@ -1,13 +1,41 @@
 # waypack/logger.py
 from __future__ import annotations
 from datetime import datetime
+import atexit
+import json
+import queue
 import sys
+import threading
+import time
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARN": 30, "ERROR": 40}
+
+_STOP = object()
+_BATCH = 8192  # events formatted and written per wake-up of the background writer
 
 class RunLogger:
-    def __init__(self, path: str = "run.log", mirror_stdout: bool = False):
+    """
+    Run log: one line per event, plain text ("[ts] LEVEL PHASE url=... k=v") or JSON lines.
+    Events below `level` are dropped before any formatting.
+
+    background=True hands events to a writer thread through a queue: log() only timestamps the
+    event and enqueues it, and the thread formats and writes whatever has piled up in one go
+    into a block-buffered file (flushed when it goes idle for flush_every seconds). Values are
+    formatted by the thread, so pass plain str/int/float, not objects that change afterwards.
+    The queue is drained on close() and, failing that, at interpreter exit (crashes included).
+    Counters never go through the queue and are exact at any time.
+    """
+    def __init__(self, path: str = "run.log", mirror_stdout: bool = False, append: bool = False,
+                 level: str = "INFO", fmt: str = "text", background: bool = False, flush_every: float = 1.0):
         self.path = path
-        self._fh = open(path, "w", encoding="utf-8", errors="replace")
+        self._fh = open(path, "a" if append else "w", encoding="utf-8", errors="replace",
+                        buffering=1 << 16 if background else -1)
         self._mirror = mirror_stdout
+        self._min = LEVELS.get(level.upper(), LEVELS["INFO"])
+        self._json = fmt == "json"
+        self._lock = threading.Lock()  # log/count may be called from fetch worker threads
+        self._ts = (-1, "")  # (second, formatted): the clock string is rebuilt once per second
+        self._closed = False
         self._counters = {
             "HTML_ORIG": 0, "HTML_KEPT": 0, "HTML_SKIPPED": 0,
             "IMG_ORIG": 0, "IMG_KEPT": 0, "IMG_SKIPPED": 0,
@@ -15,31 +43,132 @@ class RunLogger:
             "EMB_ORIG": 0, "EMB_DEDUPED": 0, "EMB_KEPT": 0,
             "EXIF_ORIG": 0, "EXIF_DEDUPED": 0, "EXIF_KEPT": 0,
         }
+        self._q: queue.SimpleQueue | None = None
+        self._thread: threading.Thread | None = None
+        if background:
+            self._q = queue.SimpleQueue()
+            self._flush_every = flush_every
+            self._thread = threading.Thread(target=self._writer, name="waypack-log", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
 
-    def log(self, level: str, phase: str, url: str = "", **kv):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def _stamp(self, t: float) -> str:
+        sec = int(t)
+        cached = self._ts
+        if cached[0] == sec:
+            return cached[1]
+        s = datetime.fromtimestamp(sec).strftime("%Y-%m-%d %H:%M:%S")
+        self._ts = (sec, s)
+        return s
+
+    def _format(self, t: float, level: str, phase: str, url: str, kv: dict) -> str:
+        ts = self._stamp(t)
+        if self._json:
+            rec = {"ts": ts, "level": level, "phase": phase}
+            if url:
+                rec["url"] = url
+            rec.update(kv)
+            return json.dumps(rec, ensure_ascii=False, default=str) + "\n"
         parts = [f"[{ts}] {level} {phase}"]
         if url:
             parts.append(f"url={url}")
         for k, v in kv.items():
             parts.append(f"{k}={v}")
-        line = " ".join(parts) + "\n"
-        self._fh.write(line)
+        return " ".join(parts) + "\n"
+
+    def log(self, level: str, phase: str, url: str = "", **kv):
+        if LEVELS.get(level, 0) < self._min:
+            return
+        if self._q is not None:
+            self._q.put((time.time(), level, phase, url, kv))
+            return
+        line = self._format(time.time(), level, phase, url, kv)
+        with self._lock:
+            self._emit(line)
+
+    def _emit(self, text: str):
+        self._fh.write(text)
         if self._mirror:
-            sys.stderr.write(line)
+            sys.stderr.write(text)
+
+    def _writer(self):
+        q = self._q
+        while True:
+            try:
+                item = q.get(timeout=self._flush_every)
+            except queue.Empty:
+                self._flush_quietly()
+                continue
+            batch = [item]
+            try:
+                while len(batch) < _BATCH:
+                    batch.append(q.get_nowait())
+            except queue.Empty:
+                pass
+            stop = False
+            lines = []
+            for it in batch:
+                if it is _STOP:
+                    stop = True
+                elif isinstance(it, str):
+                    lines.append(it)  # preformatted (summary)
+                else:
+                    lines.append(self._format(*it))
+            try:
+                with self._lock:
+                    self._emit("".join(lines))
+            except Exception:
+                pass  # a full disk must not take the run down with it
+            if stop:
+                self._flush_quietly()
+                return
+            if len(batch) < _BATCH:
+                time.sleep(0.02)  # let events pile up: fewer, larger writes and less GIL ping-pong with callers
+
+    def _flush_quietly(self):
+        try:
+            with self._lock:
+                self._fh.flush()
+        except Exception:
+            pass
 
     def count(self, key: str, inc: int = 1):
         if key in self._counters:
-            self._counters[key] += inc
+            with self._lock:
+                self._counters[key] += inc
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def restore_counters(self, saved: dict):
+        """Continue counting from a checkpoint (resumed runs)."""
+        with self._lock:
+            for k, v in saved.items():
+                if k in self._counters:
+                    self._counters[k] = v
 
     def summary(self):
-        s = " ".join(f"{k}={v}" for k, v in self._counters.items())
-        self._fh.write(f"[SUMMARY] {s}\n")
-        if self._mirror:
-            sys.stderr.write(f"[SUMMARY] {s}\n")
+        counters = self.counters()
+        if self._json:
+            line = json.dumps({"ts": self._stamp(time.time()), "level": "SUMMARY", **counters}) + "\n"
+        else:
+            line = "[SUMMARY] " + " ".join(f"{k}={v}" for k, v in counters.items()) + "\n"
+        if self._q is not None:
+            self._q.put(line)
+        else:
+            with self._lock:
+                self._emit(line)
 
     def close(self):
+        if self._closed:
+            return
+        self._closed = True
         try:
             self.summary()
         finally:
+            if self._thread is not None:
+                self._q.put(_STOP)
+                self._thread.join()
+                atexit.unregister(self.close)
             self._fh.close()
@@ -0,0 +1,59 @@
+# waypack/memo.py
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple
+
+@dataclass
+class PageAnalysis:
+    """Date/URL-independent results for one HTML body; rows are re-stamped per capture."""
+    status: int
+    mime: str | None
+    bytes_read: int
+    html_digest: str
+    hits: List[Dict[str, Any]] = field(default_factory=list)
+    embeds: List[Dict[str, Any]] = field(default_factory=list)
+    og_candidates: List[str] = field(default_factory=list)
+
+class AnalysisMemo:
+    """
+    Bounded LRU of PageAnalysis keyed by (content id, original URL). The original URL is part
+    of the key because relative embed/OG URLs are resolved against it. Content id is either
+    the CDX digest (lookup before fetching) or the sha256 of the fetched body.
+    """
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max(1, max_entries)
+        self._by_cdx: OrderedDict[Tuple[str, str], PageAnalysis] = OrderedDict()
+        self._by_sha: OrderedDict[Tuple[str, str], PageAnalysis] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, table: OrderedDict, key: Tuple[str, str]) -> Optional[PageAnalysis]:
+        with self._lock:
+            pa = table.get(key)
+            if pa is None:
+                self.misses += 1
+                return None
+            table.move_to_end(key)
+            self.hits += 1
+            return pa
+
+    def _put(self, table: OrderedDict, key: Tuple[str, str], pa: PageAnalysis):
+        with self._lock:
+            table[key] = pa
+            table.move_to_end(key)
+            while len(table) > self.max_entries:
+                table.popitem(last=False)
+
+    def by_cdx_digest(self, digest: str, original: str) -> Optional[PageAnalysis]:
+        return self._get(self._by_cdx, (digest, original)) if digest else None
+
+    def by_content(self, sha256: str, original: str) -> Optional[PageAnalysis]:
+        return self._get(self._by_sha, (sha256, original))
+
+    def put(self, pa: PageAnalysis, original: str, cdx_digest: str = ""):
+        self._put(self._by_sha, (pa.html_digest, original), pa)
+        if cdx_digest:
+            self._put(self._by_cdx, (cdx_digest, original), pa)
@@ -0,0 +1,167 @@
+# waypack/metrics.py
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Any, List, Optional
+
+# Histogram bucket upper bounds in seconds: 50us doubling up to ~105s, plus +Inf
+BOUNDS: List[float] = [5e-5 * 2 ** i for i in range(22)]
+
+# Stages recorded by the pipeline: cdx_page (CDX API request, after throttling), throttle (time
+# slept for a rate-limiter slot), fetch_ttfb / fetch (request start to headers / to end of body),
+# decode, scan, embeds (shared HTML pass + embed extraction), og, exif, exif_scan, dedupe and
+# export (per record), checkpoint.
+
+class Histogram:
+    """Fixed-bucket latency histogram: one bisect and three adds per observation."""
+    __slots__ = ("counts", "n", "sum", "max", "nbytes")
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.n = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.nbytes = 0
+
+    def observe(self, v: float, nbytes: int = 0):
+        self.counts[bisect_left(BOUNDS, v)] += 1
+        self.n += 1
+        self.sum += v
+        self.nbytes += nbytes
+        if v > self.max:
+            self.max = v
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (max for the overflow bucket)."""
+        if not self.n:
+            return 0.0
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(BOUNDS[i], self.max) if i < len(BOUNDS) else self.max
+        return self.max
+
+class Metrics:
+    """
+    Per-stage timings (seconds) and byte counts for one run, safe to feed from worker threads.
+    Components take an optional Metrics and skip all timing when it is None. Throughput is
+    pages (CDX records merged) and fetched bytes over wall time since construction.
+    """
+    def __init__(self):
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._hist: Dict[str, Histogram] = {}
+        self.pages = 0
+        self._export: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def observe(self, stage: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            h = self._hist.get(stage)
+            if h is None:
+                h = self._hist[stage] = Histogram()
+            h.observe(seconds, nbytes)
+
+    def observe_many(self, timings: Dict[str, float]):
+        """Stage timings measured elsewhere (CPU worker processes)."""
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+
+    def add_pages(self, n: int = 1):
+        with self._lock:
+            self.pages += n
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = max(1e-9, time.monotonic() - self.started)
+            stages = {}
+            for name, h in sorted(self._hist.items()):
+                stages[name] = {
+                    "count": h.n, "sum_s": round(h.sum, 6), "mean_s": round(h.sum / h.n, 6) if h.n else 0.0,
+                    "p50_s": round(h.quantile(0.5), 6), "p90_s": round(h.quantile(0.9), 6),
+                    "p99_s": round(h.quantile(0.99), 6),
+                    "max_s": round(h.max, 6), "bytes": h.nbytes,
+                    "share": round(h.sum / elapsed, 4),  # can exceed 1 with concurrent workers
+                }
+            fetched = self._hist["fetch"].nbytes if "fetch" in self._hist else 0
+            return {
+                "elapsed_s": round(elapsed, 3),
+                "pages": self.pages,
+                "pages_per_s": round(self.pages / elapsed, 3),
+                "fetched_bytes": fetched,
+                "mb_per_s": round(fetched / elapsed / 1e6, 3),
+                "stages": stages,
+            }
+
+    def prometheus(self) -> str:
+        """Everything in Prometheus text exposition format (for the node_exporter textfile collector)."""
+        with self._lock:
+            elapsed = max(1e-9, time.monotonic() - self.started)
+            hists = {k: (list(h.counts), h.n, h.sum, h.nbytes) for k, h in self._hist.items()}
+            pages = self.pages
+        out = [
+            "# HELP waypack_stage_seconds Time per pipeline stage.",
+            "# TYPE waypack_stage_seconds histogram",
+        ]
+        for stage, (counts, n, total, _b) in sorted(hists.items()):
+            cum = 0
+            for bound, c in zip(BOUNDS, counts):
+                cum += c
+                out.append(f'waypack_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cum}')
+            out.append(f'waypack_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {n}')
+            out.append(f'waypack_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            out.append(f'waypack_stage_seconds_count{{stage="{stage}"}} {n}')
+        out += ["# HELP waypack_stage_bytes_total Bytes handled per stage.",
+                "# TYPE waypack_stage_bytes_total counter"]
+        out += [f'waypack_stage_bytes_total{{stage="{s}"}} {b}' for s, (_c, _n, _t, b) in sorted(hists.items()) if b]
+        fetched = hists["fetch"][3] if "fetch" in hists else 0
+        out += [
+            "# HELP waypack_pages_total CDX records fully processed.", "# TYPE waypack_pages_total counter",
+            f"waypack_pages_total {pages}",
+            "# HELP waypack_elapsed_seconds Wall time since the run started.", "# TYPE waypack_elapsed_seconds gauge",
+            f"waypack_elapsed_seconds {elapsed:.3f}",
+            "# HELP waypack_pages_per_second Pages over elapsed time.", "# TYPE waypack_pages_per_second gauge",
+            f"waypack_pages_per_second {pages / elapsed:.3f}",
+            "# HELP waypack_fetch_megabytes_per_second Fetched MB over elapsed time.",
+            "# TYPE waypack_fetch_megabytes_per_second gauge",
+            f"waypack_fetch_megabytes_per_second {fetched / elapsed / 1e6:.3f}",
+        ]
+        return "\n".join(out) + "\n"
+
+    def write_prometheus(self, path: str):
+        _replace(path, self.prometheus())
+
+    def write_json(self, path: str):
+        _replace(path, json.dumps(self.snapshot(), indent=2) + "\n")
+
+    def start_export(self, path: str, every: float = 15.0):
+        """Rewrite the Prometheus file every `every` seconds from a daemon thread until stop_export()."""
+        def loop():
+            while not self._stop.wait(every):
+                try:
+                    self.write_prometheus(path)
+                except OSError:
+                    pass
+        self._export = threading.Thread(target=loop, name="waypack-metrics", daemon=True)
+        self._export.start()
+
+    def stop_export(self):
+        self._stop.set()
+        if self._export is not None:
+            self._export.join()
+            self._export = None
+
+def _replace(path: str, text: str):
+    # write-then-rename, so scrapers never read a half-written file
+    d = os.path.dirname(path)
+    if d:
+        os.makedirs(d, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(text)
+    os.replace(tmp, path)
@@ -1,22 +1,15 @@
 # waypack/og_parser.py
 from __future__ import annotations
-import re
-from typing import List
+from typing import List, Optional
 
-_META_RE = re.compile(
-    r'<meta\s+(?:property=["\']og:image["\']|name=["\']twitter:image["\'])\s+content=["\'](?P<u>[^"\'>]+)["\']',
-    re.IGNORECASE,
-)
-_LINK_IMG_RE = re.compile(
-    r'<link\s+rel=["\']image_src["\']\s+href=["\'](?P<u>[^"\'>]+)["\']',
-    re.IGNORECASE,
-)
+from .htmlpass import HtmlScan, scan_html
 
-def extract_og_images(html: str) -> List[str]:
+def extract_og_images(html: str, page: Optional[HtmlScan] = None) -> List[str]:
     """Return candidate image URLs from OG/Twitter/link tags (as they appear in HTML)."""
+    page = page or scan_html(html)
     urls = []
-    urls += [m.group("u") for m in _META_RE.finditer(html)]
-    urls += [m.group("u") for m in _LINK_IMG_RE.finditer(html)]
+    urls += [m.group("u") for m in page.metas]
+    urls += [m.group("u") for m in page.links]
     # dedup, keep order
     seen = set()
     out = []
@@ -0,0 +1,27 @@
+# waypack/ratelimit.py
+from __future__ import annotations
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Thread-safe request spacer: hands out one slot every 1/rps seconds.
+    Share one instance between fetchers/threads to keep a single global budget.
+    """
+    def __init__(self, rps: float = 2.0):
+        self.rps = max(0.1, rps)
+        self._min_interval = 1.0 / self.rps
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> float:
+        """Block until our slot comes up; return seconds slept."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._min_interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(0.0, delay)
@@ -0,0 +1,128 @@
+# waypack/rulepack.py
+from __future__ import annotations
+import glob
+import hashlib
+import json
+import os
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .scanner import CompiledRule, Rule, _FALLBACK_RULES, compile_rule, parse_rule_entries
+
+# bump when CompiledRule / anchor analysis changes so old caches are ignored
+PACK_VERSION = 3
+
+
+@dataclass
+class RulePack:
+    """Validated + pre-analysed rules (anchors, offsets, flags) ready for RuleSet."""
+    source: str
+    source_hash: str
+    rules: List[CompiledRule]
+    errors: List[str] = field(default_factory=list)
+    from_cache: bool = False
+
+
+def _pack_key(raw: bytes) -> str:
+    h = hashlib.sha256()
+    h.update(f"v{PACK_VERSION}|py{sys.version_info[0]}.{sys.version_info[1]}|".encode())
+    h.update(raw)
+    return h.hexdigest()
+
+
+def _dump_rule(cr: CompiledRule) -> Dict[str, Any]:
+    return {"rule": asdict(cr.rule), "flags": cr.flags,
+            "anchors": sorted(cr.anchors) if cr.anchors is not None else None,
+            "offset": cr.offset, "bytes_plan": cr.bytes_plan}
+
+
+def _load_rule(d: Dict[str, Any]) -> CompiledRule:
+    # plain data only: regexes are compiled on first use, exactly as for a fresh build
+    offset, plan = d["offset"], d["bytes_plan"]
+    return CompiledRule(Rule(**d["rule"]), int(d["flags"]),
+                        set(d["anchors"]) if d["anchors"] is not None else None,
+                        (int(offset[0]), int(offset[1])) if offset is not None else None,
+                        (bool(plan[0]), bool(plan[1])) if plan is not None else None)
+
+
+def build_rule_pack(rules_dir: str = "rules") -> RulePack:
+    """Parse, validate, compile and analyse rules/merged_rules.json (or the fallback set)."""
+    merged = os.path.join(rules_dir, "merged_rules.json")
+    if not os.path.isfile(merged):
+        return RulePack("builtin", "", [compile_rule(r) for r in _FALLBACK_RULES])
+    with open(merged, "rb") as fh:
+        raw = fh.read()
+    try:
+        rules, errors = parse_rule_entries(json.loads(raw.decode("utf-8", errors="replace")))
+    except ValueError as e:
+        rules, errors = [], [f"{merged}: invalid JSON: {e}"]
+    if not rules:
+        # same contract as load_rules: an empty/broken pack falls back to the builtin rules
+        return RulePack("builtin", "", [compile_rule(r) for r in _FALLBACK_RULES], errors)
+    return RulePack(merged, _pack_key(raw), [compile_rule(r) for r in rules], errors)
+
+
+def load_rule_pack(rules_dir: str = "rules", cache_dir: Optional[str] = None) -> RulePack:
+    """
+    Return the compiled pack for rules_dir, using a cache file keyed by the content hash of
+    merged_rules.json. cache_dir=None -> <rules_dir>/.cache; "" disables caching.
+    Cache read/write failures are ignored (we just rebuild). The cache is plain JSON (rule
+    fields plus anchor analysis), so a writable cache directory can't be used to run code;
+    at worst a tampered file hides matches, as a tampered merged_rules.json could.
+    """
+    merged = os.path.join(rules_dir, "merged_rules.json")
+    if cache_dir is None:
+        cache_dir = os.path.join(rules_dir, ".cache")
+    if not cache_dir or not os.path.isfile(merged):
+        return build_rule_pack(rules_dir)
+    try:
+        with open(merged, "rb") as fh:
+            key = _pack_key(fh.read())
+    except OSError:
+        return build_rule_pack(rules_dir)
+    path = os.path.join(cache_dir, f"pack-{key[:24]}.json")
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+        if data["source_hash"] == key:
+            rules = [_load_rule(d) for d in data["rules"]]
+            return RulePack(data["source"], key, rules, list(data["errors"]), from_cache=True)
+    except Exception:
+        pass
+    pack = build_rule_pack(rules_dir)
+    if pack.source_hash == key:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"source": pack.source, "source_hash": key, "errors": pack.errors,
+                           "rules": [_dump_rule(cr) for cr in pack.rules]}, fh)
+            os.replace(tmp, path)
+            # drop packs built from older versions of the rules file (and pre-JSON pickles)
+            for old in glob.glob(os.path.join(cache_dir, "pack-*")):
+                if old != path and not old.endswith(".tmp"):
+                    os.remove(old)
+        except OSError:
+            pass
+    return pack
+
+
+def main(argv=None) -> int:
+    """Build step: `python -m waypack.rulepack [rules_dir]` validates + caches the pack."""
+    import argparse
+    p = argparse.ArgumentParser("waypack.rulepack")
+    p.add_argument("rules_dir", nargs="?", default="rules")
+    p.add_argument("--cache-dir", default=None)
+    args = p.parse_args(argv)
+    pack = load_rule_pack(args.rules_dir, cache_dir=args.cache_dir)
+    for err in pack.errors:
+        print(f"invalid rule {err}", file=sys.stderr)
+    anchored = sum(1 for cr in pack.rules if cr.anchors)
+    print(f"{pack.source}: {len(pack.rules)} rules ({anchored} anchored), {len(pack.errors)} invalid"
+          f"{' [cached]' if pack.from_cache else ''}")
+    return 1 if pack.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,16 @@
 # waypack/scanner.py
 from __future__ import annotations
-import json, re, os
-from dataclasses import dataclass
-from typing import List, Iterable, Dict, Any, Optional
+import bisect, json, re, os, threading, time
+from dataclasses import dataclass, field
+from typing import List, Iterable, Dict, Any, FrozenSet, Optional, Set, Tuple
+
+try:  # regex parser internals, used only to pull literal anchors out of patterns
+    from re import _parser as _sre_parse, _constants as _sre_c
+except ImportError:  # pragma: no cover - Python < 3.11, or a future one without them
+    try:
+        import sre_parse as _sre_parse, sre_constants as _sre_c
+    except ImportError:
+        _sre_parse = _sre_c = None  # no anchors / bytes plans: every rule is a plain finditer
 
 @dataclass
 class Rule:
@@ -30,26 +38,48 @@ _FALLBACK_RULES = [
     Rule("google.maps.key", "api", r"\bAIza[0-9A-Za-z\-_]{30,}\b", 0),
 ]
 
-def _load_json_rules(path: str) -> List[Rule]:
-    with open(path, "r", encoding="utf-8", errors="replace") as fh:
-        data = json.load(fh)
+def parse_rule_entries(data: Any) -> Tuple[List[Rule], List[str]]:
+    """
+    Validate merged_rules.json entries. Returns (rules, errors); each bad entry
+    (missing fields, wrong types, pattern that fails to compile) becomes an error line.
+    """
     out: List[Rule] = []
-    for obj in data:
+    errors: List[str] = []
+    if not isinstance(data, list):
+        return out, ["top-level JSON value is not a list"]
+    for i, obj in enumerate(data):
+        rid = obj.get("rule_id") if isinstance(obj, dict) else None
+        where = f"#{i} ({rid})" if rid else f"#{i}"
         try:
-            out.append(
-                Rule(
-                    rule_id=obj["rule_id"],
-                    family=obj.get("family","misc"),
-                    pattern=obj["pattern"],
-                    flags=re.IGNORECASE if obj.get("ignorecase", True) else 0,
-                    min_len=int(obj.get("min_len", 0)),
-                    entropy_min=float(obj.get("entropy_min", 0.0)),
-                    source=obj.get("source", "merged"),
-                )
+            if not isinstance(obj, dict):
+                raise ValueError("entry is not an object")
+            if not isinstance(obj.get("rule_id"), str) or not obj["rule_id"]:
+                raise ValueError("missing rule_id")
+            if not isinstance(obj.get("pattern"), str) or not obj["pattern"]:
+                raise ValueError("missing pattern")
+            rule = Rule(
+                rule_id=obj["rule_id"],
+                family=obj.get("family","misc"),
+                pattern=obj["pattern"],
+                flags=re.IGNORECASE if obj.get("ignorecase", True) else 0,
+                min_len=int(obj.get("min_len", 0)),
+                entropy_min=float(obj.get("entropy_min", 0.0)),
+                source=obj.get("source", "merged"),
             )
-        except Exception:
+            re.compile(rule.pattern, rule.flags)
+        except re.error as e:
+            errors.append(f"{where}: bad pattern: {e}")
             continue
-    return out
+        except Exception as e:
+            errors.append(f"{where}: {e}")
+            continue
+        out.append(rule)
+    return out, errors
+
+def _load_json_rules(path: str) -> List[Rule]:
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        data = json.load(fh)
+    return parse_rule_entries(data)[0]
 
 def load_rules(rules_dir: str = "rules") -> List[Rule]:
     """
@@ -63,7 +93,11 @@ def load_rules(rules_dir: str = "rules") -> List[Rule]:
             return rules
     return _FALLBACK_RULES[:]  # copy
 
-def scan_text(text: str, rules: List[Rule], families_include: Optional[set[str]] = None, families_exclude: Optional[set[str]] = None) -> Iterable[Dict[str, Any]]:
+def scan_text(text: str, rules: List[Rule] | RuleSet, families_include: Optional[set[str]] = None, families_exclude: Optional[set[str]] = None) -> Iterable[Dict[str, Any]]:
+    """Scan text with every selected rule. A RuleSet is already family-filtered and is scanned as-is."""
+    if isinstance(rules, RuleSet):
+        yield from rules.scan(text)
+        return
     if not text:
         return
     inc = families_include
@@ -92,3 +126,618 @@ def scan_text(text: str, rules: List[Rule], families_include: Optional[set[str]]
                 }
         except re.error:
             continue
+
+
+# --- Compiled multi-rule engine ---
+
+# non-ASCII chars that case-fold onto ASCII letters (İ ı ſ K); pages containing them take the slow path
+_FOLD_HAZARD = re.compile("[\u0130\u0131\u017f\u212a]")
+_FOLD_HAZARD_B = tuple(c.encode() for c in "\u0130\u0131\u017f\u212a")  # `in` beats a regex here
+
+_MAX_ANCHOR_ALTS = 16  # cap literal alternatives per rule (e.g. (AKIA|ASIA) -> 2)
+_ANCHOR_FLAGS = re.IGNORECASE | re.ASCII
+
+
+def _literal_alts(items) -> Optional[Set[str]]:
+    """If `items` can only match a small finite set of literal strings, return that set."""
+    out = {""}
+    for op, av in items:
+        if op is _sre_c.LITERAL:
+            if av > 0x7F:  # keep anchors ASCII so case-folding stays predictable
+                return None
+            alts = {chr(av)}
+        elif op is _sre_c.SUBPATTERN:
+            _group, add_flags, del_flags, sub = av
+            if (add_flags | del_flags) & _ANCHOR_FLAGS:
+                return None
+            alts = _literal_alts(sub)
+        elif op is _sre_c.BRANCH:
+            alts = set()
+            for alt in av[1]:
+                a = _literal_alts(alt)
+                if a is None:
+                    return None
+                alts |= a
+        else:
+            return None
+        if alts is None:
+            return None
+        out = {p + a for p in out for a in alts}
+        if len(out) > _MAX_ANCHOR_ALTS:
+            return None
+    return out
+
+
+def _lead_literals(items) -> Optional[Set[str]]:
+    """Literals one of which every match of `items` must start with (offset 0), or None."""
+    out = {""}
+    for op, av in items:
+        alts = _literal_alts([(op, av)])
+        if alts is not None:
+            out = {p + a for p in out for a in alts}
+            if len(out) > _MAX_ANCHOR_ALTS:
+                return None
+            continue
+        # partially literal group: extend with its own lead, then stop
+        tails = None
+        if op is _sre_c.SUBPATTERN and not ((av[1] | av[2]) & _ANCHOR_FLAGS):
+            tails = _lead_literals(av[3])
+        elif op is _sre_c.BRANCH:
+            tails = set()
+            for alt in av[1]:
+                t = _lead_literals(alt)
+                if t is None:
+                    tails = None
+                    break
+                tails |= t
+        if tails and len(out) * len(tails) <= _MAX_ANCHOR_ALTS:
+            out = {p + t for p in out for t in tails}
+        break
+    if not out or "" in out:
+        return None
+    return out
+
+
+def _extract_anchors(pattern: str, flags: int) -> Tuple[Optional[Set[str]], Optional[Tuple[int, int]]]:
+    """
+    Pull required literal anchors out of a pattern.
+    Returns (anchors, (lo, hi)) where every match contains one of `anchors` starting lo..hi chars
+    after the match start; the offset is None when the text before the anchor is unbounded.
+    """
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+    except Exception:
+        return None, None
+    items = list(parsed)
+    best = None  # (bounded, min_len, -k, anchors, offset)
+    for k in range(len(items)):
+        lead = _lead_literals(items[k:])
+        if not lead:
+            continue
+        lo, hi = _sre_parse.SubPattern(parsed.state, items[:k]).getwidth()
+        bounded = hi < _sre_c.MAXREPEAT
+        cand = (bounded, min(len(a) for a in lead), -k, lead, (lo, hi) if bounded else None)
+        if best is None or cand[:3] > best[:3]:
+            best = cand
+    if best is None:
+        return None, None
+    return best[3], best[4]
+
+
+_WORD_B = frozenset(b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_")
+if _sre_c is not None:
+    _AT_SAFE = {_sre_c.AT_BEGINNING, _sre_c.AT_BEGINNING_STRING, _sre_c.AT_END, _sre_c.AT_END_STRING}
+    _REPEATS = {_sre_c.MAX_REPEAT, _sre_c.MIN_REPEAT, getattr(_sre_c, "POSSESSIVE_REPEAT", _sre_c.MAX_REPEAT)}
+
+
+def _ascii_items(items) -> bool:
+    """True if `items` can only ever consume ASCII chars, with the same meaning in str and bytes mode."""
+    for op, av in items:
+        if op is _sre_c.LITERAL:
+            if av > 0x7F:
+                return False
+        elif op is _sre_c.IN:
+            # positive sets of ASCII literals/ranges only: \d \w \s and negations differ off ASCII
+            for iop, iav in av:
+                if iop is _sre_c.LITERAL and iav <= 0x7F:
+                    continue
+                if iop is _sre_c.RANGE and iav[1] <= 0x7F:
+                    continue
+                return False
+        elif op is _sre_c.SUBPATTERN:
+            if av[1] or av[2] or not _ascii_items(av[3]):
+                return False
+        elif op is _sre_c.BRANCH:
+            if not all(_ascii_items(alt) for alt in av[1]):
+                return False
+        elif op in _REPEATS:
+            if not _ascii_items(av[2]):
+                return False
+        elif op is _sre_c.AT:
+            if av not in _AT_SAFE:
+                return False
+        elif op is _sre_c.GROUPREF:
+            continue
+        else:
+            return False
+    return True
+
+
+def _edge_chars(items, last: bool) -> Optional[Set[int]]:
+    """Chars the first (or last) consumed char of `items` can be, or None if that isn't simple to say."""
+    if not items:
+        return None
+    op, av = items[-1] if last else items[0]
+    if op is _sre_c.LITERAL:
+        return {av}
+    if op is _sre_c.IN:
+        out: Set[int] = set()
+        for iop, iav in av:
+            out |= {iav} if iop is _sre_c.LITERAL else set(range(iav[0], iav[1] + 1))
+        return out
+    if op is _sre_c.SUBPATTERN:
+        return _edge_chars(list(av[3]), last)
+    if op is _sre_c.BRANCH:
+        out = set()
+        for alt in av[1]:
+            c = _edge_chars(list(alt), last)
+            if c is None:
+                return None
+            out |= c
+        return out
+    if op in _REPEATS and av[0] >= 1:
+        return _edge_chars(list(av[2]), last)
+    return None
+
+
+def _bytes_plan(pattern: str, flags: int) -> Optional[Tuple[bool, bool]]:
+    """
+    Whether a rule can run on raw UTF-8 bytes with exactly the str-mode matches: it must consume
+    ASCII only and never match empty, and \\b may only sit at the very start/end next to word
+    chars. Returns (leading \\b, trailing \\b), which need a look at non-ASCII neighbours; None if not.
+    """
+    if not pattern.isascii():
+        return None
+    try:
+        parsed = _sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+    items = list(parsed)
+    if parsed.getwidth()[0] < 1:
+        return None
+    lead = trail = False
+    if items and items[0] == (_sre_c.AT, _sre_c.AT_BOUNDARY):
+        items, lead = items[1:], True
+    if items and items[-1] == (_sre_c.AT, _sre_c.AT_BOUNDARY):
+        items, trail = items[:-1], True
+    if not _ascii_items(items):
+        return None
+    # \b between a word char and a neighbour: only non-ASCII *word* neighbours differ (bytes see
+    # them as non-word), and with a word char inside the match bytes mode can only over-match
+    for edge, last in ((lead, False), (trail, True)):
+        if edge:
+            chars = _edge_chars(items, last)
+            if chars is None or not chars <= _WORD_B:
+                return None
+    return lead, trail
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Alternation shaped as a trie; greedy optional tails make a search return the longest word."""
+    trie: Dict[str, Any] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node) -> str:
+        alts = [re.escape(ch) + emit(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+class _Prefilter:
+    """Anchors sharing one case mode; maps an anchor hit back to the rules it may start."""
+    def __init__(self, flags: int, anchors: Dict[str, Set[int]]):
+        self.fold = bool(flags & re.IGNORECASE)
+        self.flags = flags
+        self.anchors = anchors  # lowercased when folding
+        pattern = _trie_regex(anchors)
+        self.rx = re.compile(pattern, flags)
+        self.rx_lower = re.compile(pattern) if self.fold else None
+        # anchors are ASCII; bytes.lower() folds ASCII only, which is all the lowered path needs
+        self.brx = re.compile(pattern.encode("ascii"), flags & ~re.UNICODE & ~re.ASCII)
+        self.brx_lower = re.compile(pattern.encode("ascii")) if self.fold else None
+        # every anchor that is a prefix of the longest hit starts at the same position
+        self._exact: Dict[str, List[int]] = {}
+        for a in anchors:
+            self._exact[a] = sorted({i for b, ids in anchors.items() if a.startswith(b) for i in ids})
+        self._slow: Dict[str, List[int]] = {}
+
+    def rules_at(self, hit: str, exact: bool) -> List[int]:
+        if exact:
+            return self._exact[hit]
+        ids = self._slow.get(hit)
+        if ids is None:
+            ids = sorted({i for b, idxs in self.anchors.items() if re.match(re.escape(b), hit, self.flags) for i in idxs})
+            self._slow[hit] = ids
+        return ids
+
+
+@dataclass
+class CompiledRule:
+    rule: Rule
+    flags: int  # effective flags, including inline (?i) etc.
+    anchors: Optional[Set[str]] = None
+    offset: Optional[Tuple[int, int]] = None  # (lo, hi) chars from match start to anchor
+    bytes_plan: Optional[Tuple[bool, bool]] = None  # see _bytes_plan; None = str-only rule
+    _rx: Optional[re.Pattern] = field(default=None, repr=False, compare=False)
+    _brx: Optional[re.Pattern] = field(default=None, repr=False, compare=False)
+
+    @property
+    def rx(self) -> re.Pattern:
+        # compiled on first use, so a cached pack only pays for rules whose anchors show up
+        if self._rx is None:
+            self._rx = re.compile(self.rule.pattern, self.rule.flags)
+        return self._rx
+
+    @property
+    def brx(self) -> re.Pattern:
+        if self._brx is None:
+            self._brx = re.compile(self.rule.pattern.encode("ascii"), self.rule.flags & ~re.UNICODE)
+        return self._brx
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_rx"] = None
+        state["_brx"] = None
+        return state
+
+
+def compile_rule(r: Rule) -> CompiledRule:
+    """Compile + analyse one rule; raises re.error on a bad pattern."""
+    rx = re.compile(r.pattern, r.flags)
+    anchors, offset, plan = None, None, None
+    if _sre_parse is not None:
+        try:
+            anchors, offset = _extract_anchors(r.pattern, r.flags)
+            plan = _bytes_plan(r.pattern, r.flags)
+        except Exception:
+            # parser internals changed shape: an unanalysed rule is scanned like scan_text does
+            anchors, offset, plan = None, None, None
+    if plan is not None:
+        try:
+            re.compile(r.pattern.encode("ascii"), r.flags & ~re.UNICODE)
+        except (re.error, ValueError):
+            plan = None
+    return CompiledRule(r, rx.flags, anchors, offset, plan, rx)
+
+
+class RuleStats:
+    """
+    Time and match counts per rule_id for a RuleSet (profiling), plus the runaway-rule guard: a
+    rule that runs longer than `budget` seconds on one text is reported (events) and, once that
+    has happened on `quarantine_after` texts (0 = report only), skipped for the rest of the run.
+    Python's re can't be interrupted, so the guard keeps a pathological rule from stalling later
+    pages, not the one it is caught on. Safe to share between threads; worker processes keep
+    their own report-only copy and ship deltas back (take / merge): the parent decides on
+    quarantine from the summed counts and hands its set to the workers with every task.
+    """
+    def __init__(self, budget: float = 0.0, quarantine_after: int = 0):
+        self.budget = budget
+        self.quarantine_after = quarantine_after
+        self.rules: Dict[str, List[float]] = {}  # rule_id -> [seconds, runs, matches, worst, over budget]
+        self.quarantined: Set[str] = set()
+        self.events: List[Tuple[str, float, int, bool]] = []  # (rule_id, seconds, text size, quarantined now)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, rule_id: str, seconds: float, matches: int, size: int):
+        with self._lock:
+            st = self.rules.get(rule_id)
+            if st is None:
+                st = self.rules[rule_id] = [0.0, 0, 0, 0.0, 0]
+            st[0] += seconds
+            st[1] += 1
+            st[2] += matches
+            if seconds > st[3]:
+                st[3] = seconds
+            if self.budget and seconds > self.budget:
+                st[4] += 1
+                q = (self.quarantine_after > 0 and st[4] >= self.quarantine_after
+                     and rule_id not in self.quarantined)
+                if q:
+                    self.quarantined.add(rule_id)
+                self.events.append((rule_id, seconds, size, q))
+
+    def take(self) -> Dict[str, Any]:
+        """Counters and events since the last take(), reset (worker side)."""
+        with self._lock:
+            delta = {"rules": self.rules, "events": self.events}
+            self.rules, self.events = {}, []
+        return delta
+
+    def merge(self, delta: Dict[str, Any]):
+        with self._lock:
+            for rule_id, (sec, runs, matches, worst, over) in delta["rules"].items():
+                st = self.rules.get(rule_id)
+                if st is None:
+                    st = self.rules[rule_id] = [0.0, 0, 0, 0.0, 0]
+                st[0] += sec
+                st[1] += runs
+                st[2] += matches
+                st[3] = max(st[3], worst)
+                st[4] += over
+            for rule_id, seconds, size, _q in delta["events"]:
+                st = self.rules[rule_id]
+                q = (self.quarantine_after > 0 and st[4] >= self.quarantine_after
+                     and rule_id not in self.quarantined)
+                if q:
+                    self.quarantined.add(rule_id)
+                self.events.append((rule_id, seconds, size, q))
+
+    def quarantine_set(self) -> FrozenSet[str]:
+        with self._lock:
+            return frozenset(self.quarantined)
+
+    def drain_events(self) -> List[Tuple[str, float, int, bool]]:
+        with self._lock:
+            ev, self.events = self.events, []
+        return ev
+
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        """The n rules with the most total scan time."""
+        with self._lock:
+            items = sorted(self.rules.items(), key=lambda kv: -kv[1][0])[:n]
+        return [{"rule_id": rid, "seconds": round(sec, 6), "runs": runs, "matches": matches,
+                 "worst_s": round(worst, 6), "over_budget": over, "quarantined": rid in self.quarantined}
+                for rid, (sec, runs, matches, worst, over) in items]
+
+
+class RuleSet:
+    """
+    Rules selected by family and compiled once (or taken pre-compiled from a rule pack, see
+    rulepack.py). scan() finds every literal anchor in a single pass, then runs each rule's full regex only at positions its anchors allow; rules without a
+    usable anchor fall back to a plain finditer. Hits are identical to scan_text(text, rules, ...).
+    scan_bytes() does the same on a raw UTF-8 body without decoding it (see there).
+    With `stats` set (a RuleStats), each rule's run on a text is timed and quarantined rules
+    are skipped.
+    """
+    def __init__(self, rules: List[Rule | CompiledRule], families_include: Optional[set[str]] = None, families_exclude: Optional[set[str]] = None):
+        self.rules: List[CompiledRule] = []
+        for r in rules:
+            fam = r.rule.family if isinstance(r, CompiledRule) else r.family
+            if families_include and fam not in families_include:
+                continue
+            if families_exclude and fam in families_exclude:
+                continue
+            if isinstance(r, CompiledRule):
+                cr = r
+            else:
+                try:
+                    cr = compile_rule(r)
+                except re.error:
+                    continue
+            self.rules.append(cr)
+        self.stats: Optional[RuleStats] = None
+        self._build_prefilter()
+
+    def _build_prefilter(self):
+        # one trie-shaped alternation per case mode, searched once over the page
+        by_flags: Dict[int, Dict[str, Set[int]]] = {}
+        for idx, cr in enumerate(self.rules):
+            if not cr.anchors:
+                continue
+            fl = cr.flags & _ANCHOR_FLAGS
+            fold = bool(fl & re.IGNORECASE)
+            for a in cr.anchors:
+                by_flags.setdefault(fl, {}).setdefault(a.lower() if fold else a, set()).add(idx)
+        self._prefilters = [_Prefilter(fl, amap) for fl, amap in by_flags.items()]
+
+    def _anchor_positions(self, text: str | bytes) -> Dict[int, List[int]]:
+        # bytes callers have already checked for fold hazards, so they always take the lowered path
+        is_bytes = isinstance(text, (bytes, bytearray))
+        pos: Dict[int, List[int]] = {}
+        lowered = None
+        hazard = False if is_bytes else None
+        for pf in self._prefilters:
+            src, exact = text, not pf.fold
+            if pf.fold:
+                if hazard is None:
+                    hazard = _FOLD_HAZARD.search(text) is not None
+                if not hazard:
+                    # ASCII anchors + no odd case-folding chars: lowercase once and match exactly
+                    if lowered is None:
+                        lowered = text.lower()
+                    src, exact = lowered, True
+            if is_bytes:
+                rx = pf.brx if src is text else pf.brx_lower
+            else:
+                rx = pf.rx if src is text else pf.rx_lower
+            m = rx.search(src)
+            while m:
+                s = m.start()
+                hit = m.group(0)
+                for idx in pf.rules_at(hit.decode("ascii") if is_bytes else hit, exact):
+                    pos.setdefault(idx, []).append(s)
+                # anchors may overlap, so resume one char later rather than at the match end
+                m = rx.search(src, s + 1)
+        return pos
+
+    def scan(self, text: str) -> Iterable[Dict[str, Any]]:
+        if not text:
+            return
+        positions = self._anchor_positions(text) if self._prefilters else {}
+        stats = self.stats
+        for idx, cr in enumerate(self.rules):
+            if cr.anchors is None:
+                matches = cr.rx.finditer(text)
+            elif idx not in positions:
+                continue
+            elif cr.offset is None:
+                matches = cr.rx.finditer(text)
+            else:
+                matches = self._windowed(cr, text, positions[idx])
+            if stats is None:
+                yield from self._match_rows(cr, text, matches)
+                continue
+            if cr.rule.rule_id in stats.quarantined:
+                continue
+            t0 = time.perf_counter()
+            hits = list(self._match_rows(cr, text, matches))
+            stats.record(cr.rule.rule_id, time.perf_counter() - t0, len(hits), len(text))
+            yield from hits
+
+    @staticmethod
+    def _match_rows(cr: CompiledRule, text: str, matches: Iterable[re.Match]) -> Iterable[Dict[str, Any]]:
+        r = cr.rule
+        for m in matches:
+            s, e = m.start(), m.end()
+            match = m.group(0)
+            if r.min_len and len(match) < r.min_len:
+                continue
+            yield {
+                "rule_id": r.rule_id,
+                "family": r.family,
+                "match": match,
+                "ctx_left": text[max(0, s-CTX):s],
+                "ctx_right": text[e:e+CTX],
+                "source": r.source,
+            }
+
+    def scan_bytes(self, data: bytes) -> Iterable[Dict[str, Any]]:
+        """
+        scan() for a raw body, yielding exactly what scan(data.decode("utf-8", "replace")) would.
+        Rules that only ever match ASCII (CompiledRule.bytes_plan) run on the buffer itself: their
+        matches are ASCII, so byte and char spans coincide and only the match and its CTX windows
+        get decoded. Rules that can't, a \\b landing next to a non-ASCII word char, or a page with
+        fold-hazard chars fall back to the decoded text, which is built at most once.
+        """
+        if not data:
+            return
+        text: Optional[str] = None
+        if data.isascii():
+            # nothing to gain: ASCII decodes to a same-size str with identical offsets
+            text = data.decode("ascii")
+        elif any(cr.bytes_plan is None and cr.anchors is None for cr in self.rules):
+            text = data.decode("utf-8", "replace")  # an unanchored str-only rule reads every page
+        elif any(h in data for h in _FOLD_HAZARD_B):
+            text = data.decode("utf-8", "replace")
+        if text is not None:
+            yield from self.scan(text)
+            return
+        positions = self._anchor_positions(data) if self._prefilters else {}
+        stats = self.stats
+        for idx, cr in enumerate(self.rules):
+            if cr.anchors is not None and idx not in positions:
+                continue
+            if stats is not None:
+                if cr.rule.rule_id in stats.quarantined:
+                    continue
+                t0 = time.perf_counter()
+            hits = None
+            if cr.bytes_plan is not None:
+                hits = self._bytes_hits(cr, data, positions.get(idx))
+            if hits is None:
+                if text is None:
+                    text = data.decode("utf-8", "replace")
+                hits = self._str_hits(cr, text)
+            if stats is not None:
+                stats.record(cr.rule.rule_id, time.perf_counter() - t0, len(hits), len(data))
+            yield from hits
+
+    def _str_hits(self, cr: CompiledRule, text: str) -> List[Dict[str, Any]]:
+        return list(self._match_rows(cr, text, cr.rx.finditer(text)))
+
+    def _bytes_hits(self, cr: CompiledRule, data: bytes, anchor_pos: Optional[List[int]]) -> Optional[List[Dict[str, Any]]]:
+        """Hits of one bytes-safe rule on the raw buffer; None when a \\b edge needs the str path."""
+        if anchor_pos is None or cr.offset is None:
+            matches = cr.brx.finditer(data)
+        else:
+            matches = self._windowed(cr, data, anchor_pos, cr.brx)
+        lead, trail = cr.bytes_plan
+        r = cr.rule
+        out = []
+        for m in matches:
+            s, e = m.start(), m.end()
+            if lead and s and data[s - 1] > 0x7F and _is_word(_char_before(data, s)):
+                return None
+            if trail and e < len(data) and data[e] > 0x7F and _is_word(_char_after(data, e)):
+                return None
+            match = m.group(0).decode("ascii")
+            if r.min_len and len(match) < r.min_len:
+                continue
+            out.append({
+                "rule_id": r.rule_id,
+                "family": r.family,
+                "match": match,
+                "ctx_left": _ctx_before(data, s),
+                "ctx_right": _ctx_after(data, e),
+                "source": r.source,
+            })
+        return out
+
+    @staticmethod
+    def _windowed(cr: CompiledRule, text: str | bytes, anchor_pos: List[int], rx: Optional[re.Pattern] = None):
+        """Replicate finditer by trying rx.match only at starts that put an anchor at lo..hi."""
+        rx = rx or cr.rx
+        lo, hi = cr.offset
+        n = len(text)
+        starts = sorted({s for p in anchor_pos for s in range(max(0, p - hi), min(n, p - lo) + 1)})
+        pos = 0
+        i = 0
+        while i < len(starts):
+            s = starts[i]
+            if s < pos:
+                i = bisect.bisect_left(starts, pos, i)
+                continue
+            m = rx.match(text, s)
+            i += 1
+            if m is None:
+                continue
+            yield m
+            # anchors are non-empty, so matches are too: resume like finditer at the match end
+            pos = m.end()
+
+
+# --- decoding around a bytes match ---
+# A match is ASCII, so the bytes on either side of it are where the full-page decode starts a
+# new char too. CTX chars (U+FFFD included) take at most 4*CTX bytes, and a window's cut end
+# only disturbs the chars that straddle it, which lie beyond those 4*CTX bytes.
+_CTX_BYTES = 4 * CTX + 4
+
+
+def _ctx_before(data: bytes, s: int) -> str:
+    return data[max(0, s - _CTX_BYTES):s].decode("utf-8", "replace")[-CTX:]
+
+
+def _ctx_after(data: bytes, e: int) -> str:
+    return data[e:e + _CTX_BYTES].decode("utf-8", "replace")[:CTX]
+
+
+def _char_before(data: bytes, s: int) -> str:
+    i = s - 1
+    while i > max(0, s - 4) and 0x80 <= data[i] < 0xC0:  # back over continuation bytes
+        i -= 1
+    return data[i:s].decode("utf-8", "replace")[-1:]
+
+
+def _char_after(data: bytes, e: int) -> str:
+    return data[e:e + 4].decode("utf-8", "replace")[:1]
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
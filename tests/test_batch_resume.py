@@ -0,0 +1,57 @@
+# waypack/tests/test_batch_resume.py
+# An interrupted --domains-file run, resumed, must write exactly what an uninterrupted run writes.
+import os
+
+import pytest
+
+from waypack import cdx_client, cli, fetcher
+from waypack.bench import Archive, Corpus, serve
+
+CORPUS = Corpus(name="resume", domains=4, days=15, urls=6, page_kb=2, images=0, secrets=3, embeds=6)
+
+
+@pytest.fixture(scope="module")
+def archive():
+    arc = Archive(CORPUS)
+    srv = serve(arc)
+    yield arc, f"http://127.0.0.1:{srv.server_port}"
+    srv.shutdown()
+
+
+def _run(archive, workdir, monkeypatch, extra=(), stop_at=0):
+    arc, base = archive
+    monkeypatch.setattr(cdx_client, "CDX_URL", f"{base}/cdx")
+    monkeypatch.setattr(fetcher, "WAYBACK_PREFIX", f"{base}/web")
+    os.makedirs(workdir, exist_ok=True)
+    monkeypatch.chdir(workdir)
+    with open("domains.txt", "w", encoding="utf-8") as fh:
+        fh.write("\n".join(arc.domains) + "\n")
+    argv = ["--domains-file", "domains.txt", "--from", arc.date_from, "--to", arc.date_to, "--rps", "100000",
+            "--no-progress", "--state", "state.json", "--state-every", "0", *extra]
+    if stop_at:
+        process, done = cli._process_record, []
+
+        def interrupted(rec, ctx):
+            if len(done) == stop_at:
+                raise KeyboardInterrupt
+            done.append(rec)
+            return process(rec, ctx)
+        monkeypatch.setattr(cli, "_process_record", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            cli.main(argv)
+        monkeypatch.setattr(cli, "_process_record", process)
+        argv.append("--resume")
+    assert cli.main(argv) == 0
+    return {fn: open(fn, "rb").read() for fn in sorted(os.listdir(".")) if fn.endswith((".csv", ".jsonl"))}
+
+
+@pytest.mark.parametrize("extra", [(), ("--stream", "--workers", "3")])
+@pytest.mark.parametrize("stop_at", [6, 17, 31])
+def test_resumed_batch_run_matches_uninterrupted(archive, tmp_path, monkeypatch, extra, stop_at):
+    clean = _run(archive, tmp_path / "clean", monkeypatch, extra)
+    resumed = _run(archive, tmp_path / "resumed", monkeypatch, extra, stop_at=stop_at)
+    assert set(clean) == {"findings.csv", "findings.jsonl", "images_exif.jsonl", "embedded_links.csv",
+                          "embedded_links.jsonl"}
+    assert clean["findings.csv"].count(b"\n") > 10
+    for fn in clean:
+        assert resumed[fn] == clean[fn], fn
@@ -0,0 +1,48 @@
+# waypack/tests/test_bench.py
+# Corpus JPEGs must decode without the harness importing Pillow; runs without --metrics-json still measure.
+import io
+import os
+
+import pytest
+
+from waypack import exif_reader
+from waypack.bench import Archive, Corpus, _jpeg, run_once, serve
+from waypack.exif_reader import exif_extent, read_jpeg_exif_to_text
+
+
+@pytest.mark.parametrize("key", ["1:a", "1:b", "7:img/x-3.jpg"])
+def test_corpus_jpeg_decodes_and_carries_exif(key, monkeypatch):
+    data = _jpeg(key, 48 * 1024)
+    assert len(data) == 48 * 1024
+    got = read_jpeg_exif_to_text(data)
+    assert set(got["tags"]) == {"Make", "Model", "Software"} and got["gps"]
+    assert data[exif_extent(data):exif_extent(data) + 2] == b"\xff\xfe"  # COM padding follows the APP1
+    Image = pytest.importorskip("PIL.Image")
+    im = Image.open(io.BytesIO(data))
+    im.load()
+    assert (im.size, im.mode) == ((128, 96), "L")
+    with monkeypatch.context() as m:
+        def odd(_):
+            raise exif_reader._Odd("forced")
+        m.setattr(exif_reader, "_parse_exif", odd)
+        ref = read_jpeg_exif_to_text(data)
+    assert (ref["tags"], ref["gps"]) == (got["tags"], got["gps"])
+
+
+def test_run_without_metrics_json(tmp_path):
+    corpus = Corpus(name="t", days=3, urls=4, page_kb=2, images=1, image_kb=8, secrets=2, embeds=2)
+    arc = Archive(corpus)
+    srv = serve(arc)
+    target = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        base = f"http://127.0.0.1:{srv.server_port}"
+        timed = run_once(arc, base, str(tmp_path / "m"), [], target, {"--metrics-json"})
+        wall = run_once(arc, base, str(tmp_path / "w"), [], target, set())
+    finally:
+        srv.shutdown()
+    assert not os.path.exists(tmp_path / "w" / "metrics.json")
+    assert (wall["timing"], wall["stages"]) == ("wall", {})
+    assert timed["timing"] == "metrics" and timed["stages"]
+    assert wall["pages"] == timed["pages"] == corpus.days * corpus.captures_per_day
+    assert wall["wall_pages_per_s"] > 0 and wall["mb_per_s"] > 0
+    assert wall["outputs"] == timed["outputs"] and wall["outputs"]["findings.csv"] > 0
@@ -0,0 +1,120 @@
+# waypack/tests/test_cdx_client.py
+# Indexed listings: same rows/order as the API, streamed while gaps are listed, resumable by position.
+import pytest
+
+from waypack.cdx_client import CDXClient
+from waypack.cdx_index import CDXIndex
+
+
+def _archive(days=40, urls=5):
+    rows = []
+    for d in range(days):
+        day = f"202001{d + 1:02d}" if d < 31 else f"202002{d - 30:02d}"
+        for u in range(urls):
+            if (d + u) % 3:
+                rows.append({"urlkey": f"com,example)/p{u}", "timestamp": f"{day}{u:02d}0000",
+                             "original": f"http://example.com/p{u}", "statuscode": "200",
+                             "mimetype": "text/html", "digest": f"D{d}-{u}", "length": "100"})
+    return rows
+
+
+class FakeAPI:
+    """Stands in for CDXClient._query_api: rows for [a, b] in CDX server order, counting what it handed out."""
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+        self.served = 0
+
+    def __call__(self, domain, a, b, statuscode, mimetype, limit, retries, timeout, page_size, resume_key, skip,
+                 with_urlkey=False):
+        self.calls.append((a, b))
+        picked = sorted((r for r in self.rows if a <= r["timestamp"][:8] <= b),
+                        key=lambda r: (r["urlkey"], r["timestamp"], r["original"]))
+        for r in picked:
+            self.served += 1
+            out = {k: v for k, v in r.items() if with_urlkey or k != "urlkey"}
+            yield {**out, "page_key": "", "page_index": 0}
+
+
+def _client(tmp_path, api, shard=""):
+    cl = CDXClient(rps=1000, index=CDXIndex(str(tmp_path / "cdx.sqlite")), shard=shard)
+    cl._query_api = api
+    return cl
+
+
+def _list(cl, lo="2020-01-01", hi="2020-02-09", **kw):
+    return list(cl.query_daily_sample("example.com", lo, hi, **kw))
+
+
+def _ids(recs):
+    return [(r["timestamp"], r["original"]) for r in recs]
+
+
+def _expected(rows, by_time=False, lo="20200101", hi="20200209"):
+    picked = [r for r in rows if lo <= r["timestamp"][:8] <= hi]
+    key = (lambda r: (r["timestamp"], r["original"])) if by_time else (lambda r: (r["urlkey"], r["timestamp"]))
+    return _ids(sorted(picked, key=key))
+
+
+@pytest.mark.parametrize("shard", ["", "month"])
+def test_cold_warm_and_partial_index_match_api_order(tmp_path, shard):
+    rows = _archive()
+    api = FakeAPI(rows)
+    cl = _client(tmp_path, api, shard)
+    # a middle slice first, so the full listing is covered / gap / covered / gap
+    assert _ids(_list(cl, "2020-01-10", "2020-01-20")) == _expected(rows, bool(shard), "20200110", "20200120")
+    assert _ids(_list(cl)) == _expected(rows, bool(shard))
+    calls = len(api.calls)
+    assert _ids(_list(cl)) == _expected(rows, bool(shard))
+    assert len(api.calls) == calls  # fully covered: no API traffic
+
+
+def test_cold_index_streams_before_the_gap_is_listed(tmp_path):
+    api = FakeAPI(_archive())
+    cl = _client(tmp_path, api)
+    it = iter(cl.query_daily_sample("example.com", "2020-01-01", "2020-02-09"))
+    next(it)
+    assert api.served == 1
+    it.close()
+    # abandoned listing: nothing is marked covered, the next run lists the range again
+    assert cl.index.gaps(CDXIndex.query_key("example.com", "200", "text/html", "timestamp:8"),
+                         "20200101", "20200209") == [("20200101", "20200209")]
+
+
+def test_limit_stops_the_listing(tmp_path):
+    api = FakeAPI(_archive())
+    cl = _client(tmp_path, api)
+    assert len(_list(cl, limit=7)) == 7
+    assert api.served == 7
+
+
+@pytest.mark.parametrize("shard", ["", "month"])
+def test_resume_by_position(tmp_path, shard):
+    rows = _archive()
+    cl = _client(tmp_path, FakeAPI(rows), shard)
+    full = _list(cl)
+    pos = full[33]
+    assert pos["page_key"].startswith("index:")
+    rest = _list(cl, resume_key=pos["page_key"], skip=pos["page_index"] + 1)
+    assert _ids(rest) == _ids(full[34:])
+    assert _ids(_list(cl, resume_key=pos["page_key"], skip=0)) == _ids(full[33:])
+
+
+def test_resume_of_open_gap_with_late_rows(tmp_path):
+    rows = _archive()
+    api = FakeAPI(rows)
+    cl = _client(tmp_path, api)
+    # interrupted cold run: nothing covered yet, position somewhere in the middle
+    it = iter(cl.query_daily_sample("example.com", "2020-01-01", "2020-02-09"))
+    done = [next(it) for _ in range(40)]
+    it.close()
+    pos = done[-1]
+    # captures ingested meanwhile, before and after the saved position
+    early = {"urlkey": "com,example)/a", "timestamp": "20200105120000", "original": "http://example.com/a",
+             "statuscode": "200", "mimetype": "text/html", "digest": "X", "length": "1"}
+    late = dict(early, urlkey="com,example)/z", original="http://example.com/z")
+    api.rows = rows + [early, late]
+    rest = _list(cl, resume_key=pos["page_key"], skip=pos["page_index"] + 1)
+    got = _ids(done) + _ids(rest)
+    assert len(got) == len(set(got))  # nothing repeated
+    assert got == [i for i in _expected(api.rows) if i != (early["timestamp"], early["original"])]
@@ -0,0 +1,154 @@
+# waypack/tests/test_exif_reader.py
+# The APP1 walker must decode what Pillow decodes, and hand anything it can't parse to Pillow.
+import io
+import struct
+
+import pytest
+
+from waypack import exif_reader
+from waypack.exif_reader import exif_extent, read_jpeg_exif_to_text
+
+ascii_ = lambda bo, s: (2, len(s) + 1, s.encode() + b"\0")
+short = lambda bo, v: (3, 1, struct.pack(bo + "H", v))
+rational = lambda bo, *v: (5, len(v), b"".join(struct.pack(bo + "II", n, d) for n, d in v))
+
+
+def _ifd(bo, entries, at):
+    """IFD at offset `at`; values over 4 bytes follow it."""
+    data_at = at + 2 + 12 * len(entries) + 4
+    head, data = struct.pack(bo + "H", len(entries)), b""
+    for tag, (typ, count, payload) in entries:
+        head += struct.pack(bo + "HHI", tag, typ, count)
+        if len(payload) <= 4:
+            head += payload.ljust(4, b"\0")
+        else:
+            head += struct.pack(bo + "I", data_at + len(data))
+            data += payload + (b"\0" if len(payload) % 2 else b"")
+    return head + struct.pack(bo + "I", 0) + data
+
+
+def _tiff(bo, ifd0, exif=(), gps=()):
+    ptrs = ([(0x8769, (4, 1, b""))] if exif else []) + ([(0x8825, (4, 1, b""))] if gps else [])
+    exif_at = 8 + len(_ifd(bo, list(ifd0) + ptrs, 8))
+    gps_at = exif_at + (len(_ifd(bo, exif, exif_at)) if exif else 0)
+    ptrs = ([(0x8769, (4, 1, struct.pack(bo + "I", exif_at)))] if exif else []) + \
+           ([(0x8825, (4, 1, struct.pack(bo + "I", gps_at)))] if gps else [])
+    out = (b"II*\0" if bo == "<" else b"MM\0*") + struct.pack(bo + "I", 8) + _ifd(bo, list(ifd0) + ptrs, 8)
+    if exif:
+        out += _ifd(bo, exif, exif_at)
+    if gps:
+        out += _ifd(bo, gps, gps_at)
+    return out
+
+
+def _app1(payload: bytes) -> bytes:
+    return b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload
+
+
+def _base_jpeg() -> bytes:
+    Image = pytest.importorskip("PIL.Image")
+    out = io.BytesIO()
+    Image.new("RGB", (16, 8), (200, 30, 30)).save(out, "JPEG")
+    return out.getvalue()
+
+
+def _jpeg(tiff: bytes, base: bytes) -> bytes:
+    # Exif APP1 right after the JFIF APP0, like cameras and editors write it
+    at = 4 + struct.unpack(">H", base[4:6])[0]
+    return base[:at] + _app1(b"Exif\0\0" + tiff) + base[at:]
+
+
+def _sample(bo):
+    ifd0 = [(0x010F, ascii_(bo, "Canon")), (0x0110, ascii_(bo, "EOS 5D")), (0x0112, short(bo, 6)),
+            (0x011A, rational(bo, (72, 1))), (0x011B, rational(bo, (300, 2))), (0x0131, ascii_(bo, "GIMP 2.10")),
+            (0x8298, ascii_(bo, "(c) someone"))]
+    exif = [(0x9003, ascii_(bo, "2020:01:02 03:04:05")), (0xA420, ascii_(bo, "abc123"))]
+    gps = [(1, ascii_(bo, "S")), (2, rational(bo, (33, 1), (51, 1), (3522, 100))),
+           (3, ascii_(bo, "E")), (4, rational(bo, (151, 1), (12, 1), (3012, 100)))]
+    return _tiff(bo, ifd0, exif, gps)
+
+
+def _via_pillow(data, monkeypatch):
+    with monkeypatch.context() as m:
+        def odd(_):
+            raise exif_reader._Odd("forced")
+        m.setattr(exif_reader, "_parse_exif", odd)
+        return read_jpeg_exif_to_text(data)
+
+
+@pytest.mark.parametrize("bo", ["<", ">"])
+def test_parsed_values_match_pillow(bo, monkeypatch):
+    data = _jpeg(_sample(bo), _base_jpeg())
+    got = read_jpeg_exif_to_text(data)
+    assert got["tags"] == {"Make": "Canon", "Model": "EOS 5D", "Orientation": 6, "XResolution": 72.0,
+                           "YResolution": 150.0, "Software": "GIMP 2.10", "Copyright": "(c) someone",
+                           "DateTimeOriginal": "2020:01:02 03:04:05", "ImageUniqueID": "abc123"}
+    assert list(got["tags"])[:3] == ["Make", "Model", "Orientation"]  # file order
+    assert got["gps"] == pytest.approx({"lat": -(33 + 51 / 60 + 35.22 / 3600), "lon": 151 + 12 / 60 + 30.12 / 3600})
+    ref = _via_pillow(data, monkeypatch)
+    assert got["tags"] == ref["tags"]
+    assert got["gps"] == ref["gps"]
+    assert sorted(got["exif_text"].splitlines()) == sorted(ref["exif_text"].splitlines())
+
+
+@pytest.mark.parametrize("bo", ["<", ">"])
+def test_ifd0_only_and_no_gps(bo, monkeypatch):
+    data = _jpeg(_tiff(bo, [(0x0110, ascii_(bo, "X")), (0x0131, ascii_(bo, "ghp_" + "a" * 36))]), _base_jpeg())
+    got = read_jpeg_exif_to_text(data)
+    assert got == _via_pillow(data, monkeypatch)
+    assert got["gps"] is None
+    assert got["exif_text"] == "Model: X\nSoftware: ghp_" + "a" * 36
+
+
+def test_no_exif(monkeypatch):
+    base = _base_jpeg()
+    assert read_jpeg_exif_to_text(base) is None
+    assert _via_pillow(base, monkeypatch) is None
+    assert base[exif_extent(base):exif_extent(base) + 2] == b"\xff\xda"  # walk stops at SOS
+    assert read_jpeg_exif_to_text(b"GIF89a" + b"\0" * 20) is None
+    assert exif_extent(b"GIF89a") == 2
+
+
+def test_empty_ifd_counts_as_none():
+    assert read_jpeg_exif_to_text(_jpeg(_tiff("<", []), _base_jpeg())) is None
+
+
+def test_extent_covers_app1():
+    data = _jpeg(_sample("<"), _base_jpeg())
+    end = exif_extent(data)
+    assert data[end:end + 2] == b"\xff\xdb"  # the next segment (DQT) starts there
+    assert exif_extent(data[:end - 1]) is None  # prefix too short to tell
+    assert read_jpeg_exif_to_text(data[:end]) == read_jpeg_exif_to_text(data)
+
+
+@pytest.mark.parametrize("cut", [4, 20, 60, 150])
+def test_truncated_app1_falls_back(cut, monkeypatch):
+    data = _jpeg(_sample("<"), _base_jpeg())
+    at = 4 + struct.unpack(">H", data[4:6])[0]
+    broken = data[:at + cut]  # APP1 header claims more than there is
+    with pytest.raises(exif_reader._Odd):
+        exif_reader._parse_exif(broken)
+    assert read_jpeg_exif_to_text(broken) == _via_pillow(broken, monkeypatch)
+
+
+@pytest.mark.parametrize("payload", [
+    b"Exif\0\0" + b"XX*\0" + b"\0" * 20,  # bad TIFF byte order
+    b"Exif\0\0" + b"II*\0" + struct.pack("<I", 4000) + b"\0" * 8,  # IFD0 offset past the end
+    b"Exif\0\0" + b"II*\0" + struct.pack("<IH", 8, 30) + b"\0" * 12,  # more entries than bytes
+    b"Exif\0\0" + _tiff("<", [(0x0110, (2, 40, struct.pack("<I", 9000)))]),  # value offset past the end
+    b"Exif\0\0" + bytes(range(256)) * 2,
+])
+@pytest.mark.filterwarnings("ignore::UserWarning")  # Pillow complains about the same garbage
+def test_garbage_app1_never_raises(payload, monkeypatch):
+    data = _jpeg(b"", _base_jpeg())
+    at = 4 + struct.unpack(">H", data[4:6])[0]
+    data = data[:at] + _app1(payload) + data[at + 10:]  # swap in the garbage segment
+    with pytest.raises((exif_reader._Odd, struct.error)):
+        exif_reader._parse_exif(data)
+    assert read_jpeg_exif_to_text(data) == _via_pillow(data, monkeypatch)
+
+
+def test_broken_markers_fall_back():
+    base = _base_jpeg()
+    assert exif_extent(base[:2] + b"\x00\x00" + base[2:]) is None  # no marker where one is expected
+    assert read_jpeg_exif_to_text(base[:2] + b"\xff\xe1\x00\x01" + base[2:]) is None  # segment length < 2
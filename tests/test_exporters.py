@@ -0,0 +1,120 @@
+# waypack/tests/test_exporters.py
+# Sinks cut back to a checkpoint offset and appended to must read back as one clean output.
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import os
+
+import pytest
+
+from waypack.exporters import EXIF_SCHEMA, ColumnarSink, CsvSink, JsonlSink, read_columnar
+
+COLS = ["date", "url", "match"]
+
+
+def _rows(start, n):
+    return [{"date": f"2020-01-{1 + i % 28:02d}", "url": f"http://example.com/{i}", "match": f"tok_{i}é"}
+            for i in range(start, start + n)]
+
+
+def _exif_rows(start, n):
+    return [{"date": "2020-01-01", "src_type": "og", "image_url": f"http://example.com/{i}.jpg",
+             "image_bytes": 1000 + i, "exif": {"Make": "Canon", "n": i}, "gps": {"lat": i / 7, "lon": None} if i % 3
+             else None, "exif_text": f"Make: Canon\nn: {i}", "image_digest": f"{i:064x}"} for i in range(start, start + n)]
+
+
+def _crash_and_resume(make, first, lost, after):
+    """Write `first`, checkpoint, write `lost` (never checkpointed), then resume at the checkpoint with `after`."""
+    sink = make(None)
+    for r in first:
+        sink.write(r)
+    at = sink.offset()
+    for r in lost:
+        sink.write(r)
+    sink.offset()
+    sink.close()
+    sink = make(at)
+    for r in after:
+        sink.write(r)
+    sink.close()
+
+
+def _decompress(path):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if path.endswith(".gz"):
+        return gzip.decompress(data).decode("utf-8")
+    if path.endswith(".zst"):
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+        return reader.read().decode("utf-8")
+    return data.decode("utf-8")
+
+
+HAS_ZSTD = importlib.util.find_spec("zstandard") is not None
+CODECS = ["", ".gz", pytest.param(".zst", marks=pytest.mark.skipif(not HAS_ZSTD, reason="zstandard not installed"))]
+
+
+@pytest.mark.parametrize("suffix", CODECS)
+def test_jsonl_resume(tmp_path, suffix):
+    path = str(tmp_path / f"out.jsonl{suffix}")
+    _crash_and_resume(lambda at: JsonlSink(path, "finding", at), _rows(0, 700), _rows(700, 50), _rows(750, 30))
+    lines = _decompress(path).splitlines()
+    assert [json.loads(l) for l in lines] == [{"record_type": "finding", **r} for r in _rows(0, 700) + _rows(750, 30)]
+
+
+@pytest.mark.parametrize("suffix", CODECS)
+def test_csv_resume(tmp_path, suffix):
+    path = str(tmp_path / f"out.csv{suffix}")
+    _crash_and_resume(lambda at: CsvSink(path, COLS, at), _rows(0, 600), _rows(600, 10), _rows(610, 5))
+    got = list(csv.reader(io.StringIO(_decompress(path), newline="")))
+    assert got == [COLS] + [[r[c] for c in COLS] for r in _rows(0, 600) + _rows(610, 5)]
+
+
+def _expected_columns(rows):
+    out = {n: [] for n, _t, _f in EXIF_SCHEMA}
+    for r in rows:
+        gps = r.get("gps") or {}
+        out["date"].append(r["date"])
+        out["src_type"].append(r["src_type"])
+        out["image_url"].append(r["image_url"])
+        out["image_bytes"].append(r["image_bytes"])
+        out["exif"].append(json.dumps(r["exif"], ensure_ascii=False))
+        out["gps_lat"].append(gps.get("lat"))
+        out["gps_lon"].append(gps.get("lon"))
+        out["exif_text"].append(r["exif_text"])
+        out["image_digest"].append(r["image_digest"])
+    return out
+
+
+def test_stdlib_columnar_resume(tmp_path):
+    path = str(tmp_path / "exif.columns.gz")
+    make = lambda at: ColumnarSink(path, EXIF_SCHEMA, "stdlib", at, chunk_rows=40)
+    _crash_and_resume(make, _exif_rows(0, 100), _exif_rows(100, 30), _exif_rows(130, 25))
+    got = {n: [] for n, _t, _f in EXIF_SCHEMA}
+    for chunk in read_columnar(path):
+        for n, values in chunk.items():
+            got[n].extend(values)
+    assert got == _expected_columns(_exif_rows(0, 100) + _exif_rows(130, 25))
+
+
+def test_parquet_resume(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "exif.parquet")
+    os.makedirs(path)
+    # files that merely look like ours must survive a resume, and must not stop it
+    for name in ("part-a.parquet", "part-1.parquet", "notes.txt", "part-00001.parquet.bak"):
+        with open(os.path.join(path, name), "w") as fh:
+            fh.write("not ours")
+    make = lambda at: ColumnarSink(path, EXIF_SCHEMA, "parquet", at, chunk_rows=40)
+    _crash_and_resume(make, _exif_rows(0, 100), _exif_rows(100, 90), _exif_rows(190, 45))
+    parts = sorted(n for n in os.listdir(path) if n.startswith("part-0") and n.endswith(".parquet"))
+    assert parts == [f"part-{i:05d}.parquet" for i in range(5)]  # 3 before the checkpoint, 2 after
+    got = {n: [] for n, _t, _f in EXIF_SCHEMA}
+    for name in parts:
+        for n, values in pq.read_table(os.path.join(path, name)).to_pydict().items():
+            got[n].extend(values)
+    assert got == _expected_columns(_exif_rows(0, 100) + _exif_rows(190, 45))
+    assert {"part-a.parquet", "part-1.parquet", "notes.txt", "part-00001.parquet.bak"} <= set(os.listdir(path))
@@ -0,0 +1,193 @@
+# waypack/tests/test_scanner.py
+# RuleSet (anchor prefilter + windowed matching) must report exactly what scan_text reports.
+import random
+import re
+
+import pytest
+
+from waypack import scanner
+from waypack.scanner import CTX, Rule, RuleSet, _FALLBACK_RULES, scan_text
+
+# gitleaks-style rules on top of the built-in ones: inline flags, alternations, lookarounds
+REAL_RULES = _FALLBACK_RULES + [
+    Rule("generic.api_key", "keys", r"(?i)(?:api|secret)[_-]?key\s*[:=]\s*['\"]?([a-z0-9]{16,})", 0),
+    Rule("twilio.sid", "api", r"\bAC[a-f0-9]{32}\b", 0),
+    Rule("sendgrid", "api", r"SG\.[\w-]{22}\.[\w-]{43}", 0),
+    Rule("npm.token", "developer", r"(?<![a-z0-9])npm_[a-z0-9]{36}", re.IGNORECASE),
+    Rule("heroku", "cloud", r"heroku.{0,20}[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}", re.IGNORECASE),
+    Rule("password.assign", "keys", r"\b(?:pass(?:word)?|pwd)\b\s*=\s*\S{6,}", re.IGNORECASE),
+]
+
+EDGE_RULES = [
+    Rule("empty.star", "t", r"x*", 0),  # matches empty everywhere
+    Rule("empty.opt", "t", r"(?:key)?", 0),
+    Rule("alt.noanchor", "t", r"[a-z]{3}\d|\d{2}[A-Z]", 0),  # no literal to anchor on
+    Rule("alt.mixed", "t", r"tok_\w+|\d{4}-\d{4}", re.IGNORECASE),  # one branch anchored, one not
+    Rule("fold.k", "t", r"\bk[a-z]{2}\b", re.IGNORECASE),  # K (Kelvin) folds onto k
+    Rule("fold.s", "t", r"s[kK]_\d+", re.IGNORECASE),  # ſ folds onto s
+    Rule("fold.i", "t", r"id_[0-9]{2,}", re.IGNORECASE),  # İ / ı
+    Rule("wordb", "t", r"\bkey_[a-z]{3}\b", 0),  # \b next to é / 東
+    Rule("wordb.ascii", "t", r"(?a)\bab\w*\b", 0),
+    Rule("min_len", "t", r"zz\w*", 0, min_len=4),
+]
+
+_TEXT_PIECES = [
+    "key", "KEY", "Key_abc", "key_abc", "tok_", "sk_", "SK_", "id_", "ID_", "ab", "zz", "x", "xx",
+    "AKIA", "ASIA", "ghp_", "sk_live_", "eyJ", "G-", "GTM-", "AIza", "npm_", "api_key=", "pass =",
+    "ſ", "K", "İ", "ı", "é", "東", "ß", "_", " ", "\n", "-", ".", "=",
+    "0", "1", "42", "2024", "ABCDEF", "abcdef", "Q", "q", "�",
+]
+
+
+def _text(rng: random.Random, n: int) -> str:
+    out = []
+    for _ in range(n):
+        if rng.random() < 0.2:
+            out.append("".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789abcdef") for _ in range(rng.randrange(8, 40))))
+        else:
+            out.append(rng.choice(_TEXT_PIECES))
+    return "".join(out)
+
+
+_ATOMS = [
+    "key", "tok_", "sk_", "id_", "AKIA", "ab", r"k", "x", "é", "ſ",
+    r"[A-Z0-9]{4,8}", r"\d+", r"\d{2}", r"\w{2,5}", r"[a-z]", r"[a-f0-9]{3,}", ".", r"[^\s]{3}", r"\s*",
+    r"(?:ab|cd)", r"(?:x|\d\d)", r"(?:key|tok)_", r"[_-]?", r"\W", r"(?:s|k)+",
+]
+
+
+def _pattern(rng: random.Random) -> str:
+    def seq():
+        parts = [rng.choice(_ATOMS) for _ in range(rng.randrange(1, 5))]
+        if rng.random() < 0.4:
+            parts.insert(0, r"\b")
+        if rng.random() < 0.4:
+            parts.append(r"\b")
+        return "".join(parts)
+    p = seq() if rng.random() < 0.7 else seq() + "|" + seq()
+    return ("(?i)" + p) if rng.random() < 0.15 else p
+
+
+def _random_rules(rng: random.Random, n: int):
+    return [Rule(f"r{i}", rng.choice("abc"), _pattern(rng), rng.choice([0, re.IGNORECASE]),
+                 min_len=rng.choice([0, 0, 3])) for i in range(n)]
+
+
+def _same(rules, text):
+    assert list(RuleSet(rules).scan(text)) == list(scan_text(text, rules))
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_rules_match_scan_text(seed):
+    rng = random.Random(seed)
+    rules = _random_rules(rng, 12)
+    for _ in range(10):
+        _same(rules, _text(rng, rng.randrange(1, 120)))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_real_and_edge_rules_match_scan_text(seed):
+    rng = random.Random(1000 + seed)
+    rules = REAL_RULES + EDGE_RULES
+    for _ in range(20):
+        _same(rules, _text(rng, rng.randrange(1, 300)))
+
+
+@pytest.mark.parametrize("text", [
+    "ékey_abc", "key_abcé", "東key_abc 東", "Key x", "ſk_12", "İD_123 ıd_45",
+    "AKIA" + "A" * 16, "xAKIA" + "B" * 16 + "é", "sk_live_" + "a" * 20, "", "x", "abab abcd" * 3,
+])
+def test_hazard_cases_match_scan_text(text):
+    _same(REAL_RULES + EDGE_RULES, text)
+
+
+def test_families_filter_matches_scan_text():
+    rules = REAL_RULES
+    text = "ghp_" + "a" * 36 + " G-ABCDEFGH AKIA" + "Z" * 16
+    inc, exc = {"developer", "analytics"}, {"analytics"}
+    assert list(RuleSet(rules, inc, exc).scan(text)) == list(scan_text(text, rules, inc, exc))
+
+
+def test_context_windows():
+    text = "a" * (CTX + 10) + " ghp_" + "b" * 36 + " " + "c" * (CTX + 10)
+    hit, = RuleSet(_FALLBACK_RULES).scan(text)
+    assert hit["ctx_left"] == ("a" * (CTX + 10) + " ")[-CTX:]
+    assert hit["ctx_right"] == (" " + "c" * CTX)[:CTX]
+
+
+def test_falls_back_without_regex_parser(monkeypatch):
+    monkeypatch.setattr(scanner, "_sre_parse", None)
+    rs = RuleSet(REAL_RULES + EDGE_RULES)
+    assert all(cr.anchors is None and cr.bytes_plan is None for cr in rs.rules)
+    rng = random.Random(7)
+    for _ in range(20):
+        text = _text(rng, 150)
+        assert list(rs.scan(text)) == list(scan_text(text, REAL_RULES + EDGE_RULES))
+
+
+def test_falls_back_when_parser_internals_change(monkeypatch):
+    def broken(*a, **kw):
+        raise AttributeError("SubPattern")
+    monkeypatch.setattr(scanner, "_extract_anchors", broken)
+    rs = RuleSet(REAL_RULES)
+    assert all(cr.anchors is None for cr in rs.rules)
+    text = "x AKIA" + "Q" * 16 + " ghp_" + "z" * 36
+    assert list(rs.scan(text)) == list(scan_text(text, REAL_RULES))
+
+
+# --- scan_bytes: raw UTF-8 bodies, decoded only around hits ---
+
+_BAD_UTF8 = [b"\xff", b"\x80", b"\xc3", b"\xe6\x9d", b"\xf0\x9f\x98", b"\xed\xa0\x80", b"\xc0\xaf"]
+
+
+def _body(rng: random.Random, text: str) -> bytes:
+    data = text.encode("utf-8")
+    for _ in range(rng.randrange(0, 4)):
+        i = rng.randrange(len(data) + 1)
+        data = data[:i] + rng.choice(_BAD_UTF8) + data[i:]
+    return data
+
+
+def _same_bytes(rs, data):
+    assert list(rs.scan_bytes(data)) == list(rs.scan(data.decode("utf-8", "replace")))
+
+
+def _bytes_only(rules):
+    # one unanchored str-only rule makes scan_bytes decode every page: drop those to reach the bytes path
+    return [r for r, cr in zip(rules, RuleSet(rules).rules) if cr.bytes_plan is not None or cr.anchors is not None]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_scan_bytes_random_rules_match_scan(seed):
+    rng = random.Random(2000 + seed)
+    rules = _random_rules(rng, 12)
+    for rs in (RuleSet(rules), RuleSet(_bytes_only(rules))):
+        for _ in range(10):
+            _same_bytes(rs, _body(rng, _text(rng, rng.randrange(1, 120))))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_scan_bytes_real_and_edge_rules_match_scan(seed):
+    rng = random.Random(3000 + seed)
+    for rs in (RuleSet(REAL_RULES + EDGE_RULES), RuleSet(_bytes_only(REAL_RULES + EDGE_RULES))):
+        for _ in range(20):
+            _same_bytes(rs, _body(rng, _text(rng, rng.randrange(1, 300))))
+
+
+def test_scan_bytes_takes_the_bytes_path():
+    # only bytes-safe anchored rules + non-ASCII page without fold hazards: nothing is decoded whole
+    rules = [r for r in REAL_RULES if RuleSet([r]).rules[0].bytes_plan is not None]
+    assert rules
+    rs = RuleSet(rules)
+    data = ("東京 ghp_" + "a" * 36 + " é AKIA" + "B" * 16 + " " + "x" * 3 * CTX).encode() + b"\xff tail"
+    _same_bytes(rs, data)
+    assert [h["rule_id"] for h in rs.scan_bytes(data)] == ["github.pat", "aws.access_key"]
+
+
+@pytest.mark.parametrize("data", [
+    "ékey_abc".encode(), "key_abcé".encode(), "東key_abc".encode(), "ſk_12".encode(), "xKey".encode(),
+    b"key_abc\xff", b"\xc3key_abc", b"AKIA" + b"A" * 16 + b"\xe6\x9d", b"", b"plain ascii AKIA" + b"C" * 16,
+])
+def test_scan_bytes_hazard_cases_match_scan(data):
+    _same_bytes(RuleSet(REAL_RULES + EDGE_RULES), data)
+    _same_bytes(RuleSet(_bytes_only(REAL_RULES + EDGE_RULES)), data)
@@ -0,0 +1,135 @@
+# waypack/tests/test_urltools.py
+# eTLD+1 from the bundled Public Suffix List, the host() fast path, and subdomain denylisting.
+import random
+from urllib.parse import urlparse
+
+import pytest
+
+from waypack import urltools
+from waypack.urltools import classify_host, denylisted, etld1, host, load_psl
+
+
+def _clear_caches():
+    urltools._psl.cache_clear()
+    etld1.cache_clear()
+    classify_host.cache_clear()
+
+
+@pytest.fixture
+def fallback_psl(monkeypatch, tmp_path):
+    # bundled list missing: only the built-in second-level ccTLD table is left
+    monkeypatch.setattr(urltools, "PSL_PATH", str(tmp_path / "missing.dat"))
+    _clear_caches()
+    yield
+    monkeypatch.undo()
+    _clear_caches()
+
+
+@pytest.mark.parametrize("hostname,expected", [
+    ("example.com", "example.com"),
+    ("a.b.example.com", "example.com"),
+    ("foo.example.co.uk", "example.co.uk"),
+    ("co.uk", "co.uk"),  # a public suffix itself
+    ("user.github.io", "user.github.io"),  # private-section rule
+    ("a.user.github.io", "user.github.io"),
+    ("github.io", "github.io"),
+    ("a.b.ck", "a.b.ck"),  # *.ck: b.ck is a suffix
+    ("x.a.b.ck", "a.b.ck"),
+    ("b.ck", "b.ck"),
+    ("www.ck", "www.ck"),  # !www.ck: exception to the wildcard
+    ("a.www.ck", "www.ck"),
+    ("a.city.kawasaki.jp", "city.kawasaki.jp"),
+    ("a.b.kawasaki.jp", "a.b.kawasaki.jp"),
+    ("foo.bar.notatld", "bar.notatld"),  # implicit "*" rule
+    ("localhost", "localhost"),
+    ("Sub.Example.COM", "example.com"),
+    ("sub.example.com.", "example.com"),  # trailing dot
+    ("user.github.io.", "user.github.io"),
+    ("192.168.0.1", "192.168.0.1"),
+    ("10.0.0.1.", "10.0.0.1"),
+    ("::1", "::1"),
+    ("2001:db8::1", "2001:db8::1"),
+    ("", None),
+])
+def test_etld1(hostname, expected):
+    assert etld1(hostname) == expected
+
+
+@pytest.mark.parametrize("hostname,expected", [
+    ("foo.example.co.uk", "example.co.uk"),
+    ("a.b.example.com.au", "example.com.au"),
+    ("sub.example.com", "example.com"),
+    ("user.github.io", "github.io"),  # no private section without the list
+    ("a.b.ck", "b.ck"),  # no wildcard either
+    ("192.168.0.1", "192.168.0.1"),
+])
+def test_etld1_fallback_table(fallback_psl, hostname, expected):
+    assert etld1(hostname) == expected
+
+
+def test_load_psl_rules(tmp_path):
+    dat = tmp_path / "psl.dat"
+    dat.write_text("// comment\n\ncom\n*.ck\n!www.ck\nco.uk   trailing words\n公司.cn\n", encoding="utf-8")
+    trie = load_psl(str(dat))
+    assert urltools._EXCEPTION in trie["ck"]["www"]
+    assert urltools._RULE in trie["ck"]["*"]
+    assert urltools._RULE in trie["uk"]["co"]
+    assert urltools._RULE in trie["cn"]["公司"]
+    assert urltools._RULE in trie["cn"]["公司".encode("idna").decode()]  # IDN rule also under its xn-- form
+
+
+_ODD_URLS = [
+    "http://example.com/x", "HTTPS://Example.COM:8443/a?b#c", "http://user:pw@example.com:8080/",
+    "http://user@host@other.com/x", "http://example.com?x=@evil.com", "http://example.com#@evil.com",
+    "http://example.com/p@evil.com", "https://[::1]:443/", "http://[2001:db8::1]/x", "http://[::1/",
+    "http://a\\b.com/x", "http://example.com\\@evil.com/", "http:\\\\example.com\\x", "http://exa mple.com/",
+    "http://host\tname.com/", " http://example.com/", "http://例え.jp/", "http://EXAMPLE.com.:80/",
+    "http://:80/", "http://@/", "http:///x", "//example.com/x", "mailto:a@example.com", "ftp://example.com/",
+    "http://example.com:abc/", "javascript:alert(1)", "", "http://",
+]
+
+
+def _reference(url):
+    try:
+        h = urlparse(url).hostname
+        return h.lower() if h else None
+    except ValueError:
+        return None
+
+
+@pytest.mark.parametrize("url", _ODD_URLS)
+def test_host_matches_urlparse(url):
+    assert host(url) == _reference(url)
+
+
+def test_host_matches_urlparse_random():
+    rng = random.Random(3)
+    alphabet = "aB0.-_:@/?#[]% \t\n\x00é。．ExN\\"
+    prefixes = ["http://", "https://", "HTTP://", "http:/", "//", " http://", "http:\\\\", "ftp://",
+                "http://user:pw@", "https://[::1]:80", "http://a.com:x", ""]
+    for _ in range(20000):
+        url = rng.choice(prefixes) + "".join(rng.choice(alphabet) for _ in range(rng.randrange(20)))
+        assert host(url) == _reference(url), url
+
+
+@pytest.mark.parametrize("hostname,listed", [
+    ("googleapis.com", True),
+    ("fonts.googleapis.com", True),  # parent domain listed
+    ("a.b.googleapis.com", True),
+    ("googleapis.com.", True),
+    ("notgoogleapis.com", False),
+    ("googleapis.com.evil.net", False),
+    ("cdn.jsdelivr.net", True),
+    ("jsdelivr.net", False),  # only the listed subdomain and below
+    ("x.cdn.jsdelivr.net", True),
+    ("", False),
+])
+def test_denylisted(hostname, listed):
+    assert denylisted(hostname, frozenset({"googleapis.com", "cdn.jsdelivr.net"})) is listed
+
+
+def test_classify_host():
+    deny = frozenset({"vimeo.com"})
+    assert classify_host("player.vimeo.com", "example.com", deny) == ("vimeo.com", True, True)
+    assert classify_host("cdn.example.com", "example.com", deny) == ("example.com", False, False)
+    assert classify_host("alice.github.io", "bob.github.io", deny) == ("alice.github.io", False, True)
@@ -1,10 +1,15 @@
 # waypack/urltools.py
+from __future__ import annotations
+import ipaddress, os
+from functools import lru_cache
+from typing import AbstractSet, Dict, Optional, Tuple
 from urllib.parse import urlparse, urljoin
 
-# Minimal eTLD+1 resolver:
-# - Works for most TLDs by defaulting to last 2 labels.
-# - Handles common "second-level" ccTLDs like co.uk, com.au, etc.
-# You can extend PSL_SUFFIX_2L if you hit edge cases.
+# Public Suffix List (https://publicsuffix.org/list/), ICANN + private sections, bundled with
+# the package; refresh by replacing the file. Loaded once into a reversed-label trie.
+PSL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+
+# Used only if the bundled list is missing: common "second-level" ccTLDs like co.uk, com.au, etc.
 _PSL_SUFFIX_2L = {
     ("ac", "uk"), ("co", "uk"), ("gov", "uk"), ("ltd", "uk"), ("plc", "uk"), ("sch", "uk"),
     ("com", "au"), ("net", "au"), ("org", "au"), ("edu", "au"), ("gov", "au"),
@@ -24,26 +29,134 @@ def absolutize(base_url: str, maybe_relative: str) -> str:
     except Exception:
         return maybe_relative
 
+def _plain_netloc(url: str) -> Optional[str]:
+    # netloc of an http(s) URL that urlsplit would take apart the same way (no stripping of
+    # odd chars, no IPv6 brackets, no NFKC netloc checks); None sends the URL to urlparse
+    if url[:7].lower() == "http://":
+        rest = url[7:]
+    elif url[:8].lower() == "https://":
+        rest = url[8:]
+    else:
+        return None
+    end = len(rest)
+    for c in "/?#":
+        i = rest.find(c, 0, end)
+        if i >= 0:
+            end = i
+    netloc = rest[:end]
+    if not netloc.isascii() or "[" in netloc or "]" in netloc or not netloc.isprintable() or " " in netloc:
+        return None
+    if not url[0].isalpha() or "\t" in url or "\r" in url or "\n" in url:
+        return None
+    return netloc
+
 def host(url: str) -> str | None:
+    # fast path for the plain http(s) URLs pages are full of; anything unusual goes to urlparse
+    netloc = _plain_netloc(url)
+    if netloc is not None:
+        h = netloc.rpartition("@")[2].partition(":")[0]
+        return h.lower() or None
     try:
         h = urlparse(url).hostname
         return h.lower() if h else None
     except Exception:
         return None
 
+# trie node: label -> child; these keys mark where a rule ends (labels never contain them)
+_RULE = ""
+_EXCEPTION = "!"
+
+def _insert(trie: Dict[str, dict], rule: str):
+    exception = rule.startswith("!")
+    labels = rule.lstrip("!").split(".")
+    node = trie
+    for label in reversed(labels):
+        node = node.setdefault(label, {})
+    node[_EXCEPTION if exception else _RULE] = {}
+
+def load_psl(path: str = PSL_PATH) -> Dict[str, dict]:
+    """Parse a public_suffix_list.dat into a reversed-label trie (IDN rules also under their xn-- form)."""
+    trie: Dict[str, dict] = {}
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            rule = line.split(None, 1)[0] if line.strip() else ""
+            if not rule or rule.startswith("//"):
+                continue
+            rule = rule.lower()
+            _insert(trie, rule)
+            if not rule.isascii():
+                try:
+                    _insert(trie, ".".join(l if l in ("*", "!") or l.isascii() else l.encode("idna").decode("ascii")
+                                           for l in rule.split(".")))
+                except UnicodeError:
+                    pass
+    return trie
+
+@lru_cache(maxsize=None)
+def _psl() -> Dict[str, dict]:
+    try:
+        return load_psl(PSL_PATH)
+    except OSError:
+        trie: Dict[str, dict] = {}
+        for a, b in _PSL_SUFFIX_2L:
+            _insert(trie, f"{a}.{b}")
+        return trie
+
+def _suffix_labels(labels) -> int:
+    """How many trailing labels of `labels` form the public suffix (PSL algorithm, implicit "*" rule)."""
+    node = _psl()
+    best = 1
+    n = len(labels)
+    for i in range(n):
+        label = labels[n - 1 - i]
+        child = node.get(label)
+        if child is not None and _EXCEPTION in child:
+            return i  # exception rules win: the suffix is the rule minus its leftmost label
+        wild = node.get("*")
+        if wild is not None and _RULE in wild:
+            best = i + 1
+        if child is None:
+            break
+        if _RULE in child:
+            best = i + 1
+        node = child
+    return best
+
+@lru_cache(maxsize=65536)
 def etld1(hostname: str) -> str | None:
     """
-    Best-effort eTLD+1:
-    - If hostname like sub.example.com -> example.com
-    - If hostname like foo.example.co.uk -> example.co.uk
+    eTLD+1 per the Public Suffix List:
+    - sub.example.com -> example.com, foo.example.co.uk -> example.co.uk
+    - user.github.io -> user.github.io, a.b.ck -> a.b.ck (wildcard), www.ck -> www.ck (exception)
+    A host that is itself a public suffix, a single label or an IP address comes back as is.
     """
     if not hostname:
         return None
-    parts = hostname.lower().split(".")
+    hostname = hostname.lower().rstrip(".") or hostname.lower()
+    parts = hostname.split(".")
     if len(parts) < 2:
         return hostname
-    # Check known 2-level public suffixes (co.uk, com.au, etc.)
-    if len(parts) >= 3 and (parts[-2], parts[-1]) in _PSL_SUFFIX_2L:
-        return ".".join(parts[-3:])
-    # Default: last two labels
-    return ".".join(parts[-2:])
+    try:
+        ipaddress.ip_address(hostname)
+        return hostname
+    except ValueError:
+        pass
+    k = _suffix_labels(parts)
+    if k >= len(parts):
+        return hostname
+    return ".".join(parts[-(k + 1):])
+
+def denylisted(hostname: str, denylist: AbstractSet[str]) -> bool:
+    """True if the host or any parent domain of it is listed (googleapis.com covers fonts.googleapis.com)."""
+    h = hostname.rstrip(".")
+    while h:
+        if h in denylist:
+            return True
+        h = h.partition(".")[2]
+    return False
+
+@lru_cache(maxsize=65536)
+def classify_host(hostname: str, target_etld1: str, denylist: frozenset) -> Tuple[Optional[str], bool, bool]:
+    """(eTLD+1, denylisted, third_party) of an embed host relative to the crawled site; memoized."""
+    t = etld1(hostname)
+    return t, denylisted(hostname, denylist), t != target_etld1
@@ -0,0 +1,87 @@
+# waypack/workers.py
+from __future__ import annotations
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def ordered_map(executor: Executor, fn: Callable[[T], R], items: Iterable[T], max_inflight: int) -> Iterator[R]:
+    """
+    Like executor.map, but pulls `items` lazily and keeps at most `max_inflight`
+    tasks submitted. Results are yielded in input order, so output stays deterministic.
+    """
+    max_inflight = max(1, max_inflight)
+    pending = deque()
+    it = iter(items)
+    try:
+        for item in it:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_inflight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # generator closed early (error / Ctrl-C): don't leave queued work behind
+        for f in pending:
+            f.cancel()
+
+
+_DONE = object()
+
+
+def prefetch(items: Iterable[T], maxsize: int = 64) -> Iterator[T]:
+    """
+    Drain `items` on a background thread into a bounded queue, so a slow producer
+    (CDX pagination) overlaps with the consumer (fetching) without buffering everything.
+    """
+    q: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(entry) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(entry, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as e:  # re-raised in the consumer
+            put((_DONE, e))
+
+    t = threading.Thread(target=produce, name="waypack-prefetch", daemon=True)
+    t.start()
+    try:
+        while True:
+            item, err = q.get()
+            if item is _DONE:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def round_robin(iterables: Iterable[Iterable[T]]) -> Iterator[T]:
+    """Interleave iterators one item at a time (fair across sources); exhausted ones drop out."""
+    its = deque(iter(x) for x in iterables)
+    while its:
+        it = its.popleft()
+        try:
+            item = next(it)
+        except StopIteration:
+            continue
+        its.append(it)
+        yield item